@@ -0,0 +1,126 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+"""
+Compares storing edit snipes with full before content against storing it as a diff
+against the after content (`editsnipe.encode_delta`), on a synthetic edit corpus.
+Reports database size, the cost of encoding per edit and of decoding per `esnipe`.
+
+Usage: python -m benchmarks.edit_deltas [num_edits]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from snipes import editsnipe
+from snipes.editsnipe import MIGRATIONS, decode_delta, encode_delta
+
+WORDS = "the a to and of it is that you this for on with was but just so like have not what are be can if".split() + [
+    "message", "discord", "server", "channel", "tomorrow", "actually", "probably", "definitely", "screenshot", "update",
+]
+
+
+def sentence() -> str:
+    words = [random.choice(WORDS) for _ in range(random.randint(5, 20))]
+    return " ".join(words).capitalize() + random.choice([".", "!", "?"])
+
+
+def message() -> str:
+    # Most messages are short, a few are long
+    length = random.choice([1, 1, 1, 2, 3, 5, 10, 25])
+    return " ".join(sentence() for _ in range(length))[:2000]
+
+
+def edit(before: str) -> str:
+    kind = random.random()
+    if kind < 0.5: # Typo fix
+        i = random.randrange(len(before))
+        return before[:i] + random.choice("abcdefghijklmnopqrstuvwxyz") + before[i + 1:]
+    if kind < 0.75: # Word swapped
+        words = before.split(" ")
+        words[random.randrange(len(words))] = random.choice(WORDS)
+        return " ".join(words)
+    if kind < 0.9: # Appended to
+        return (before + " " + sentence())[:2000]
+    return message() # Rewritten
+
+
+def corpus(num_edits: int) -> list[tuple[str, str]]:
+    edits = []
+    for _ in range(num_edits):
+        before = message()
+        edits.append((before, edit(before)))
+    return edits
+
+
+def store(path: str, rows: list[tuple[str | None, str, str | None]]) -> int:
+    db = sqlite3.connect(path, isolation_level=None)
+    for migration in MIGRATIONS:
+        db.executescript(migration.format(table="editsnipe"))
+
+    db.execute("BEGIN")
+    db.executemany(
+        "INSERT INTO editsnipe (edited_at, sender_id, before_content, after_content, guild_id, channel_id, before_delta) VALUES (0, 1, ?, ?, 1, 1, ?)",
+        rows,
+    )
+    db.execute("COMMIT")
+    db.execute("VACUUM")
+    db.close()
+    return os.path.getsize(path)
+
+
+def main(num_edits: int) -> None:
+    edits = corpus(num_edits)
+    long_edits = sum(len(before) >= editsnipe.DELTA_MIN_LENGTH for before, _ in edits)
+    print(f"{num_edits:,} edits, {long_edits:,} of at least {editsnipe.DELTA_MIN_LENGTH} characters\n")
+
+    plain_size = store("plain.sqlite", [(before, after, None) for before, after in edits])
+
+    start = time.perf_counter()
+    encoded = [(encode_delta(before, after), after) for before, after in edits]
+    encode_us = (time.perf_counter() - start) / num_edits * 1_000_000
+
+    delta_size = store("delta.sqlite", [(before, after, delta) for (before, delta), after in encoded])
+
+    deltas = [(after, delta) for (_, delta), after in encoded if delta is not None]
+    start = time.perf_counter()
+    for after, delta in deltas:
+        decode_delta(after, delta)
+    decode_us = (time.perf_counter() - start) / max(len(deltas), 1) * 1_000_000
+
+    print(f"  full before content:  {plain_size / 1e6:8.2f}MB")
+    print(f"  diff when smaller:    {delta_size / 1e6:8.2f}MB ({len(deltas):,} edits stored as diffs, {1 - delta_size / plain_size:.0%} smaller)")
+    print(f"  encode per edit:      {encode_us:8.1f}us ({1_000_000 / encode_us:,.0f} edits/sec)")
+    print(f"  decode per esnipe:    {decode_us:8.1f}us")
+
+
+if __name__ == "__main__":
+    num_edits = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        main(num_edits)
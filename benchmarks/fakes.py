@@ -0,0 +1,72 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Builds real discord.py models from gateway-shaped payloads without connecting to Discord.
+"""
+
+import discord
+from discord.state import ConnectionState
+
+# Ids need to look like snowflakes for mention syntax to match.
+BASE_ID = 1_000_000_000_000_000_000
+
+
+def make_state() -> ConnectionState:
+    return ConnectionState(dispatch=lambda *_, **__: None, handlers={}, hooks={}, http=None, intents=discord.Intents.all())  # type: ignore
+
+
+def user_data(user_id: int) -> dict:
+    return {"id": user_id, "username": f"user{user_id % 100_000}", "discriminator": "0001", "avatar": None}
+
+
+def make_guild(state: ConnectionState, guild_id: int, channel_ids: list[int]) -> discord.Guild:
+    everyone = {"id": guild_id, "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False}
+    guild = discord.Guild(data={"id": guild_id, "name": f"guild{guild_id}", "channels": [], "roles": [everyone], "members": [], "member_count": 0}, state=state)  # type: ignore
+    state._add_guild(guild)
+
+    for channel_id in channel_ids:
+        data = {"id": channel_id, "type": 0, "name": f"channel{channel_id % 100_000}", "position": 0, "guild_id": guild_id, "permission_overwrites": []}
+        guild._add_channel(discord.TextChannel(state=state, guild=guild, data=data))  # type: ignore
+
+    return guild
+
+
+def make_message(state: ConnectionState, channel: discord.TextChannel, *, message_id: int, author_id: int, content: str, mentions: list[int] | None = None) -> discord.Message:
+    data = {
+        "id": message_id,
+        "channel_id": channel.id,
+        "guild_id": channel.guild.id,
+        "author": user_data(author_id),
+        "content": content,
+        "timestamp": discord.utils.snowflake_time(message_id).isoformat(),
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [user_data(user_id) for user_id in mentions or []],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+    return discord.Message(state=state, channel=channel, data=data)  # type: ignore
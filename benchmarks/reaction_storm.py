@@ -0,0 +1,126 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+"""
+Replays a reaction removal storm, a bot clearing reactions user by user from many messages
+with some users toggling the same reaction, through `ReactionSnipeCog.on_raw_reaction_remove`.
+Compares recording each removal as it happens against the storm window in `reactionsnipe`,
+with the opt-out cache loaded and without it, as when the OptOutCog isn't loaded.
+Each mode runs in its own process and temporary directory.
+
+Usage: python -m benchmarks.reaction_storm [num_messages] [users_per_message]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import discord
+
+from .fakes import BASE_ID
+
+EMOJIS_PER_MESSAGE = 10
+# Share of removals repeated, as when users toggle a reaction during the storm.
+REPEAT_CHANCE = 0.1
+CONCURRENCY = 16
+
+
+def make_events(num_messages: int, users_per_message: int) -> list[discord.RawReactionActionEvent]:
+    random.seed(0)
+    emojis = [discord.PartialEmoji(name=f"emoji{i}", id=BASE_ID + i) for i in range(EMOJIS_PER_MESSAGE // 2)]
+    emojis += [discord.PartialEmoji(name=chr(0x1F600 + i)) for i in range(EMOJIS_PER_MESSAGE - len(emojis))]
+
+    events = []
+    for m in range(num_messages):
+        data = {"message_id": BASE_ID + 10_000 + m, "channel_id": BASE_ID + 1 + m % 5, "guild_id": BASE_ID}
+        for u in range(users_per_message):
+            for emoji in emojis:
+                event = discord.RawReactionActionEvent({**data, "user_id": BASE_ID + 100_000 + u}, emoji, "REACTION_REMOVE")  # type: ignore
+                events.append(event)
+                if random.random() < REPEAT_CHANCE:
+                    events.append(event)
+    return events
+
+
+async def run(window_ms: int, cached: bool, events: list[discord.RawReactionActionEvent]) -> tuple[float, int, int]:
+    from snipes import reactionsnipe, snipescommon
+    from snipes.optout import BOTUSER_SETUP_SQL, optout_cache
+    from snipes.snipequeue import write_queue
+
+    reactionsnipe.STORM_WINDOW_MS = window_ms
+    await snipescommon.open_pool()
+    await reactionsnipe.snipe_table.load()
+    async with snipescommon.acquire() as db:
+        await db.execute(BOTUSER_SETUP_SQL)
+    if cached:
+        await optout_cache.load()
+
+    cog = reactionsnipe.ReactionSnipeCog(None)  # type: ignore # the listeners never touch the bot
+
+    start = time.perf_counter()
+    for i in range(0, len(events), CONCURRENCY):
+        await asyncio.gather(*(cog.on_raw_reaction_remove(event) for event in events[i:i + CONCURRENCY]))
+    # Don't wait out the window, only the work is measured.
+    if cog._record_task is not None:
+        cog._record_task.cancel()
+    await cog._record_pending()
+    await write_queue.flush()
+    elapsed = time.perf_counter() - start
+
+    await snipescommon.close_pool()
+    return len(events) / elapsed, write_queue.rows_written, len(reactionsnipe.snipe_store)
+
+
+def measure(window_ms: int, cached: bool, num_messages: int, users_per_message: int) -> tuple[float, int, int]:
+    events = make_events(num_messages, users_per_message)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        return asyncio.run(run(window_ms, cached, events))
+
+
+def main(num_messages: int, users_per_message: int) -> None:
+    num_events = len(make_events(num_messages, users_per_message))
+    print(f"{num_events:,} removal events on {num_messages} messages\n")
+
+    for cached in (True, False):
+        baseline = None
+        for window_ms in (0, 500):
+            # A fresh process per run, so no module state carries over between modes.
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                rate, rows, held = executor.submit(measure, window_ms, cached, num_messages, users_per_message).result()
+
+            baseline = baseline or rate
+            label = ("each removal" if window_ms == 0 else f"{window_ms}ms window") + (", cached" if cached else ", uncached")
+            print(f"{label:<24} {rate:10.1f} events/sec ({rate / baseline:.1f}x)  rows written {rows:,}  held in memory {held:,}")
+
+
+if __name__ == "__main__":
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    users_per_message = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    main(num_messages, users_per_message)
@@ -0,0 +1,108 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+"""
+Compares expiring deletesnipes with a DELETE on one shared table, as before windows
+were used, against dropping the oldest window table. Reports how long the write
+lock is held and what happens to the database file.
+
+Usage: python -m benchmarks.snipe_buckets [rows_per_window] [windows]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from snipes.messagesnipe import MIGRATIONS
+
+CHANNELS = 5_000
+USERS = 50_000
+
+
+def create(db: sqlite3.Connection, table: str, *, time_index: bool) -> None:
+    for migration in MIGRATIONS:
+        db.executescript(migration.format(table=table))
+    if time_index:
+        db.execute(f"CREATE INDEX {table}_deleted_idx ON {table} (deleted_at)")
+
+
+def fill(db: sqlite3.Connection, table: str, window: int, rows_per_window: int) -> None:
+    rows = (
+        (window * rows_per_window + i, window * 300 + i * 300 // rows_per_window, random.randrange(USERS), "some deleted message content", 1, random.randrange(CHANNELS), None, None)
+        for i in range(rows_per_window)
+    )
+    db.execute("BEGIN")
+    db.executemany(f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    db.execute("COMMIT")
+
+
+def file_stats(db: sqlite3.Connection) -> str:
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    pages = db.execute("PRAGMA page_count").fetchone()[0]
+    free = db.execute("PRAGMA freelist_count").fetchone()[0]
+    return f"file {pages * page_size / 1e6:7.1f}MB, {free * page_size / 1e6:7.1f}MB free pages"
+
+
+def timed_write(db: sqlite3.Connection, sql: str, *params) -> float:
+    start = time.perf_counter()
+    db.execute("BEGIN IMMEDIATE") # The write lock is held from here until COMMIT
+    db.execute(sql, params)
+    db.execute("COMMIT")
+    return (time.perf_counter() - start) * 1000
+
+
+def main(rows_per_window: int, windows: int) -> None:
+    shared = sqlite3.connect("shared.sqlite", isolation_level=None)
+    create(shared, "deletesnipe", time_index=True)
+    for window in range(windows):
+        fill(shared, "deletesnipe", window, rows_per_window)
+
+    bucketed = sqlite3.connect("bucketed.sqlite", isolation_level=None)
+    for window in range(windows):
+        create(bucketed, f"deletesnipe_{window}", time_index=False)
+        fill(bucketed, f"deletesnipe_{window}", window, rows_per_window)
+
+    print(f"{windows} windows of {rows_per_window:,} rows, expiring the oldest window\n")
+    print(f"  shared table before:   {file_stats(shared)}")
+    print(f"  window tables before:  {file_stats(bucketed)}\n")
+
+    deleted = timed_write(shared, "DELETE FROM deletesnipe WHERE deleted_at < ?", 300)
+    dropped = timed_write(bucketed, "DROP TABLE deletesnipe_0")
+
+    print(f"  DELETE ... WHERE deleted_at < ?   lock held {deleted:9.2f}ms  {file_stats(shared)}")
+    print(f"  DROP TABLE <oldest window>        lock held {dropped:9.2f}ms  {file_stats(bucketed)}")
+
+    shared.close()
+    bucketed.close()
+
+
+if __name__ == "__main__":
+    rows_per_window = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    windows = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        main(rows_per_window, windows)
@@ -0,0 +1,106 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Shows query plans and latencies for the deletesnipe queries before and after
+the index migrations, on one window table filled with synthetic rows.
+Expiry drops whole window tables, see `snipe_buckets` for its cost.
+
+Usage: python -m benchmarks.snipe_indexes [num_rows]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from snipes.messagesnipe import MIGRATIONS as MIGRATION_TEMPLATES
+
+CHANNELS = 5_000
+USERS = 50_000
+REPEAT = 20
+
+MIGRATIONS = [migration.format(table="deletesnipe") for migration in MIGRATION_TEMPLATES]
+
+QUERIES = {
+    "snipe (latest in channel)": ("SELECT * FROM deletesnipe WHERE channel_id = ? ORDER BY deleted_at DESC, id DESC LIMIT 1 OFFSET 0", lambda: (random.randrange(CHANNELS),)),
+    "snipe 5 (offset in channel)": ("SELECT * FROM deletesnipe WHERE channel_id = ? ORDER BY deleted_at DESC, id DESC LIMIT 1 OFFSET 5", lambda: (random.randrange(CHANNELS),)),
+    "clear user": ("DELETE FROM deletesnipe WHERE sender_id = ?", lambda: (random.randrange(USERS),)),
+}
+
+
+def fill(db: sqlite3.Connection, num_rows: int) -> None:
+    db.executescript(MIGRATIONS[0])
+    rows = (
+        (i, i // 10, random.randrange(USERS), "some deleted message content", 1, random.randrange(CHANNELS), None)
+        for i in range(1, num_rows + 1)
+    )
+    db.execute("BEGIN")
+    db.executemany("INSERT INTO deletesnipe VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    db.execute("COMMIT")
+
+
+def measure(db: sqlite3.Connection) -> None:
+    for name, (sql, params) in QUERIES.items():
+        plan = " | ".join(row[3] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}", params()))
+
+        timings = []
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            db.execute("BEGIN")
+            db.execute(sql, params()).fetchall()
+            db.execute("ROLLBACK") # Leave the table the same for the next run
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        print(f"  {name:<28} median {timings[len(timings) // 2]:9.3f}ms  plan: {plan}")
+
+
+def main(num_rows: int) -> None:
+    db = sqlite3.connect("snipes.sqlite", isolation_level=None)
+
+    start = time.perf_counter()
+    fill(db, num_rows)
+    print(f"Inserted {num_rows:,} rows in {time.perf_counter() - start:.1f}s\n")
+
+    print("Schema version 1 (no indexes):")
+    measure(db)
+
+    start = time.perf_counter()
+    for migration in MIGRATIONS[1:]:
+        db.executescript(migration)
+    print(f"\nMigrated to version {len(MIGRATIONS)} in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"Schema version {len(MIGRATIONS)}:")
+    measure(db)
+
+    db.close()
+
+
+if __name__ == "__main__":
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        main(num_rows)
@@ -0,0 +1,171 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+"""
+Replays synthetic gateway events through the listeners of `MessageSnipeCog`, `EditSnipeCog`
+and `ReactionSnipeCog`, without a gateway or a bot, in a temporary directory.
+
+Guilds, their channels and users are picked with a Zipf-like skew, 0 picks them uniformly and
+higher values make a few of each busier. Events are dispatched in batches the way the gateway
+schedules listeners, each as its own task. Reports handler latency per event type, events/sec
+including the writes done when the cogs unload, and the size of the database files after.
+Reaction removals are only buffered by the handler and recorded once the storm window ends.
+
+Usage: python -m benchmarks.snipe_ingest [--events N] [--guilds N] [--channels N] [--users N] [--skew S] ...
+"""
+
+import argparse
+import asyncio
+import glob
+import itertools
+import os
+import random
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+
+import discord
+
+from snipes.editsnipe import EditSnipeCog
+from snipes.messagesnipe import MessageSnipeCog
+from snipes.reactionsnipe import ReactionSnipeCog
+from snipes.snipequeue import write_queue
+
+from .fakes import BASE_ID, make_guild, make_message, make_state
+
+WORDS = ["some", "ordinary", "chat", "message", "text", "lol", "ok", "anyway", "tomorrow", "really"]
+# Share of messages long enough to be compressed when written.
+LONG_CHANCE = 0.05
+# Share of edits to a message edited before, which coalesce into one snipe.
+REEDIT_CHANCE = 0.2
+EMOJIS = [discord.PartialEmoji(name=f"emoji{i}", id=BASE_ID + i) for i in range(5)] + [discord.PartialEmoji(name=chr(0x1F600 + i)) for i in range(5)]
+
+Event = tuple[str, Callable[..., Awaitable[None]], tuple]
+
+
+def skewed(n: int, skew: float) -> list[float]:
+    """Cumulative weights picking rank r with weight 1 / (r + 1) ** skew."""
+    return list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(n)))
+
+
+def random_content() -> str:
+    length = random.randint(60, 400) if random.random() < LONG_CHANCE else random.randint(1, 12)
+    return " ".join(random.choices(WORDS, k=length))
+
+
+def make_events(args: argparse.Namespace, cogs: tuple[MessageSnipeCog, EditSnipeCog, ReactionSnipeCog]) -> list[Event]:
+    message_cog, edit_cog, reaction_cog = cogs
+    random.seed(args.seed)
+    state = make_state()
+
+    # Guild ids a few milliseconds apart spread over the shards like real ones.
+    guilds = [
+        make_guild(state, BASE_ID + (g << 22), [BASE_ID + (g << 22) + 1 + c for c in range(args.channels)])
+        for g in range(args.guilds)
+    ]
+    guild_weights, channel_weights, user_weights = skewed(args.guilds, args.skew), skewed(args.channels, args.skew), skewed(args.users, args.skew)
+    users = [BASE_ID + 1_000_000 + u for u in range(args.users)]
+    kind_weights = list(itertools.accumulate(args.mix))
+
+    events: list[Event] = []
+    edited: list[discord.Message] = []
+    for i in range(args.events):
+        guild = random.choices(guilds, cum_weights=guild_weights)[0]
+        channel = random.choices(guild.text_channels, cum_weights=channel_weights)[0]
+        author_id = random.choices(users, cum_weights=user_weights)[0]
+        message_id = BASE_ID + 10_000_000 + i
+        kind = random.choices(("delete", "edit", "reaction"), cum_weights=kind_weights)[0]
+
+        if kind == "delete":
+            message = make_message(state, channel, message_id=message_id, author_id=author_id, content=random_content())
+            events.append((kind, message_cog.on_message_delete, (message,)))
+        elif kind == "edit":
+            if edited and random.random() < REEDIT_CHANCE:
+                before = random.choice(edited[-100:])
+            else:
+                before = make_message(state, channel, message_id=message_id, author_id=author_id, content=random_content())
+            after = make_message(state, before.channel, message_id=before.id, author_id=before.author.id, content=random_content())  # type: ignore
+            edited.append(after)
+            events.append((kind, edit_cog.on_message_edit, (before, after)))
+        else:
+            data = {"message_id": message_id, "channel_id": channel.id, "guild_id": guild.id, "user_id": author_id}
+            payload = discord.RawReactionActionEvent(data, random.choice(EMOJIS), "REACTION_REMOVE")  # type: ignore
+            events.append((kind, reaction_cog.on_raw_reaction_remove, (payload,)))
+
+    return events
+
+
+async def timed(kind: str, handler: Callable[..., Awaitable[None]], args: tuple, latencies: dict[str, list[float]]) -> None:
+    start = time.perf_counter()
+    await handler(*args)
+    latencies[kind].append((time.perf_counter() - start) * 1000)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def db_size() -> int:
+    return sum(os.path.getsize(path) for path in glob.glob("snipes*.sqlite*"))
+
+
+async def main(args: argparse.Namespace) -> None:
+    cogs = (MessageSnipeCog(None), EditSnipeCog(None), ReactionSnipeCog(None))  # type: ignore # the listeners never touch the bot
+    for cog in cogs:
+        await cog.cog_load()
+
+    events = make_events(args, cogs)
+    latencies: dict[str, list[float]] = {"delete": [], "edit": [], "reaction": []}
+
+    start = time.perf_counter()
+    for i in range(0, len(events), args.concurrency):
+        await asyncio.gather(*(timed(kind, handler, event_args, latencies) for kind, handler, event_args in events[i:i + args.concurrency]))
+    # Unloading records the pending reaction removals and writes everything queued.
+    for cog in reversed(cogs):
+        await cog.cog_unload()
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(events):,} events over {args.guilds} guilds, {args.channels} channels each and {args.users} users, skew {args.skew}\n")
+    for kind, values in latencies.items():
+        if values:
+            values.sort()
+            print(f"  {kind:<9} {len(values):>8,} events  p50 {percentile(values, 0.5) * 1000:8.1f}us  p99 {percentile(values, 0.99) * 1000:8.1f}us")
+
+    print(f"\n{len(events) / elapsed:,.1f} events/sec, {write_queue.rows_written:,} rows written, database files {db_size() / 1024:,.1f}KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snipe ingestion throughput benchmark.")
+    parser.add_argument("--events", type=int, default=20_000, help="number of events to replay")
+    parser.add_argument("--guilds", type=int, default=50, help="number of guilds")
+    parser.add_argument("--channels", type=int, default=10, help="channels per guild")
+    parser.add_argument("--users", type=int, default=2_000, help="number of users")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf-like skew of guild, channel and user activity, 0 for uniform")
+    parser.add_argument("--mix", type=lambda s: [float(w) for w in s.split(",")], default=[50, 35, 15], help="delete,edit,reaction weights")
+    parser.add_argument("--concurrency", type=int, default=16, help="events dispatched at once")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        asyncio.run(main(args))
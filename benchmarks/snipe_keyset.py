@@ -0,0 +1,101 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+"""
+Compares reading a page of a busy channel's deletesnipes at increasing depths with
+LIMIT/OFFSET against continuing from the last `(time, id)` read, as
+`BucketedTable.iter_newest` does. Many snipes share a second, so ties are common.
+
+Usage: python -m benchmarks.snipe_keyset [num_rows]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from snipes.messagesnipe import MIGRATIONS
+
+PAGE = 50
+DEPTHS = [0, 1_000, 10_000, 100_000]
+REPEAT = 20
+
+
+def fill(db: sqlite3.Connection, num_rows: int) -> None:
+    for migration in MIGRATIONS:
+        db.executescript(migration.format(table="deletesnipe"))
+
+    # A quarter of rows are in the channel being read, about 30 per second.
+    rows = (
+        (i, i // 120, random.randrange(50_000), "some deleted message content", 1, 1 if i % 4 == 0 else random.randrange(2, 500), None, None)
+        for i in range(1, num_rows + 1)
+    )
+    db.execute("BEGIN")
+    db.executemany("INSERT INTO deletesnipe VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    db.execute("COMMIT")
+
+
+def median_ms(func) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main(num_rows: int) -> None:
+    db = sqlite3.connect("snipes.sqlite", isolation_level=None)
+    fill(db, num_rows)
+    print(f"{num_rows:,} rows, {num_rows // 4:,} in the channel read, {PAGE} rows per page\n")
+
+    for depth in DEPTHS:
+        if depth >= num_rows // 4:
+            break
+
+        offset_ms = median_ms(lambda: db.execute(
+            "SELECT * FROM deletesnipe WHERE channel_id = 1 ORDER BY deleted_at DESC, id DESC LIMIT ? OFFSET ?", (PAGE, depth)
+        ).fetchall())
+
+        # The cursor a reader paging from the top would hold at this depth.
+        cursor = db.execute(
+            "SELECT deleted_at, id FROM deletesnipe WHERE channel_id = 1 ORDER BY deleted_at DESC, id DESC LIMIT 1 OFFSET ?", (max(depth - 1, 0),)
+        ).fetchone()
+        keyset_ms = median_ms(lambda: db.execute(
+            "SELECT * FROM deletesnipe WHERE channel_id = 1 AND (deleted_at, id) < (?, ?) ORDER BY deleted_at DESC, id DESC LIMIT ?", (*cursor, PAGE)
+        ).fetchall())
+
+        print(f"  depth {depth:>7,}:  OFFSET {offset_ms:8.3f}ms   keyset {keyset_ms:8.3f}ms")
+
+    db.close()
+
+
+if __name__ == "__main__":
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        main(num_rows)
@@ -0,0 +1,93 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Compares the per-event CPU cost of `discord.Message.clean_content`, which snipes used to
+compute for every delete, with `snipescommon.mention_names`, which is computed now.
+The cost of `snipescommon.clean_content` is shown too, it is only paid when a snipe is shown.
+
+Usage: python -m benchmarks.snipe_mentions [num_messages]
+"""
+
+import asyncio
+import random
+import sys
+import time
+
+from snipes.snipescommon import clean_content, mention_names
+
+from .fakes import BASE_ID, make_guild, make_message, make_state
+
+USERS = [BASE_ID + i for i in range(1, 1_000)]
+CHANNELS = [BASE_ID + 100_000 + i for i in range(20)]
+
+
+def random_content() -> tuple[str, list[int]]:
+    words = ["some", "ordinary", "chat", "message", "text", "lol", "ok"] * 3
+    mentioned = []
+
+    # Roughly a third of messages mention someone or something.
+    if random.random() < 0.2:
+        mentioned = random.sample(USERS, random.randint(1, 3))
+        words += [f"<@{user_id}>" for user_id in mentioned]
+    if random.random() < 0.1:
+        words.append(f"<#{random.choice(CHANNELS)}>")
+
+    random.shuffle(words)
+    return " ".join(words), mentioned
+
+
+def timed(func, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) / len(items) * 1_000_000
+
+
+async def main(num_messages: int) -> None:
+    state = make_state()
+    guild = make_guild(state, BASE_ID, CHANNELS)
+    channel = guild.get_channel(CHANNELS[0])
+
+    contents = [random_content() for _ in range(num_messages)]
+
+    # clean_content is cached on the message, so each measurement gets fresh messages.
+    def messages():
+        return [
+            make_message(state, channel, message_id=BASE_ID + 1_000_000 + i, author_id=random.choice(USERS), content=content, mentions=mentioned)  # type: ignore
+            for i, (content, mentioned) in enumerate(contents)
+        ]
+
+    before = timed(lambda m: m.clean_content, messages())
+    after = timed(mention_names, messages())
+
+    recorded = [(m.content, mention_names(m)) for m in messages()]
+    render = timed(lambda r: clean_content(r[0], guild, r[1]), recorded)
+
+    print(f"Message.clean_content per event:  {before:7.2f}us")
+    print(f"mention_names per event:          {after:7.2f}us ({before / after:.1f}x less)")
+    print(f"clean_content per snipe shown:    {render:7.2f}us")
+
+
+if __name__ == "__main__":
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    asyncio.run(main(num_messages))
@@ -0,0 +1,92 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Measures message delete events/sec handled by `MessageSnipeCog` with a new connection
+per query (no pool open) against the shared connection pool in `snipescommon`.
+Queued snipes are flushed before the clock stops so the writes are included.
+
+Usage: python -m benchmarks.snipe_pool [num_events] [concurrency]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from snipes import snipescommon
+from snipes.messagesnipe import MessageSnipeCog, snipe_table
+from snipes.optout import BOTUSER_SETUP_SQL
+from snipes.snipequeue import write_queue
+
+
+def fake_message(i: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=i,
+        guild=SimpleNamespace(id=1),
+        channel=SimpleNamespace(id=100 + i % 10),
+        author=SimpleNamespace(id=1000 + i % 50, bot=False, display_avatar=SimpleNamespace(url="")),
+        content=f"deleted message number {i}",
+        mentions=[],
+        reference=None,
+    )
+
+
+async def run(cog: MessageSnipeCog, num_events: int, concurrency: int) -> float:
+    messages = [fake_message(i) for i in range(num_events)]
+
+    start = time.perf_counter()
+    for i in range(0, num_events, concurrency):
+        await asyncio.gather(*(cog.on_message_delete(msg) for msg in messages[i:i + concurrency]))
+    await write_queue.flush()
+    elapsed = time.perf_counter() - start
+
+    return num_events / elapsed
+
+
+async def main(num_events: int, concurrency: int) -> None:
+    await snipe_table.load()
+    async with snipescommon.acquire() as db:
+        await db.execute(BOTUSER_SETUP_SQL)
+
+    cog = MessageSnipeCog(None)  # type: ignore # the listener never touches the bot
+
+    before = await run(cog, num_events, concurrency)
+    print(f"connection per query: {before:10.1f} events/sec")
+
+    await snipescommon.open_pool()
+    try:
+        after = await run(cog, num_events, concurrency)
+    finally:
+        await snipescommon.close_pool()
+    print(f"pooled ({snipescommon.POOL_SIZE} conns):    {after:10.1f} events/sec ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    num_events = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        asyncio.run(main(num_events, concurrency))
@@ -0,0 +1,140 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+"""
+Simulates many busy guilds at once against different numbers of snipe shards.
+
+Every guild deletes messages in a few channels, and now and then a moderator clears a
+channel or someone snipes further back than memory holds, both of which go to the database
+directly. Reports the events/sec handled and how long those direct queries take while
+ingestion is flushing. Each shard count runs in its own process and temporary directory.
+
+Usage: python -m benchmarks.snipe_shards [num_guilds] [events_per_guild] [shard counts...]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from snipes import snipescommon
+
+from .fakes import BASE_ID, make_guild, make_message, make_state
+
+CHANNELS_PER_GUILD = 5
+# Chance of an event being a channel clear or a snipe past what memory holds.
+CLEAR_CHANCE = 0.01
+DEEP_SNIPE_CHANCE = 0.02
+
+
+def make_messages(state, guild_id: int, num_events: int) -> list:
+    guild = make_guild(state, guild_id, [guild_id + 1 + c for c in range(CHANNELS_PER_GUILD)])
+    channels = list(guild.text_channels)
+    return [
+        make_message(state, random.choice(channels), message_id=guild_id + 1_000 + i, author_id=BASE_ID + 1 + i % 500, content=f"deleted message number {i}")
+        for i in range(num_events)
+    ]
+
+
+async def busy_guild(cog, guild_id: int, messages: list, latencies: list[float]) -> None:
+    from snipes.messagesnipe import DeleteSnipe
+
+    for message in messages:
+        channel_id = message.channel.id
+        roll = random.random()
+
+        if roll < CLEAR_CHANCE:
+            start = time.perf_counter()
+            await DeleteSnipe.delete_all_in(channel_id, guild_id=guild_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+        elif roll < CLEAR_CHANCE + DEEP_SNIPE_CHANCE:
+            start = time.perf_counter()
+            await DeleteSnipe.get_in_channel(channel_id, guild_id=guild_id, offset=150)
+            latencies.append((time.perf_counter() - start) * 1000)
+        else:
+            await cog.on_message_delete(message)
+
+        await asyncio.sleep(0) # Let the other guilds in, as gateway events would
+
+
+async def run(num_guilds: int, events_per_guild: int) -> tuple[float, list[float]]:
+    from snipes.messagesnipe import MessageSnipeCog, snipe_table
+    from snipes.optout import BOTUSER_SETUP_SQL
+    from snipes.snipequeue import close_queue, open_queue
+
+    await snipescommon.open_pool()
+    await snipe_table.load()
+    async with snipescommon.acquire() as db:
+        await db.execute(BOTUSER_SETUP_SQL)
+    open_queue()
+
+    cog = MessageSnipeCog(None)  # type: ignore # the listener never touches the bot
+    # Guild ids a few milliseconds apart spread over the shards like real ones.
+    guild_ids = [BASE_ID + (g << 22) for g in range(num_guilds)]
+    state = make_state()
+    messages = {guild_id: make_messages(state, guild_id, events_per_guild) for guild_id in guild_ids}
+    latencies: list[float] = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*(busy_guild(cog, guild_id, messages[guild_id], latencies) for guild_id in guild_ids))
+    await close_queue()
+    elapsed = time.perf_counter() - start
+
+    await snipescommon.close_pool()
+    return num_guilds * events_per_guild / elapsed, sorted(latencies)
+
+
+def measure(shards: int, num_guilds: int, events_per_guild: int) -> tuple[float, list[float]]:
+    snipescommon.SHARD_COUNT = shards
+    random.seed(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        return asyncio.run(run(num_guilds, events_per_guild))
+
+
+def main(num_guilds: int, events_per_guild: int, shard_counts: list[int]) -> None:
+    print(f"{num_guilds} guilds, {events_per_guild} events each\n")
+
+    baseline = None
+    for shards in shard_counts:
+        # A fresh process per run, so no module state carries over between shard counts.
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            rate, latencies = executor.submit(measure, shards, num_guilds, events_per_guild).result()
+
+        baseline = baseline or rate
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[int(len(latencies) * 0.95)]
+        print(f"{shards:>2} shards: {rate:9.1f} events/sec ({rate / baseline:.2f}x)  direct queries p50 {p50:7.2f}ms  p95 {p95:7.2f}ms")
+
+
+if __name__ == "__main__":
+    num_guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    events_per_guild = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    shard_counts = [int(arg) for arg in sys.argv[3:]] or [1, 4, 8]
+
+    main(num_guilds, events_per_guild, shard_counts)
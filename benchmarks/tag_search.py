@@ -0,0 +1,119 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Compares scanning a guild's tags with `LIKE '%query%'` against the FTS5 trigram index from
+the tags migrations, on a tags.sqlite filled with synthetic tags. The migration that builds
+the index is timed too, as it runs on existing databases.
+
+Tags are spread over guilds with a Zipf-like skew, so the first guild is by far the largest.
+Queries are parts of existing names of several lengths, searched for in guilds of several sizes.
+
+Usage: python -m benchmarks.tag_search [num_tags] [num_guilds]
+"""
+
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from utility.tags import TAGS_MIGRATIONS
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "po", "shi", "ven", "dar", "qu", "el", "om", "ix", "zu", "fa", "gre", "bo", "an", "tor"]
+QUERY_LENGTHS = [3, 4, 5, 6, 8]
+REPEAT = 40
+
+ORDER = "ORDER BY instr(lower(name), lower(?)), length(name), name"
+LIKE_SQL = f"SELECT name FROM tags WHERE guild_id = ? AND name LIKE ? {ORDER}"
+FTS_SQL = f"SELECT name FROM tags_fts WHERE tags_fts MATCH ? AND guild_id = ? {ORDER}"
+
+
+def fill(db: sqlite3.Connection, num_tags: int, num_guilds: int) -> None:
+    db.executescript(TAGS_MIGRATIONS[0])
+    words = ["".join(random.choices(SYLLABLES, k=random.randint(2, 4))) for _ in range(8_000)]
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(num_guilds)))
+    guilds = random.choices(range(num_guilds), cum_weights=weights, k=num_tags)
+    rows = (
+        (f"{random.choice(words)} {random.choice(words)} {i:x}", random.randrange(100_000), guild_id, "some tag content")
+        for i, guild_id in enumerate(guilds)
+    )
+    db.execute("BEGIN")
+    db.executemany("INSERT INTO tags VALUES (?, ?, ?, ?)", rows)
+    db.execute("COMMIT")
+
+
+def queries(db: sqlite3.Connection, guild_id: int, length: int) -> list[str]:
+    names = [row[0] for row in db.execute("SELECT name FROM tags WHERE guild_id = ? LIMIT 1000", (guild_id,)) if len(row[0]) > length]
+    picked = []
+    for _ in range(REPEAT):
+        name = random.choice(names)
+        start = random.randrange(len(name) - length)
+        picked.append(name[start:start + length])
+    return picked
+
+
+def timed(db: sqlite3.Connection, sql: str, params: list[tuple]) -> tuple[float, float]:
+    timings = []
+    for param in params:
+        start = time.perf_counter()
+        db.execute(sql, param).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+
+def main(num_tags: int, num_guilds: int) -> None:
+    random.seed(0)
+    db = sqlite3.connect("tags.sqlite", isolation_level=None)
+
+    start = time.perf_counter()
+    fill(db, num_tags, num_guilds)
+    print(f"Inserted {num_tags:,} tags over {num_guilds:,} guilds in {time.perf_counter() - start:.1f}s, {os.path.getsize('tags.sqlite') / 1024 / 1024:.1f}MiB")
+
+    start = time.perf_counter()
+    for version, migration in enumerate(TAGS_MIGRATIONS[1:], 2):
+        db.executescript(f"BEGIN;\n{migration};\nPRAGMA user_version = {version};\nCOMMIT;")
+    print(f"Migrated and built the index in {time.perf_counter() - start:.1f}s, {os.path.getsize('tags.sqlite') / 1024 / 1024:.1f}MiB\n")
+
+    for guild_id in (0, 10, num_guilds // 10, num_guilds // 2):
+        size = db.execute("SELECT COUNT(*) FROM tags WHERE guild_id = ?", (guild_id,)).fetchone()[0]
+        print(f"guild with {size:,} tags:")
+
+        for length in QUERY_LENGTHS:
+            searches = queries(db, guild_id, length)
+            like_p50, like_p95 = timed(db, LIKE_SQL, [(guild_id, f"%{q}%", q) for q in searches])
+            fts_p50, fts_p95 = timed(db, FTS_SQL, [(f'name : "{q}"', guild_id, q) for q in searches])
+            print(f"  {length} chars  LIKE p50 {like_p50:8.3f}ms p95 {like_p95:8.3f}ms  FTS5 p50 {fts_p50:8.3f}ms p95 {fts_p95:8.3f}ms")
+
+    db.close()
+
+
+if __name__ == "__main__":
+    num_tags = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    num_guilds = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        main(num_tags, num_guilds)
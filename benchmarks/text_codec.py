@@ -0,0 +1,128 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+"""
+Measures `utils.codec` on synthetic tracebacks and snipe contents: stored size as plain
+text, compressed, and compressed with the errorlog traceback dictionary, along with the
+database size and encode/decode cost.
+
+Usage: python -m benchmarks.text_codec [num_values]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from errorhandling.errorlog import ERRORLOG_SETUP_SQL, TRACEBACK_DICTIONARY_ID
+from utils.codec import decode_text, encode_text
+
+from .edit_deltas import message
+
+LIBRARY_FRAMES = [
+    ("discord/ext/commands/core.py", "wrapped", "ret = await coro(*args, **kwargs)"),
+    ("discord/ext/commands/core.py", "invoke", "await injected(*ctx.args, **ctx.kwargs)  # type: ignore"),
+    ("discord/ext/commands/bot.py", "invoke", "await ctx.command.invoke(ctx)"),
+    ("discord/app_commands/commands.py", "_do_call", "return await self._callback(self.binding, interaction, **params)  # type: ignore"),
+    ("discord/app_commands/tree.py", "_call", "await command._invoke_with_namespace(interaction, namespace)"),
+    ("discord/abc.py", "send", "data = await state.http.send_message(channel.id, params=params)"),
+    ("discord/http.py", "request", "raise HTTPException(response, data)"),
+]
+BOT_FRAMES = [
+    ("cogs/music.py", "play", "track = await self.queue.get(ctx.guild.id)"),
+    ("cogs/moderation.py", "ban", "await member.ban(reason=reason, delete_message_days=days)"),
+    ("cogs/levels.py", "rank", "card = await self.render_card(member, data['xp'], data['level'])"),
+    ("utility/tags.py", "tag", "await ctx.send(tag.content, allowed_mentions=ALLOWED_MENTIONS)"),
+]
+ERRORS = [
+    "discord.errors.Forbidden: 403 Forbidden (error code: 50013): Missing Permissions",
+    "AttributeError: 'NoneType' object has no attribute 'id'",
+    "KeyError: 'level'",
+    "sqlite3.OperationalError: database is locked",
+]
+
+
+def frame(path: str, function: str, line: str) -> str:
+    return f'  File "/home/bot/.venv/lib/python3.11/site-packages/{path}", line {random.randint(10, 1500)}, in {function}\n    {line}\n'
+
+
+def traceback_text() -> str:
+    inner = "Traceback (most recent call last):\n" + "".join(frame(*random.choice(BOT_FRAMES + LIBRARY_FRAMES)) for _ in range(random.randint(2, 8)))
+    inner += random.choice(ERRORS) + "\n"
+    if random.random() < 0.5:
+        return inner
+
+    outer = "Traceback (most recent call last):\n" + "".join(frame(*f) for f in LIBRARY_FRAMES[:random.randint(1, 3)])
+    outer += "discord.ext.commands.errors.CommandInvokeError: Command raised an exception: " + inner.splitlines()[-1] + "\n"
+    return inner + "\nThe above exception was the direct cause of the following exception:\n\n" + outer
+
+
+def db_size(values: list[str | bytes]) -> int:
+    path = f"{random.random()}.sqlite"
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute(ERRORLOG_SETUP_SQL)
+    db.execute("BEGIN")
+    db.executemany("INSERT INTO errorlog (unixtimestamp, traceback, item) VALUES (0, ?, 'Command: test')", [(v,) for v in values])
+    db.execute("COMMIT")
+    db.close()
+    return os.path.getsize(path)
+
+
+def report(name: str, values: list[str], dictionary_id: int | None) -> None:
+    raw = sum(len(v.encode()) for v in values)
+
+    start = time.perf_counter()
+    encoded = [encode_text(v, dictionary_id=dictionary_id) for v in values]
+    encode_us = (time.perf_counter() - start) / len(values) * 1_000_000
+
+    start = time.perf_counter()
+    for v in encoded:
+        decode_text(v)
+    decode_us = (time.perf_counter() - start) / len(values) * 1_000_000
+
+    stored = sum(len(v) if isinstance(v, bytes) else len(v.encode()) for v in encoded)  # type: ignore
+    compressed = sum(isinstance(v, bytes) for v in encoded)
+    print(
+        f"  {name:<28} {raw / 1e6:7.2f}MB -> {stored / 1e6:7.2f}MB ({stored / raw:4.0%}), {compressed:,} compressed, "
+        f"db {db_size(values) / 1e6:6.2f}MB -> {db_size(encoded) / 1e6:6.2f}MB, encode {encode_us:5.1f}us, decode {decode_us:5.1f}us"  # type: ignore
+    )
+
+
+def main(num_values: int) -> None:
+    tracebacks = [traceback_text() for _ in range(num_values)]
+    contents = [message() for _ in range(num_values)]
+
+    print(f"{num_values:,} values of each kind\n")
+    report("tracebacks", tracebacks, None)
+    report("tracebacks with dictionary", tracebacks, TRACEBACK_DICTIONARY_ID)
+    report("snipe contents", contents, None)
+
+
+if __name__ == "__main__":
+    num_values = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        main(num_values)
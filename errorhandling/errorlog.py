@@ -29,10 +29,45 @@ import discord
 from discord.ext import commands
 from typing_extensions import Self
 
+from utils.codec import decode_row, encode_text, register_dictionary
+
 _logger = logging.getLogger(__name__)
 
 DB_FILENAME = "errorlog.sqlite"
 
+# Text common to most tracebacks, so even short ones compress well. Never edit this once
+# tracebacks have been stored with it, register a new dictionary under a new id instead.
+TRACEBACK_DICTIONARY_ID = 1
+TRACEBACK_DICTIONARY = (
+    "During handling of the above exception, another exception occurred:\n\n"
+    "The above exception was the direct cause of the following exception:\n\n"
+    "discord.errors.NotFound: 404 Not Found (error code: 10008): Unknown Message\n"
+    "discord.errors.Forbidden: 403 Forbidden (error code: 50013): Missing Permissions\n"
+    "discord.errors.HTTPException: 400 Bad Request (error code: 50035): Invalid Form Body\n"
+    "AttributeError: 'NoneType' object has no attribute \n"
+    "TypeError: unsupported operand type(s) for \n"
+    "KeyError: \nValueError: \nIndexError: list index out of range\n"
+    "sqlite3.OperationalError: database is locked\n"
+    "discord.app_commands.errors.CommandInvokeError: Command '' raised an exception: \n"
+    "discord.ext.commands.errors.HybridCommandError: Hybrid command raised an error: Command '' raised an exception: \n"
+    "discord.ext.commands.errors.CommandInvokeError: Command raised an exception: \n"
+    "/site-packages/discord/http.py\", line , in request\n    raise HTTPException(response, data)\n"
+    "/site-packages/discord/abc.py\", line , in send\n    data = await state.http.send_message(channel.id, params=params)\n"
+    "/site-packages/discord/interactions.py\", line , in send_message\n    response = await adapter.create_interaction_response(\n"
+    "/site-packages/discord/webhook/async_.py\", line , in request\n    raise NotFound(response, data)\n"
+    "/site-packages/discord/app_commands/tree.py\", line , in _call\n    await command._invoke_with_namespace(interaction, namespace)\n"
+    "/site-packages/discord/app_commands/commands.py\", line , in _invoke_with_namespace\n    return await self._do_call(interaction, transformed_values)\n"
+    "/site-packages/discord/app_commands/commands.py\", line , in _do_call\n    return await self._callback(self.binding, interaction, **params)  # type: ignore\n"
+    "/site-packages/discord/ext/commands/bot.py\", line , in invoke\n    await ctx.command.invoke(ctx)\n"
+    "/site-packages/discord/ext/commands/core.py\", line , in invoke\n    await injected(*ctx.args, **ctx.kwargs)  # type: ignore\n"
+    "/site-packages/discord/ext/commands/core.py\", line , in wrapped\n    ret = await coro(*args, **kwargs)\n"
+    "          ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^\n"
+    "    await ctx.send(\n    await interaction.response.send_message(\n"
+    "Traceback (most recent call last):\n  File \"/home/"
+).encode("utf-8")
+
+register_dictionary(TRACEBACK_DICTIONARY_ID, TRACEBACK_DICTIONARY)
+
 ERRORLOG_SETUP_SQL = """
 CREATE TABLE IF NOT EXISTS errorlog (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -57,18 +92,18 @@ class ErrorLog:
 
                 res = await cur.fetchone()
 
-                return cls(**res) if res is not None else None
+                return cls(**decode_row(res, "traceback")) if res is not None else None
 
     @classmethod
     async def create(cls, *, traceback: str, item: str) -> Self:
         async with asqlite.connect(DB_FILENAME) as db:
             async with db.cursor() as cur:
                 now_utc = int(discord.utils.utcnow().timestamp())
-                await cur.execute("INSERT INTO errorlog (unixtimestamp, traceback, item) VALUES (?, ?, ?) RETURNING *", now_utc, traceback, item)
+                await cur.execute("INSERT INTO errorlog (unixtimestamp, traceback, item) VALUES (?, ?, ?) RETURNING *", now_utc, encode_text(traceback, dictionary_id=TRACEBACK_DICTIONARY_ID), item)
                 res = await cur.fetchone()
                 await db.commit()
 
-                return cls(**res)
+                return cls(**decode_row(res, "traceback"))
 
     @classmethod
     async def delete(cls, id: int, /) -> int:
@@ -87,7 +122,7 @@ class ErrorLog:
 
                 logs = await cur.fetchall()
 
-                return [cls(**res) for res in logs] if logs else None
+                return [cls(**decode_row(res, "traceback")) for res in logs] if logs else None
 
     @property
     def timestamp(self) -> datetime.datetime:
@@ -0,0 +1,181 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from __future__ import annotations
+
+"""
+Cache of snipe authors for rendering embeds.
+
+Members still in the guild are resolved from the guild's cache. Everyone else, which for
+deleted messages is often someone who left, is looked up here before falling back to
+`fetch_user`. Users that don't exist anymore are cached too, so each is fetched at most
+once per NOT_FOUND_TTL_SECONDS.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import discord
+from discord.ext import commands
+
+_logger = logging.getLogger(__name__)
+
+# Maximum authors held.
+AUTHOR_CACHE_SIZE = 10_000
+# How long a cached author is used before it is looked up again.
+AUTHOR_TTL_SECONDS = 60 * 60
+# How long a user that could not be found is remembered as missing.
+NOT_FOUND_TTL_SECONDS = 10 * 60
+
+
+@dataclass(slots=True)
+class SnipeAuthor:
+    id: int
+    name: str
+    avatar_url: str
+
+    @classmethod
+    def from_user(cls, user: discord.abc.User, /) -> SnipeAuthor:
+        return cls(id=user.id, name=str(user), avatar_url=user.display_avatar.url)
+
+
+class AuthorCache:
+    """Bounded LRU cache of user id to `SnipeAuthor`, with expiry and negative caching.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        The number of users held, by default AUTHOR_CACHE_SIZE
+    ttl : float, optional
+        The seconds an author is held, by default AUTHOR_TTL_SECONDS
+    not_found_ttl : float, optional
+        The seconds a missing user is held, by default NOT_FOUND_TTL_SECONDS
+    """
+    def __init__(self, *, max_size: int = AUTHOR_CACHE_SIZE, ttl: float = AUTHOR_TTL_SECONDS, not_found_ttl: float = NOT_FOUND_TTL_SECONDS) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.not_found_ttl = not_found_ttl
+
+        # User id to the time the entry expires and the author, None if the user was not found.
+        self._entries: OrderedDict[int, tuple[float, SnipeAuthor | None]] = OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        """Returns the cache size and lookup counters."""
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "fetches": self.fetches}
+
+    def _set(self, user_id: int, author: SnipeAuthor | None, ttl: float, /) -> None:
+        self._entries[user_id] = (time.monotonic() + ttl, author)
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def put(self, user: discord.abc.User, /) -> None:
+        """Caches a user seen in an event, unless a fresh entry is already held.
+
+        Parameters
+        ----------
+        user : discord.abc.User
+            The user to cache.
+        """
+        entry = self._entries.get(user.id)
+        if entry is not None and entry[1] is not None and entry[0] > time.monotonic():
+            return
+        self._set(user.id, SnipeAuthor.from_user(user), self.ttl)
+
+    def forget(self, user_id: int, /) -> None:
+        """Removes a user from the cache, such as when they opt out."""
+        self._entries.pop(user_id, None)
+
+    async def resolve(self, bot: commands.Bot, guild: discord.Guild, user_id: int, /) -> SnipeAuthor | None:
+        """Finds the author to show for a snipe, only calling the API if nothing is cached.
+
+        Parameters
+        ----------
+        bot : commands.Bot
+            The bot, used to look the user up.
+        guild : discord.Guild
+            The guild the snipe is shown in.
+        user_id : int
+            The id of the user.
+
+        Returns
+        -------
+        SnipeAuthor | None
+            The author, or None if the user does not exist or could not be fetched.
+        """
+        member = guild.get_member(user_id)
+        if member is not None:
+            return SnipeAuthor.from_user(member)
+
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+
+        user = bot.get_user(user_id)
+        if user is None:
+            self.fetches += 1
+            try:
+                user = await bot.fetch_user(user_id)
+            except discord.NotFound:
+                self._set(user_id, None, self.not_found_ttl)
+                return None
+            except discord.HTTPException:
+                _logger.warning("Could not fetch snipe author with id %d.", user_id, exc_info=True)
+                return None
+
+        author = SnipeAuthor.from_user(user)
+        self._set(user_id, author, self.ttl)
+        return author
+
+
+def set_embed_author(embed: discord.Embed, author: SnipeAuthor | None, user_id: int, /) -> None:
+    """Sets the author of a snipe embed, showing the id of users that could not be found.
+
+    Parameters
+    ----------
+    embed : discord.Embed
+        The embed to set the author of.
+    author : SnipeAuthor | None
+        The author from `AuthorCache.resolve`.
+    user_id : int
+        The id of the author.
+    """
+    if author is not None:
+        embed.set_author(name=author.name, icon_url=author.avatar_url)
+    else:
+        embed.set_author(name=f"Unknown User ({user_id})")
+
+
+author_cache = AuthorCache()
@@ -26,26 +26,45 @@ This module uses the following third party libs installed via pip: asqlite (http
 """
 
 import datetime
+import json
 import logging
-from dataclasses import dataclass
+import sqlite3
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from dataclasses import asdict, dataclass
+from typing import Any
 
-import asqlite
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
+
+from utils.codec import decode_row, encode_text
 
 # If not using all snipe categories, you'll need to bring these items into this file,
-# along with making sure the BotUser table is created and handling deleting opted out users data
-# from the database (the custom event won't work unless you maintain that logic.)
-from .optout import BotUser
-from .snipescommon import DB_FILENAME
+# along with making sure the BotUser table is created. Opted out users' data is erased by
+# OptOutCog for every snipe type registered with `user_data`, keep that registration.
+from .authorcache import author_cache, set_embed_author
+from .embedcache import embed_cache
+from .optout import BotUser, optout_cache, user_data
+from .snipepolicy import SnipeCategory, policy_cache
+from .snipepurge import purge_coordinator
+from .snipequeue import close_queue, open_queue, write_queue
+from .snipescommon import PERSIST_SNIPES, BucketedTable, acquire, clean_content, close_pool, mention_names, next_snipe_id, open_pool, shard_for, shorten
+from .snipestore import SnipeStore
 
 _logger = logging.getLogger(__name__)
 
 # Maximum age will be TTL_MINUTES * 2
 TTL_MINUTES = 5
+# Edits to a message within this many seconds of its first recorded edit update that snipe
+# instead of recording a new one. Set to 0 to record every edit.
+COALESCE_SECONDS = 30
+# When True, the before content of edits to messages at least DELTA_MIN_LENGTH characters long
+# is stored as a diff against the after content, if that is smaller.
+DELTA_ENCODE = True
+DELTA_MIN_LENGTH = 200
 
 SETUP_SQL = """
-CREATE TABLE IF NOT EXISTS editsnipe (
+CREATE TABLE IF NOT EXISTS {table} (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     edited_at BIGINT NOT NULL,
     sender_id BIGINT NOT NULL,
@@ -56,6 +75,85 @@ CREATE TABLE IF NOT EXISTS editsnipe (
 )
 """
 
+# Applied in order by `migrate` to every window table, `{table}` is replaced with its name.
+# Never edit or reorder these, only append.
+MIGRATIONS = [
+    SETUP_SQL,
+    # Lookups by channel, the TTL purge and clearing a user's snipes
+    """
+    CREATE INDEX IF NOT EXISTS {table}_channel_idx ON {table} (channel_id, edited_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS {table}_edited_idx ON {table} (edited_at);
+    CREATE INDEX IF NOT EXISTS {table}_sender_idx ON {table} (sender_id)
+    """,
+    # Content is stored raw and cleaned when shown
+    "ALTER TABLE {table} ADD COLUMN mention_names TEXT NULL",
+    # Expiry drops whole window tables, nothing deletes by time anymore
+    "DROP INDEX IF EXISTS {table}_edited_idx",
+    # Successive edits of a message are coalesced into one snipe
+    "ALTER TABLE {table} ADD COLUMN message_id BIGINT NULL",
+    # Before content can be stored as a diff against the after content
+    "ALTER TABLE {table} ADD COLUMN before_delta TEXT NULL",
+    # Guild wide timelines
+    "CREATE INDEX IF NOT EXISTS {table}_guild_idx ON {table} (guild_id, edited_at DESC, id DESC)",
+]
+
+INSERT_SQL = """INSERT INTO {table}
+(id, edited_at, sender_id, before_content, after_content, guild_id, channel_id, mention_names, message_id, before_delta)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+COALESCE_SQL = "UPDATE {table} SET edited_at = ?, before_content = ?, after_content = ?, mention_names = ?, before_delta = ? WHERE id = ?"
+
+
+def _shared_length(a: str, b: str, limit: int, /, *, from_end: bool) -> int:
+    # Binary search on slice comparisons, which run in C, rather than comparing characters in Python.
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if (a[len(a) - mid:] == b[len(b) - mid:]) if from_end else (a[:mid] == b[:mid]):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def encode_delta(before: str | None, after: str | None, /) -> tuple[str | None, str | None]:
+    """Encodes the before content of an edit as a diff against the after content when worthwhile.
+
+    The diff is a JSON list whose items are either `[start, end]`, a slice of the after
+    content to copy, or a string to insert.
+
+    Parameters
+    ----------
+    before : str | None
+        The content before the edit
+    after : str | None
+        The content after the edit
+
+    Returns
+    -------
+    tuple[str | None, str | None]
+        The before content and the diff, exactly one of which is None when both contents are given.
+    """
+    if not DELTA_ENCODE or not before or not after or len(before) < DELTA_MIN_LENGTH:
+        return before, None
+
+    # Edits are nearly always one local change, so only the common start and end are shared.
+    # difflib finds every shared run but takes milliseconds on long messages.
+    prefix = _shared_length(before, after, min(len(before), len(after)), from_end=False)
+    suffix = _shared_length(before, after, min(len(before), len(after)) - prefix, from_end=True)
+
+    delta: list[list[int] | str] = [[0, prefix], before[prefix:len(before) - suffix], [len(after) - suffix, len(after)]]
+    encoded = json.dumps(delta, ensure_ascii=False, separators=(",", ":"))
+    if len(encoded) >= len(before):
+        return before, None
+    return None, encoded
+
+
+def decode_delta(after: str | None, delta: str, /) -> str:
+    """Rebuilds before content from the after content and a diff made by `encode_delta`."""
+    assert after is not None
+    return "".join(after[item[0]:item[1]] if isinstance(item, list) else item for item in json.loads(delta))
+
 
 @dataclass(slots=True)
 class EditSnipe:
@@ -67,11 +165,16 @@ class EditSnipe:
     after_content: str | None
     guild_id: int
     channel_id: int
+    mention_names: str | None = None
+    message_id: int | None = None
+    before_delta: str | None = None
 
     @classmethod
-    async def from_messages(cls, before: discord.Message, after: discord.Message, /) -> EditSnipe:
+    def from_messages(cls, before: discord.Message, after: discord.Message, /) -> EditSnipe:
         """Creates a EditSnipe from a given `discord.Message`s
 
+        This does not store the snipe, see `save`.
+
         Parameters
         ----------
         before : discord.Message
@@ -88,25 +191,81 @@ class EditSnipe:
         assert after.guild is not None
         assert before.id == after.id
 
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                edited_at = int(discord.utils.utcnow().timestamp())
-                sender_id = after.author.id
-                before_content = before.clean_content
-                after_content = after.clean_content
-                guild_id = after.guild.id
-                channel_id = after.channel.id
+        before_content, before_delta = encode_delta(before.content, after.content)
+
+        return cls(
+            id=next_snipe_id(),
+            edited_at=int(discord.utils.utcnow().timestamp()),
+            sender_id=after.author.id,
+            before_content=before_content,
+            after_content=after.content,
+            guild_id=after.guild.id,
+            channel_id=after.channel.id,
+            mention_names=mention_names(before, after),
+            message_id=after.id,
+            before_delta=before_delta,
+        )
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row, /) -> EditSnipe:
+        """Creates a EditSnipe from a database row."""
+        return cls(**decode_row(row, "before_content", "after_content"))
 
-                await cur.execute(f"""INSERT INTO editsnipe
-                (edited_at, sender_id, before_content, after_content, guild_id, channel_id)
-                VALUES (?, ?, ?, ?, ?, ?) RETURNING *""", edited_at, sender_id, before_content, after_content, guild_id, channel_id)
-                res = await cur.fetchone()
-                await db.commit()
+    def save(self) -> None:
+        """Stores this snipe in memory and queues it to be written to the database.
 
-                return cls(**res)
+        If the same message was edited within `COALESCE_SECONDS` of its first recorded
+        edit, that snipe keeps its `before_content` and takes this edit's content instead,
+        unless its window has ended since.
+        """
+        # Either way what the channel's offsets show changes
+        embed_cache.invalidate_channel(snipe_table.name, self.channel_id)
+        if self._coalesce():
+            return
+
+        snipe_store.add(self)
+        if self.message_id is not None and COALESCE_SECONDS > 0:
+            recent_edits[self.message_id] = (self.edited_at, self)
+
+        if PERSIST_SNIPES:
+            write_queue.put(shard_for(self.guild_id), INSERT_SQL.format(table=snipe_table.table_for(self.id)), (self.id, self.edited_at, self.sender_id, encode_text(self.before_content), encode_text(self.after_content), self.guild_id, self.channel_id, self.mention_names, self.message_id, self.before_delta))
+
+    def _coalesce(self) -> bool:
+        # Entries are in order of first edit, so the stale ones are at the front.
+        while recent_edits:
+            first_edited_at, _ = next(iter(recent_edits.values()))
+            if self.edited_at - first_edited_at <= COALESCE_SECONDS:
+                break
+            recent_edits.popitem(last=False)
+
+        if self.message_id is None or self.message_id not in recent_edits:
+            return False
+
+        _, snipe = recent_edits[self.message_id]
+        # The row stays in the window table of its id, which memory must not outlive. Memory
+        # expires by edit time, so edits from the end of that window on are recorded anew.
+        if self.edited_at >= (snipe_table.window_for(snipe.id) + 1) * snipe_table.window_seconds:
+            del recent_edits[self.message_id]
+            return False
+
+        # Snipes removed from memory since are recorded anew
+        if not snipe_store.move_to_newest(snipe):
+            del recent_edits[self.message_id]
+            return False
+
+        names = {**json.loads(snipe.mention_names or "{}"), **json.loads(self.mention_names or "{}")}
+        snipe.edited_at = self.edited_at
+        # A diff is against the old after content, so it is redone against the new one.
+        snipe.before_content, snipe.before_delta = encode_delta(snipe.before, self.after_content)
+        snipe.after_content = self.after_content
+        snipe.mention_names = json.dumps(names) if names else None
+
+        if PERSIST_SNIPES:
+            write_queue.put(shard_for(snipe.guild_id), COALESCE_SQL.format(table=snipe_table.table_for(snipe.id)), (snipe.edited_at, encode_text(snipe.before_content), encode_text(snipe.after_content), snipe.mention_names, snipe.before_delta, snipe.id))
+        return True
 
     @classmethod
-    async def get_in_channel(cls, channel_id: int, /, *, offset: int = 0) -> EditSnipe | None:
+    async def get_in_channel(cls, channel_id: int, /, *, guild_id: int, offset: int = 0) -> EditSnipe | None:
         """Gets a EditSnipe in a given channel at a given offset.
 
         This is ordered by edit time.
@@ -115,6 +274,8 @@ class EditSnipe:
         ----------
         channel_id : int
             The channel to retrieve from
+        guild_id : int
+            The guild the channel is in
         offset : int, optional
             The number of entries back to check, by default 0
 
@@ -123,79 +284,137 @@ class EditSnipe:
         Self | None
             The EditSnipe if found, else None.
         """
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("SELECT * FROM editsnipe WHERE channel_id = ? ORDER BY edited_at DESC LIMIT 1 OFFSET ?", channel_id, offset)
-                res = await cur.fetchone()
+        snipe = snipe_store.get(channel_id, offset=offset)
+        if snipe is not None or not PERSIST_SNIPES:
+            return snipe
+
+        # Not held in memory, it may be older than what is.
+        return await cls._get_older(channel_id, guild_id, offset)
+
+    @classmethod
+    async def _get_older(cls, channel_id: int, guild_id: int, offset: int, /) -> EditSnipe | None:
+        # The snipes held in memory are the newest in the database, so the search continues
+        # from the oldest of them instead of counting from the newest.
+        held, oldest = snipe_store.oldest(channel_id)
+        async for snipe in cls.iter_newest(guild_id=guild_id, channel_id=channel_id, before=oldest.cursor if oldest is not None else None):
+            if held == offset:
+                return snipe
+            held += 1
+        return None
+
+    @classmethod
+    async def iter_newest(cls, *, guild_id: int | None = None, channel_id: int | None = None, before: tuple[int, int] | None = None) -> AsyncIterator[EditSnipe]:
+        """Lazily yields the EditSnipes in a guild or channel, newest first.
+
+        Parameters
+        ----------
+        guild_id : int | None, optional
+            The guild to get from, or the guild the channel is in, by default None
+        channel_id : int | None, optional
+            The channel to get from, by default None
+        before : tuple[int, int] | None, optional
+            Only yield snipes ordered before this `cursor`, by default None
+        """
+        if not PERSIST_SNIPES:
+            for snipe in snipe_store.newest(guild_id=guild_id, channel_id=channel_id, before=before):
+                yield snipe
+            return
+
+        shard = shard_for(guild_id) if guild_id is not None else None # Without a guild every shard is read
+        await write_queue.flush(shard) # Make sure queued snipes are visible
 
-                return cls(**res) if res is not None else None
+        column, value = ("channel_id", channel_id) if channel_id is not None else ("guild_id", guild_id)
+        async for row in snipe_table.iter_newest(column, value, shard=shard, before=before): # type: ignore
+            yield cls.from_row(row)
 
     @classmethod
-    async def delete_one_in(cls, channel_id: int, /, *, offset: int = 0) -> int:
-        """Deletes a single database entry in given channel
+    async def delete_one_in(cls, channel_id: int, /, *, guild_id: int, offset: int = 0) -> int:
+        """Deletes a single entry in given channel
 
         Parameters
         ----------
         channel_id : int
             The channel to remove in
+        guild_id : int
+            The guild the channel is in
         offset : int, optional
             The number of entries to delete back, by default 0
 
         Returns
         -------
         int
-            The number of database entries removed.
+            The number of entries removed.
         """
-        async with asqlite.connect(DB_FILENAME) as db:
+        snipe = snipe_store.remove_at(channel_id, offset=offset)
+        if snipe is not None:
+            embed_cache.invalidate_channel(snipe_table.name, channel_id)
+            if PERSIST_SNIPES:
+                write_queue.put(shard_for(snipe.guild_id), f"DELETE FROM {snipe_table.table_for(snipe.id)} WHERE id = ?", (snipe.id,))
+            return 1
+
+        if not PERSIST_SNIPES:
+            return 0
+
+        snipe = await cls._get_older(channel_id, guild_id, offset)
+        if snipe is None:
+            return 0
+
+        async with acquire(shard_for(guild_id)) as db:
             async with db.cursor() as cur:
-                await cur.execute("""DELETE FROM editsnipe
-                WHERE channel_id = ? AND id IN
-                 (SELECT id FROM editsnipe WHERE channel_id = ? ORDER BY edited_at DESC LIMIT 1 OFFSET ?)""", channel_id, channel_id, offset)
-                await db.commit()
+                await cur.execute(f"DELETE FROM {snipe_table.table_for(snipe.id)} WHERE id = ?", snipe.id)
+                num_deleted = cur.get_cursor().rowcount
 
-                return cur.get_cursor().rowcount
+        # Invalidated once deleted, so a snipe rendered meanwhile isn't held.
+        embed_cache.invalidate_channel(snipe_table.name, channel_id)
+        return num_deleted
 
     @classmethod
-    async def delete_all_in(cls, channel_id: int, /) -> int:
-        """Removes all items from database with given channel id.
+    async def delete_all_in(cls, channel_id: int, /, *, guild_id: int) -> int:
+        """Removes all items with given channel id.
 
         Parameters
         ----------
         channel_id : int
             The channel id to clear
+        guild_id : int
+            The guild the channel is in
 
         Returns
         -------
         int
-            The number of removed database entries
+            The number of removed entries
         """
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("DELETE FROM editsnipe WHERE channel_id = ?", channel_id)
-                await db.commit()
+        num_deleted = snipe_store.clear_channel(channel_id)
+        if not PERSIST_SNIPES:
+            embed_cache.invalidate_channel(snipe_table.name, channel_id)
+            return num_deleted
 
-                return cur.get_cursor().rowcount
+        shard = shard_for(guild_id)
+        await write_queue.flush(shard) # Make sure queued snipes are visible
 
-    @staticmethod
-    async def clear_all_for_user(user_id: int, /) -> int:
-        """Removes all snipes for given user_id
+        # Everything held in memory is also in the database
+        num_deleted = await snipe_table.delete_where("channel_id = ?", channel_id, shard=shard)
+        embed_cache.invalidate_channel(snipe_table.name, channel_id)
+        return num_deleted
 
-        Parameters
-        ----------
-        user_id : int
-            The user_id to clear.
+    @property
+    def before(self) -> str | None:
+        """The content before the edit, rebuilt from its diff if it was stored as one."""
+        if self.before_delta is not None:
+            return decode_delta(self.after_content, self.before_delta)
+        return self.before_content
 
-        Returns
-        -------
-        int
-            The number of removed database entries.
-        """
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("DELETE FROM editsnipe WHERE sender_id = ?", user_id)
-                await db.commit()
+    @property
+    def cursor(self) -> tuple[int, int]:
+        """The `(time, id)` this snipe is ordered by, newest first."""
+        return (self.edited_at, self.id)
 
-                return cur.get_cursor().rowcount
+    def to_dict(self) -> dict[str, Any]:
+        """This snipe as a JSON serializable dict, as included in data exports."""
+        data = asdict(self)
+        del data["before_delta"]
+        data["before_content"] = self.before
+        return data
 
     @property
     def timestamp(self) -> datetime.datetime:
@@ -217,63 +436,89 @@ class EditSnipe:
         """
         assert ctx.guild
 
-        author = ctx.guild.get_member(self.sender_id) or await ctx.bot.fetch_member(self.sender_id)
+        author = await author_cache.resolve(ctx.bot, ctx.guild, self.sender_id)
 
         embed = discord.Embed(color=discord.Color.blue())
-        embed.set_author(name=author, icon_url=author.display_avatar.url)
+        set_embed_author(embed, author, self.sender_id)
         embed.timestamp = self.timestamp
 
-        embed.add_field(name="Before", value=self.before_content, inline=False)
-        embed.add_field(name="After", value=self.after_content, inline=False)
+        embed.add_field(name="Before", value=clean_content(self.before, ctx.guild, self.mention_names), inline=False)
+        embed.add_field(name="After", value=clean_content(self.after_content, ctx.guild, self.mention_names), inline=False)
 
         return embed
 
+    def summary(self, guild: discord.Guild, /) -> str:
+        """A one line description of this snipe for timelines.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild the snipe is being shown in.
+
+        Returns
+        -------
+        str
+            The line.
+        """
+        before = clean_content(self.before, guild, self.mention_names) or "*No content*"
+        after = clean_content(self.after_content, guild, self.mention_names) or "*No content*"
+        return f"\N{PENCIL} <t:{self.edited_at}:T> <#{self.channel_id}> <@{self.sender_id}>: {shorten(before)} \N{RIGHTWARDS ARROW} {shorten(after)}"
+
+snipe_store: SnipeStore[EditSnipe] = SnipeStore(user_attr="sender_id", time_attr="edited_at")
+snipe_table = BucketedTable("editsnipe", MIGRATIONS, time_column="edited_at", window_seconds=TTL_MINUTES * 60)
+# Message id to the time of its first recorded edit and its snipe, oldest first.
+recent_edits: OrderedDict[int, tuple[int, EditSnipe]] = OrderedDict()
+
 
 class EditSnipeCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
     async def cog_load(self) -> None:
-        async with asqlite.connect(DB_FILENAME) as db:
-            await db.executescript(SETUP_SQL)
-        self.delete_snipe_db_purge.start()
+        await open_pool()
+        if PERSIST_SNIPES:
+            await snipe_table.load()
+        await optout_cache.load()
+        await policy_cache.load()
+        open_queue()
+        purge_coordinator.register(snipe_table, snipe_store)
+        user_data.register(EditSnipe, snipe_table, snipe_store)
 
     async def cog_unload(self) -> None:
-        self.delete_snipe_db_purge.cancel()
-
-    @commands.Cog.listener()
-    async def on_optout_status_change(self, user: discord.User, _: bool) -> None:
-        """Custom event handler for opt out status changes
-
-        Parameters
-        ----------
-        user : discord.User
-            The user whose opt out status changed
-        _ : bool
-            The new opt out status
-        """
-        num_deleted = await EditSnipe.clear_all_for_user(user.id)
-        _logger.info("Processed editsnipe clear for %s, removed %d editsnipes.", str(user), num_deleted)
+        user_data.unregister(snipe_table)
+        await purge_coordinator.unregister(snipe_table)
+        await close_queue()
+        await close_pool()
 
     @commands.Cog.listener()
     async def on_message_edit(self, before: discord.Message, after: discord.Message) -> None:
         if after.guild is None: return
+        if not policy_cache.allows(after.guild.id, SnipeCategory.EDIT): return
         if after.author.bot: return
         if await BotUser.is_opt_out(after.author.id): return
 
         _logger.debug("Processing message edit in channel with id %d", after.channel.id)
-        await EditSnipe.from_messages(before, after)
+        author_cache.put(after.author)
+        EditSnipe.from_messages(before, after).save()
 
     @commands.command()
     @commands.guild_only()
     async def esnipe(self, ctx: commands.Context, num_back: int = 0) -> None:
         """Snipes an edited message in current channel."""
-        snipe = await EditSnipe.get_in_channel(ctx.channel.id, offset=num_back)
+        # Read before the lookup, which may wait on the database or the API.
+        latest_id, generation = snipe_store.latest_id(ctx.channel.id), embed_cache.generation_of(snipe_table.name, ctx.channel.id)
 
-        if snipe:
-            await ctx.send(embed=await snipe.embed(ctx))
-        else:
-            await ctx.send("No snipe found.")
+        embed = embed_cache.get(snipe_table.name, ctx.channel.id, num_back, latest_id)
+        if embed is None:
+            snipe = await EditSnipe.get_in_channel(ctx.channel.id, guild_id=ctx.guild.id, offset=num_back)
+            if not snipe:
+                await ctx.send("No snipe found.")
+                return
+
+            embed = await snipe.embed(ctx)
+            embed_cache.put(snipe_table.name, ctx.channel.id, num_back, latest_id, embed, generation=generation)
+
+        await ctx.send(embed=embed)
 
     @commands.command()
     @commands.guild_only()
@@ -282,7 +527,7 @@ class EditSnipeCog(commands.Cog):
         """Removes an editsnipe in current channel."""
         assert isinstance(ctx.channel, discord.abc.GuildChannel)
 
-        num_deleted = await EditSnipe.delete_one_in(ctx.channel.id, offset=num_back)
+        num_deleted = await EditSnipe.delete_one_in(ctx.channel.id, guild_id=ctx.guild.id, offset=num_back)
 
         if num_deleted > 0:
             await ctx.send(f"Deleted snipe at index {num_back} in {ctx.channel.mention}")
@@ -298,26 +543,13 @@ class EditSnipeCog(commands.Cog):
 
         assert isinstance(chan, discord.abc.GuildChannel)
 
-        num_deleted = await EditSnipe.delete_all_in(chan.id)
+        num_deleted = await EditSnipe.delete_all_in(chan.id, guild_id=ctx.guild.id)
 
         if num_deleted > 0:
             await ctx.send(f"Deleted {num_deleted} snipes in {chan.mention}")
         else:
             await ctx.send(f"I couldn't find anything to delete in {chan.mention}")
 
-    @tasks.loop(minutes=TTL_MINUTES)
-    async def delete_snipe_db_purge(self):
-        oldest_time = discord.utils.utcnow() - datetime.timedelta(minutes=TTL_MINUTES)
-        oldest_timestamp = int(oldest_time.timestamp())
-
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("DELETE FROM editsnipe WHERE edited_at < ?", oldest_timestamp)
-                await db.commit()
-
-                deleted = cur.get_cursor().rowcount
-                _logger.info("Performing periodic editsnipe purge. %d editsnipes removed.", deleted)
-
 
 async def setup(bot: commands.Bot):
     _logger.info("Loading cog EditSnipeCog")
@@ -0,0 +1,221 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from __future__ import annotations
+
+"""
+Cache of rendered snipe embeds.
+
+In active channels the same snipe is often asked for by several people within seconds.
+The embed built for the first of them is kept here, keyed by the snipe type, channel and
+offset asked for, along with the id of the newest snipe in that channel. A new snipe
+changes that id, so the entries of a channel stop matching as soon as anything is sniped
+there. The snipe types also invalidate entries when a snipe is changed or removed in place.
+
+Each snipe type and channel has a generation, bumped when it is invalidated, and `clear`
+bumps one shared by all of them. An embed that took a database read or an API call to
+render is only held if its channel wasn't invalidated meanwhile, so a snipe removed while
+it was being rendered is not put back, while snipes in other channels don't stop it
+from being held.
+"""
+
+import time
+from collections import OrderedDict
+
+import discord
+
+# Maximum embeds held.
+EMBED_CACHE_SIZE = 1_000
+# How long a rendered embed is reused. Author names and avatars are only as fresh as this.
+EMBED_TTL_SECONDS = 30
+# Channels whose generation is remembered. Forgetting the least recently invalidated ones
+# bumps the shared generation, so renders in flight are never held by mistake.
+MAX_CHANNEL_GENERATIONS = 10_000
+
+_Key = tuple[str, int, int, int]
+
+
+class EmbedCache:
+    """Bounded LRU cache of rendered snipe embeds, with expiry.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        The number of embeds held, by default EMBED_CACHE_SIZE
+    ttl : float, optional
+        The seconds an embed is held, by default EMBED_TTL_SECONDS
+    max_channel_generations : int, optional
+        The number of channel generations remembered, by default MAX_CHANNEL_GENERATIONS
+    """
+    def __init__(self, *, max_size: int = EMBED_CACHE_SIZE, ttl: float = EMBED_TTL_SECONDS, max_channel_generations: int = MAX_CHANNEL_GENERATIONS) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_channel_generations = max_channel_generations
+
+        # Key to the time the entry expires and the embed payload.
+        self._entries: OrderedDict[_Key, tuple[float, dict]] = OrderedDict()
+        # (snipe type, channel id) to the keys held for it, so invalidating a channel doesn't scan every entry.
+        self._by_channel: dict[tuple[str, int], set[_Key]] = {}
+
+        # Bumped by `clear`, and when a channel generation is forgotten
+        self.generation = 0
+        # (snipe type, channel id) to its generation, least recently invalidated first, 0 if absent.
+        # Generations are taken from one counter, so a channel forgotten and invalidated again never repeats one.
+        self._channel_generations: OrderedDict[tuple[str, int], int] = OrderedDict()
+        self._stamp = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        """Returns the cache size and lookup counters."""
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+    def _remove(self, key: _Key, /) -> None:
+        del self._entries[key]
+        keys = self._by_channel[key[:2]]
+        keys.discard(key)
+        if not keys:
+            del self._by_channel[key[:2]]
+
+    def generation_of(self, kind: str, channel_id: int, /) -> tuple[int, int]:
+        """The generation to pass to `put`, read before a snipe is looked up.
+
+        Parameters
+        ----------
+        kind : str
+            The snipe type, the name of its table.
+        channel_id : int
+            The channel the snipe is asked for in.
+
+        Returns
+        -------
+        tuple[int, int]
+            The shared generation and the channel's.
+        """
+        return self.generation, self._channel_generations.get((kind, channel_id), 0)
+
+    def get(self, kind: str, channel_id: int, offset: int, latest_id: int | None, /) -> discord.Embed | None:
+        """Gets a rendered embed, if one is held for the snipe at this offset.
+
+        Parameters
+        ----------
+        kind : str
+            The snipe type, the name of its table.
+        channel_id : int
+            The channel the snipe was asked for in.
+        offset : int
+            The number of entries back that was asked for.
+        latest_id : int | None
+            The id of the newest snipe in the channel, None if it is not known.
+
+        Returns
+        -------
+        discord.Embed | None
+            A new embed built from the held payload, else None.
+        """
+        if latest_id is None:
+            return None
+
+        key = (kind, channel_id, offset, latest_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return discord.Embed.from_dict(entry[1])
+
+    def put(self, kind: str, channel_id: int, offset: int, latest_id: int | None, embed: discord.Embed, /, *, generation: tuple[int, int]) -> None:
+        """Holds a rendered embed.
+
+        Nothing is held when the newest snipe is not known, or when the channel was invalidated
+        or the cache cleared since `generation` was read.
+
+        Parameters
+        ----------
+        kind : str
+            The snipe type, the name of its table.
+        channel_id : int
+            The channel the snipe was asked for in.
+        offset : int
+            The number of entries back that was asked for.
+        latest_id : int | None
+            The id of the newest snipe in the channel, as passed to `get`.
+        embed : discord.Embed
+            The embed to hold.
+        generation : tuple[int, int]
+            The `generation_of` the channel, read before the snipe was looked up.
+        """
+        if latest_id is None or generation != self.generation_of(kind, channel_id):
+            return
+
+        key = (kind, channel_id, offset, latest_id)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, embed.to_dict())
+        self._by_channel.setdefault(key[:2], set()).add(key)
+
+        if len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_channel(self, kind: str, channel_id: int, /) -> None:
+        """Removes every embed of a snipe type held for a channel.
+
+        Parameters
+        ----------
+        kind : str
+            The snipe type, the name of its table.
+        channel_id : int
+            The channel to invalidate.
+        """
+        self._stamp += 1
+        self._channel_generations[(kind, channel_id)] = self._stamp
+        self._channel_generations.move_to_end((kind, channel_id))
+        if len(self._channel_generations) > self.max_channel_generations:
+            self._channel_generations.popitem(last=False)
+            self.generation += 1
+
+        keys = self._by_channel.pop((kind, channel_id), None)
+        if keys is None:
+            return
+
+        for key in keys:
+            del self._entries[key]
+        self.invalidations += len(keys)
+
+    def clear(self) -> None:
+        """Removes every embed, such as after expired snipes are purged or a user's are erased."""
+        self.generation += 1
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._by_channel.clear()
+
+
+embed_cache = EmbedCache()
@@ -26,18 +26,30 @@ This module uses the following third party libs installed via pip: asqlite (http
 """
 
 import datetime
+import itertools
 import logging
-from dataclasses import dataclass
+import sqlite3
+from collections.abc import AsyncIterator
+from dataclasses import asdict, dataclass
+from typing import Any
 
-import asqlite
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
+
+from utils.codec import decode_row, encode_text
 
 # If not using all snipe categories, you'll need to bring these items into this file,
-# along with making sure the BotUser table is created and handling deleting opted out users data
-# from the database (the custom event won't work unless you maintain that logic.)
-from .optout import BotUser
-from .snipescommon import DB_FILENAME
+# along with making sure the BotUser table is created. Opted out users' data is erased by
+# OptOutCog for every snipe type registered with `user_data`, keep that registration.
+from .authorcache import author_cache, set_embed_author
+from .embedcache import embed_cache
+from .optout import BotUser, optout_cache, user_data
+from .snipeblobs import SnipeBlob, blob_store, describe_all
+from .snipepolicy import SnipeCategory, policy_cache
+from .snipepurge import purge_coordinator
+from .snipequeue import close_queue, open_queue, write_queue
+from .snipescommon import PERSIST_SNIPES, BucketedTable, acquire, clean_content, close_pool, mention_names, next_snipe_id, open_pool, shard_for, shorten
+from .snipestore import SnipeStore
 
 _logger = logging.getLogger(__name__)
 
@@ -45,7 +57,7 @@ _logger = logging.getLogger(__name__)
 TTL_MINUTES = 5
 
 SETUP_SQL = """
-CREATE TABLE IF NOT EXISTS deletesnipe (
+CREATE TABLE IF NOT EXISTS {table} (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     deleted_at BIGINT NOT NULL,
     sender_id BIGINT NOT NULL,
@@ -56,6 +68,30 @@ CREATE TABLE IF NOT EXISTS deletesnipe (
 )
 """
 
+# Applied in order by `migrate` to every window table, `{table}` is replaced with its name.
+# Never edit or reorder these, only append.
+MIGRATIONS = [
+    SETUP_SQL,
+    # Lookups by channel, the TTL purge and clearing a user's snipes
+    """
+    CREATE INDEX IF NOT EXISTS {table}_channel_idx ON {table} (channel_id, deleted_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS {table}_deleted_idx ON {table} (deleted_at);
+    CREATE INDEX IF NOT EXISTS {table}_sender_idx ON {table} (sender_id)
+    """,
+    # Content is stored raw and cleaned when shown
+    "ALTER TABLE {table} ADD COLUMN mention_names TEXT NULL",
+    # Expiry drops whole window tables, nothing deletes by time anymore
+    "DROP INDEX IF EXISTS {table}_deleted_idx",
+    # Guild wide timelines
+    "CREATE INDEX IF NOT EXISTS {table}_guild_idx ON {table} (guild_id, deleted_at DESC, id DESC)",
+    # Keys of attachment and embed metadata, stored in snipeblob
+    "ALTER TABLE {table} ADD COLUMN blobs TEXT NULL",
+]
+
+INSERT_SQL = """INSERT INTO {table}
+(id, deleted_at, sender_id, content, guild_id, channel_id, message_reference_id, mention_names, blobs)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
 @dataclass(slots=True)
 class DeleteSnipe:
     """Represents a deleted Discord Message"""
@@ -66,11 +102,17 @@ class DeleteSnipe:
     guild_id: int
     channel_id: int
     message_reference_id: int | None
+    mention_names: str | None = None
+    # Space separated keys of the attachments and embeds, see `snipeblobs`
+    blobs: str | None = None
 
     @classmethod
-    async def from_message(cls, message: discord.Message, /) -> DeleteSnipe:
+    def from_message(cls, message: discord.Message, /) -> DeleteSnipe:
         """Creates a DeleteSnipe from a given `discord.Message`.
 
+        This does not store the snipe, see `save`. The metadata of the message's attachments
+        and embeds is stored right away, deduplicated by `blob_store`.
+
         Parameters
         ----------
         message : discord.Message
@@ -83,25 +125,57 @@ class DeleteSnipe:
         """
         assert message.guild is not None
 
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                deleted_at = int(discord.utils.utcnow().timestamp())
-                sender_id = message.author.id
-                content = message.clean_content
-                guild_id = message.guild.id
-                channel_id = message.channel.id
-                message_reference_id = message.reference.message_id if message.reference is not None else None
+        snipe_id = next_snipe_id()
+        deleted_at = int(discord.utils.utcnow().timestamp())
+        return cls(
+            id=snipe_id,
+            deleted_at=deleted_at,
+            sender_id=message.author.id,
+            content=message.content,
+            guild_id=message.guild.id,
+            channel_id=message.channel.id,
+            message_reference_id=message.reference.message_id if message.reference is not None else None,
+            mention_names=mention_names(message),
+            blobs=blob_store.add(shard_for(message.guild.id), snipe_id, SnipeBlob.from_message(message), deleted_at),
+        )
+
+    def _row(self) -> tuple:
+        return (self.id, self.deleted_at, self.sender_id, encode_text(self.content), self.guild_id, self.channel_id, self.message_reference_id, self.mention_names, self.blobs)
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row, /) -> DeleteSnipe:
+        """Creates a DeleteSnipe from a database row."""
+        return cls(**decode_row(row, "content"))
+
+    def save(self) -> None:
+        """Stores this snipe in memory and queues it to be written to the database."""
+        snipe_store.add(self)
+        embed_cache.invalidate_channel(snipe_table.name, self.channel_id)
+
+        if PERSIST_SNIPES:
+            write_queue.put(shard_for(self.guild_id), INSERT_SQL.format(table=snipe_table.table_for(self.id)), self._row())
+
+    @staticmethod
+    def save_many(snipes: list[DeleteSnipe], /) -> None:
+        """Stores several snipes in memory and queues them to be written together.
+
+        The snipes are written with one `executemany` per window table in one transaction.
 
-                await cur.execute(f"""INSERT INTO deletesnipe
-                (deleted_at, sender_id, content, guild_id, channel_id, message_reference_id)
-                VALUES (?, ?, ?, ?, ?, ?) RETURNING *""", deleted_at, sender_id, content, guild_id, channel_id, message_reference_id)
-                res = await cur.fetchone()
-                await db.commit()
+        Parameters
+        ----------
+        snipes : list[DeleteSnipe]
+            The snipes to store, oldest first.
+        """
+        for snipe in snipes:
+            snipe_store.add(snipe)
+            embed_cache.invalidate_channel(snipe_table.name, snipe.channel_id)
 
-                return cls(**res)
+        if PERSIST_SNIPES:
+            for (shard, table), group in itertools.groupby(snipes, key=lambda s: (shard_for(s.guild_id), snipe_table.table_for(s.id))):
+                write_queue.put_many(shard, INSERT_SQL.format(table=table), [snipe._row() for snipe in group])
 
     @classmethod
-    async def get_in_channel(cls, channel_id: int, /, *, offset: int = 0) -> DeleteSnipe | None:
+    async def get_in_channel(cls, channel_id: int, /, *, guild_id: int, offset: int = 0) -> DeleteSnipe | None:
         """Gets a DeleteSnipe in a given channel at a given offset.
 
         This is ordered by deletion time.
@@ -110,6 +184,8 @@ class DeleteSnipe:
         ----------
         channel_id : int
             The channel to retrieve from
+        guild_id : int
+            The guild the channel is in
         offset : int, optional
             The number of entries back to check, by default 0
 
@@ -118,79 +194,118 @@ class DeleteSnipe:
         Self | None
             The DeleteSnipe if found, else None.
         """
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("SELECT * FROM deletesnipe WHERE channel_id = ? ORDER BY deleted_at DESC LIMIT 1 OFFSET ?", channel_id, offset)
-                res = await cur.fetchone()
+        snipe = snipe_store.get(channel_id, offset=offset)
+        if snipe is not None or not PERSIST_SNIPES:
+            return snipe
+
+        # Not held in memory, it may be older than what is.
+        return await cls._get_older(channel_id, guild_id, offset)
 
-                return cls(**res) if res is not None else None
+    @classmethod
+    async def _get_older(cls, channel_id: int, guild_id: int, offset: int, /) -> DeleteSnipe | None:
+        # The snipes held in memory are the newest in the database, so the search continues
+        # from the oldest of them instead of counting from the newest.
+        held, oldest = snipe_store.oldest(channel_id)
+        async for snipe in cls.iter_newest(guild_id=guild_id, channel_id=channel_id, before=oldest.cursor if oldest is not None else None):
+            if held == offset:
+                return snipe
+            held += 1
+        return None
 
     @classmethod
-    async def delete_one_in(cls, channel_id: int, /, *, offset: int = 0) -> int:
-        """Deletes a single database entry in given channel
+    async def iter_newest(cls, *, guild_id: int | None = None, channel_id: int | None = None, before: tuple[int, int] | None = None) -> AsyncIterator[DeleteSnipe]:
+        """Lazily yields the DeleteSnipes in a guild or channel, newest first.
 
         Parameters
         ----------
-        channel_id : int
-            The channel to remove in
-        offset : int, optional
-            The number of entries to delete back, by default 0
-
-        Returns
-        -------
-        int
-            The number of database entries removed.
+        guild_id : int | None, optional
+            The guild to get from, or the guild the channel is in, by default None
+        channel_id : int | None, optional
+            The channel to get from, by default None
+        before : tuple[int, int] | None, optional
+            Only yield snipes ordered before this `cursor`, by default None
         """
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("""DELETE FROM deletesnipe
-                WHERE channel_id = ? AND id IN
-                 (SELECT id FROM deletesnipe WHERE channel_id = ? ORDER BY deleted_at DESC LIMIT 1 OFFSET ?)""", channel_id, channel_id, offset)
-                await db.commit()
+        if not PERSIST_SNIPES:
+            for snipe in snipe_store.newest(guild_id=guild_id, channel_id=channel_id, before=before):
+                yield snipe
+            return
 
-                return cur.get_cursor().rowcount
+        shard = shard_for(guild_id) if guild_id is not None else None # Without a guild every shard is read
+        await write_queue.flush(shard) # Make sure queued snipes are visible
+
+        column, value = ("channel_id", channel_id) if channel_id is not None else ("guild_id", guild_id)
+        async for row in snipe_table.iter_newest(column, value, shard=shard, before=before): # type: ignore
+            yield cls.from_row(row)
 
     @classmethod
-    async def delete_all_in(cls, channel_id: int, /) -> int:
-        """Removes all items from database with given channel id.
+    async def delete_one_in(cls, channel_id: int, /, *, guild_id: int, offset: int = 0) -> int:
+        """Deletes a single entry in given channel
 
         Parameters
         ----------
         channel_id : int
-            The channel id to clear
+            The channel to remove in
+        guild_id : int
+            The guild the channel is in
+        offset : int, optional
+            The number of entries to delete back, by default 0
 
         Returns
         -------
         int
-            The number of removed database entries
+            The number of entries removed.
         """
-        async with asqlite.connect(DB_FILENAME) as db:
+        snipe = snipe_store.remove_at(channel_id, offset=offset)
+        if snipe is not None:
+            embed_cache.invalidate_channel(snipe_table.name, channel_id)
+            if PERSIST_SNIPES:
+                write_queue.put(shard_for(snipe.guild_id), f"DELETE FROM {snipe_table.table_for(snipe.id)} WHERE id = ?", (snipe.id,))
+            return 1
+
+        if not PERSIST_SNIPES:
+            return 0
+
+        snipe = await cls._get_older(channel_id, guild_id, offset)
+        if snipe is None:
+            return 0
+
+        async with acquire(shard_for(guild_id)) as db:
             async with db.cursor() as cur:
-                await cur.execute("DELETE FROM deletesnipe WHERE channel_id = ?", channel_id)
-                await db.commit()
+                await cur.execute(f"DELETE FROM {snipe_table.table_for(snipe.id)} WHERE id = ?", snipe.id)
+                num_deleted = cur.get_cursor().rowcount
 
-                return cur.get_cursor().rowcount
+        # Invalidated once deleted, so a snipe rendered meanwhile isn't held.
+        embed_cache.invalidate_channel(snipe_table.name, channel_id)
+        return num_deleted
 
-    @staticmethod
-    async def clear_all_for_user(user_id: int, /) -> int:
-        """Removes all snipes for given user_id
+    @classmethod
+    async def delete_all_in(cls, channel_id: int, /, *, guild_id: int) -> int:
+        """Removes all items with given channel id.
 
         Parameters
         ----------
-        user_id : int
-            The user_id to clear.
+        channel_id : int
+            The channel id to clear
+        guild_id : int
+            The guild the channel is in
 
         Returns
         -------
         int
-            The number of removed database entries.
+            The number of removed entries
         """
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("DELETE FROM deletesnipe WHERE sender_id = ?", user_id)
-                await db.commit()
+        num_deleted = snipe_store.clear_channel(channel_id)
+        if not PERSIST_SNIPES:
+            embed_cache.invalidate_channel(snipe_table.name, channel_id)
+            return num_deleted
+
+        shard = shard_for(guild_id)
+        await write_queue.flush(shard) # Make sure queued snipes are visible
 
-                return cur.get_cursor().rowcount
+        # Everything held in memory is also in the database
+        num_deleted = await snipe_table.delete_where("channel_id = ?", channel_id, shard=shard)
+        embed_cache.invalidate_channel(snipe_table.name, channel_id)
+        return num_deleted
 
     @property
     def ref_jump_url(self) -> str | None:
@@ -202,6 +317,15 @@ class DeleteSnipe:
     def has_reference(self) -> bool:
         return self.message_reference_id is not None
 
+    @property
+    def cursor(self) -> tuple[int, int]:
+        """The `(time, id)` this snipe is ordered by, newest first."""
+        return (self.deleted_at, self.id)
+
+    def to_dict(self) -> dict[str, Any]:
+        """This snipe as a JSON serializable dict, as included in data exports."""
+        return asdict(self)
+
     @property
     def timestamp(self) -> datetime.datetime:
         """Returns a UTC datetime representing time of deletion"""
@@ -220,67 +344,114 @@ class DeleteSnipe:
         discord.Embed
             The generated Embed
         """
-        author = ctx.guild.get_member(self.sender_id) or await ctx.bot.fetch_member(self.sender_id)
+        author = await author_cache.resolve(ctx.bot, ctx.guild, self.sender_id)
+
+        embed = discord.Embed(description=clean_content(self.content, ctx.guild, self.mention_names), color=discord.Color.blue())
+        set_embed_author(embed, author, self.sender_id)
 
-        embed = discord.Embed(description=self.content, color=discord.Color.blue())
-        embed.set_author(name=author, icon_url=author.display_avatar.url)
+        blobs = await blob_store.get_many(shard_for(self.guild_id), self.blobs)
+        if blobs:
+            embed.add_field(name="Attachments", value=describe_all(blobs), inline=False)
         embed.timestamp = self.timestamp
 
         return embed
 
+    def summary(self, guild: discord.Guild, /) -> str:
+        """A one line description of this snipe for timelines.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild the snipe is being shown in.
+
+        Returns
+        -------
+        str
+            The line.
+        """
+        content = clean_content(self.content, guild, self.mention_names) or "*No content*"
+        attached = f" \N{PAPERCLIP}{len(self.blobs.split())}" if self.blobs else ""
+        return f"\N{WASTEBASKET} <t:{self.deleted_at}:T> <#{self.channel_id}> <@{self.sender_id}>: {shorten(content)}{attached}"
+
+snipe_store: SnipeStore[DeleteSnipe] = SnipeStore(user_attr="sender_id", time_attr="deleted_at")
+snipe_table = BucketedTable("deletesnipe", MIGRATIONS, time_column="deleted_at", window_seconds=TTL_MINUTES * 60)
+
 
 class MessageSnipeCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
     async def cog_load(self) -> None:
-        async with asqlite.connect(DB_FILENAME) as db:
-            await db.executescript(SETUP_SQL)
-        self.delete_snipe_db_purge.start()
+        await open_pool()
+        if PERSIST_SNIPES:
+            await snipe_table.load()
+        await optout_cache.load()
+        await policy_cache.load()
+        await blob_store.load(keep_seconds=TTL_MINUTES * 60 * 2)
+        open_queue()
+        purge_coordinator.register(snipe_table, snipe_store)
+        user_data.register(DeleteSnipe, snipe_table, snipe_store, blobs_attr="blobs")
 
     async def cog_unload(self) -> None:
-        self.delete_snipe_db_purge.cancel()
-
-    @commands.Cog.listener()
-    async def on_optout_status_change(self, user: discord.User, _: bool) -> None:
-        """Custom event handler for opt out status changes
-
-        Parameters
-        ----------
-        user : discord.User
-            The user whose opt out status changed
-        _ : bool
-            The new opt out status
-        """
-        num_deleted = await DeleteSnipe.clear_all_for_user(user.id)
-        _logger.info("Processed deletesnipe clear for %s, removed %d deletesnipes.", str(user), num_deleted)
+        user_data.unregister(snipe_table)
+        await purge_coordinator.unregister(snipe_table)
+        await close_queue()
+        await close_pool()
 
     @commands.Cog.listener()
     async def on_message_delete(self, msg: discord.Message) -> None:
         if msg.guild is None: return
+        if not policy_cache.allows(msg.guild.id, SnipeCategory.DELETE): return
         if msg.author.bot: return
         if await BotUser.is_opt_out(msg.author.id): return
 
         _logger.debug("Processing message delete in channel with id %d", msg.channel.id)
-        await DeleteSnipe.from_message(msg)
+        author_cache.put(msg.author)
+        DeleteSnipe.from_message(msg).save()
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent) -> None:
+        if payload.guild_id is None: return
+        if not policy_cache.allows(payload.guild_id, SnipeCategory.DELETE): return
+
+        # Only messages in the cache can be sniped, the rest are just ids.
+        messages = [msg for msg in payload.cached_messages if not msg.author.bot]
+        if not messages: return
+
+        opted_out = await BotUser.opted_out_among(msg.author.id for msg in messages)
+        messages = [msg for msg in sorted(messages, key=lambda m: m.id) if msg.author.id not in opted_out]
+        for msg in messages:
+            author_cache.put(msg.author)
+        snipes = [DeleteSnipe.from_message(msg) for msg in messages]
+
+        _logger.debug("Processing bulk delete of %d messages in channel with id %d", len(snipes), payload.channel_id)
+        DeleteSnipe.save_many(snipes)
 
     @commands.command()
     @commands.guild_only()
     async def snipe(self, ctx: commands.Context, num_back: int = 0) -> None:
         """Snipes a deleted message in current channel."""
-        snipe = await DeleteSnipe.get_in_channel(ctx.channel.id, offset=num_back)
+        # Read before the lookup, which may wait on the database or the API.
+        latest_id, generation = snipe_store.latest_id(ctx.channel.id), embed_cache.generation_of(snipe_table.name, ctx.channel.id)
 
-        if snipe:
-            await ctx.send(embed=await snipe.embed(ctx))
-        else:
-            await ctx.send("No snipe found.")
+        embed = embed_cache.get(snipe_table.name, ctx.channel.id, num_back, latest_id)
+        if embed is None:
+            snipe = await DeleteSnipe.get_in_channel(ctx.channel.id, guild_id=ctx.guild.id, offset=num_back)
+            if not snipe:
+                await ctx.send("No snipe found.")
+                return
+
+            embed = await snipe.embed(ctx)
+            embed_cache.put(snipe_table.name, ctx.channel.id, num_back, latest_id, embed, generation=generation)
+
+        await ctx.send(embed=embed)
 
     @commands.command()
     @commands.guild_only()
     @commands.has_permissions(manage_messages=True)
     async def rmsnipe(self, ctx: commands.Context, num_back: int = 0) -> None:
         """Removes a snipe in current channel."""
-        num_deleted = await DeleteSnipe.delete_one_in(ctx.channel.id, offset=num_back)
+        num_deleted = await DeleteSnipe.delete_one_in(ctx.channel.id, guild_id=ctx.guild.id, offset=num_back)
 
         if num_deleted > 0:
             await ctx.send(f"Deleted snipe at index {num_back} in {ctx.channel.mention}")
@@ -294,26 +465,13 @@ class MessageSnipeCog(commands.Cog):
         """Removes all snipes in a channel. Defaults to current channel."""
         channel = channel or ctx.channel
 
-        num_deleted = await DeleteSnipe.delete_all_in(channel.id)
+        num_deleted = await DeleteSnipe.delete_all_in(channel.id, guild_id=ctx.guild.id)
 
         if num_deleted > 0:
             await ctx.send(f"Deleted {num_deleted} snipes in {channel.mention}")
         else:
             await ctx.send(f"I couldn't find anything to delete in {channel.mention}")
 
-    @tasks.loop(minutes=TTL_MINUTES)
-    async def delete_snipe_db_purge(self):
-        oldest_time = discord.utils.utcnow() - datetime.timedelta(minutes=TTL_MINUTES)
-        oldest_timestamp = int(oldest_time.timestamp())
-
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("DELETE FROM deletesnipe WHERE deleted_at < ?", oldest_timestamp)
-                await db.commit()
-
-                deleted = cur.get_cursor().rowcount
-                _logger.info("Performing periodic deletesnipe purge. %d deletesnipes removed.", deleted)
-
 
 async def setup(bot: commands.Bot):
     _logger.info("Loading cog MessageSnipeCog")
@@ -26,19 +26,39 @@ This module emits a custom event: "on_optout_status_change" with the following p
     - user (User | Member) -> The user that changed their status
     - new_status (bool) -> The user's new status.
 
+Each snipe type registers with `user_data` when its cog loads, so a user's snipes of every
+type can be exported or erased together, along with the attachment and embed metadata they refer to.
+
 This module uses the following third party libs installed via pip: asqlite (https://github.com/Rapptz/asqlite)
 """
 
+import asyncio
+import gzip
+import json
 import logging
+import sqlite3
+import tempfile
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
+from typing import Any, Iterable
 
-import asqlite
+import discord
 from discord.ext import commands
 
-from .snipescommon import DB_FILENAME
+from .authorcache import author_cache
+from .embedcache import embed_cache
+from .snipeblobs import blob_store
+from .snipequeue import write_queue
+from .snipescommon import PERSIST_SNIPES, SHARD_COUNT, BucketedTable, acquire, close_pool, is_missing_table, open_pool, shard_for
+from .snipestore import SnipeStore
 
 _logger = logging.getLogger(__name__)
 
+# Exports up to this size are built in memory, larger ones spill to a temporary file.
+EXPORT_SPOOL_BYTES = 1024 * 1024
+# Largest compressed export that is sent, the attachment limit for DMs.
+EXPORT_MAX_BYTES = 8 * 1024 * 1024
+
 BOTUSER_SETUP_SQL = """
 CREATE TABLE IF NOT EXISTS botuser (
     id BIGINT PRIMARY KEY,
@@ -68,13 +88,248 @@ def not_opted_out_only():
         The user is opted out.
     """
     async def predicate(ctx: commands.Context):
-        is_opted_out = await BotUser.is_opted_out(ctx.author)
+        is_opted_out = await BotUser.is_opt_out(ctx.author.id)
         if is_opted_out:
             raise NotOptedInError("User must be opted in to use this command.")
         return True
     return commands.check(predicate)
 
 
+class OptOutCache:
+    """In memory set of opted out user ids, used by `BotUser.is_opt_out` once loaded.
+
+    Opted out users are a small minority, so the set stays small and
+    the common negative check never touches the database.
+    """
+    def __init__(self) -> None:
+        self.ids: set[int] | None = None
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.ids is not None
+
+    async def load(self) -> None:
+        """Loads all opted out user ids from the database, if not loaded already."""
+        if self.is_loaded:
+            return
+
+        async with acquire() as db:
+            await db.execute(BOTUSER_SETUP_SQL)
+            rows = await db.fetchall("SELECT id FROM botuser WHERE opted_out")
+
+        self.ids = {row["id"] for row in rows}
+        _logger.info("Loaded opt out cache with %d opted out users.", len(self.ids))
+
+    def set(self, user_id: int, opted_out: bool, /) -> None:
+        """Updates the status of a user, if loaded."""
+        if self.ids is None:
+            return
+
+        if opted_out:
+            self.ids.add(user_id)
+        else:
+            self.ids.discard(user_id)
+
+    def stats(self) -> dict[str, int]:
+        """Returns the cache size and hit/miss counters."""
+        return {
+            "size": len(self.ids) if self.ids is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+optout_cache = OptOutCache()
+
+
+class UserDataRegistry:
+    """The snipe types that store data about users, for exporting and erasing it.
+
+    Snipe cogs register their model, window table and memory store on load. The user a
+    snipe belongs to is read from the store's `user_attr`, which is also its column name.
+    """
+    def __init__(self) -> None:
+        self._registered: dict[str, tuple[Any, BucketedTable, SnipeStore[Any], str | None]] = {}
+
+        # Counters
+        self.exports = 0
+        self.exported_rows = 0
+        self.erases = 0
+        self.erased_rows = 0
+        self.erased_blobs = 0
+
+    def stats(self) -> dict[str, int]:
+        """Returns the registered snipe types and export/erase counters."""
+        return {
+            "types": len(self._registered),
+            "exports": self.exports,
+            "exported_rows": self.exported_rows,
+            "erases": self.erases,
+            "erased_rows": self.erased_rows,
+            "erased_blobs": self.erased_blobs,
+        }
+
+    def register(self, model: Any, table: BucketedTable, store: SnipeStore[Any], /, *, blobs_attr: str | None = None) -> None:
+        """Registers a snipe type.
+
+        Parameters
+        ----------
+        model : Any
+            The snipe class, with a `from_row` classmethod and a `to_dict` method.
+        table : BucketedTable
+            The window table the snipe type is persisted to.
+        store : SnipeStore[Any]
+            The memory store the snipe type is held in.
+        blobs_attr : str | None, optional
+            The attribute holding the keys of the snipe's blobs, which is also its column
+            name, see `snipeblobs`. By default None, for snipe types without any.
+        """
+        self._registered[table.name] = (model, table, store, blobs_attr)
+
+    def unregister(self, table: BucketedTable, /) -> None:
+        """Stops exporting and erasing a snipe type."""
+        self._registered.pop(table.name, None)
+
+    async def export(self, user_id: int, /) -> AsyncIterator[str]:
+        """Lazily yields everything stored about a user as NDJSON, one snipe per line.
+
+        Each line is the snipe's `to_dict` along with its `type`, the table name of the snipe type,
+        and for snipe types with blobs their metadata as `attachments`. Rows are read a batch
+        at a time, so memory use does not grow with the number of snipes.
+
+        Parameters
+        ----------
+        user_id : int
+            The user to export.
+        """
+        self.exports += 1
+        if PERSIST_SNIPES:
+            await write_queue.flush() # Make sure queued snipes are included
+
+        for name, (model, table, store, blobs_attr) in list(self._registered.items()):
+            if PERSIST_SNIPES:
+                snipes = (model.from_row(row) async for row in table.iter_matching(store.user_attr, user_id))
+            else:
+                snipes = _aiter(store.of_user(user_id))
+
+            async for snipe in snipes:
+                data = {"type": name, **snipe.to_dict()}
+                if blobs_attr is not None:
+                    blobs = await blob_store.get_many(shard_for(snipe.guild_id), getattr(snipe, blobs_attr))
+                    data["attachments"] = [blob.to_dict() for blob in blobs]
+
+                self.exported_rows += 1
+                yield json.dumps(data) + "\n"
+
+    async def erase(self, user_id: int, /) -> dict[str, int]:
+        """Deletes everything stored about a user, from memory and every shard.
+
+        Every snipe type is deleted from in a single transaction per shard, with all shards at once.
+        The blobs the user's snipes refer to are deleted with them, unless another snipe still
+        refers to the same one, as with a link posted by several users.
+
+        Parameters
+        ----------
+        user_id : int
+            The user to erase.
+
+        Returns
+        -------
+        dict[str, int]
+            The number of snipes deleted, keyed by snipe type.
+        """
+        self.erases += 1
+        registered = list(self._registered.values())
+        if not PERSIST_SNIPES:
+            counts = self._erase_held(user_id, registered)
+            embed_cache.clear()
+            self.erased_rows += sum(counts.values())
+            return counts
+
+        for _, _, store, _ in registered:
+            store.clear_user(user_id)
+        await write_queue.flush() # Make sure queued snipes are deleted too
+
+        async def erase_in(shard: int) -> dict[str, int]:
+            deleted = dict.fromkeys((table.name for _, table, _, _ in registered), 0)
+            user_refs: list[tuple[str, int]] = []
+            erased: set[str] = set()
+            async with acquire(shard) as db:
+                async with db.transaction():
+                    for _, table, store, blobs_attr in registered:
+                        for name in table.tables:
+                            try:
+                                if blobs_attr is not None:
+                                    rows = await db.fetchall(f"SELECT id, {blobs_attr} FROM {name} WHERE {store.user_attr} = ? AND {blobs_attr} IS NOT NULL", user_id)
+                                    user_refs.extend((key, row["id"]) for row in rows for key in _keys(row[blobs_attr]))
+
+                                cur = await db.execute(f"DELETE FROM {name} WHERE {store.user_attr} = ?", user_id)
+                            except sqlite3.OperationalError as e:
+                                if is_missing_table(e):
+                                    continue # Dropped as expired, nothing left to erase
+                                raise
+                            deleted[table.name] += cur.get_cursor().rowcount
+
+                    # Blobs are only deleted once no other snipe refers to them, as with a link posted by several users.
+                    await db.executemany("DELETE FROM snipeblob_ref WHERE key = ? AND snipe_id = ?", user_refs)
+                    for key in {key for key, _ in user_refs}:
+                        cur = await db.execute("DELETE FROM snipeblob WHERE key = ? AND NOT EXISTS (SELECT 1 FROM snipeblob_ref WHERE key = ?)", key, key)
+                        if cur.get_cursor().rowcount:
+                            erased.add(key)
+
+            self.erased_blobs += len(erased)
+            blob_store.forget(shard, erased)
+            return deleted
+
+        # Everything held in memory is also in the database, so only the database is counted.
+        counts = dict.fromkeys((table.name for _, table, _, _ in registered), 0)
+        for deleted in await asyncio.gather(*(erase_in(shard) for shard in range(SHARD_COUNT))):
+            for name, count in deleted.items():
+                counts[name] += count
+
+        # Removing a user's snipes moves every later offset in their channels, so nothing held is kept.
+        # Only once deleted, so nothing rendered meanwhile is held either.
+        embed_cache.clear()
+        self.erased_rows += sum(counts.values())
+        return counts
+
+    def _erase_held(self, user_id: int, registered: list[tuple[Any, BucketedTable, SnipeStore[Any], str | None]], /) -> dict[str, int]:
+        # Without persistence, blobs only exist in memory too.
+        with_blobs = [(store, blobs_attr) for _, _, store, blobs_attr in registered if blobs_attr is not None]
+
+        user_blobs: dict[int, set[str]] = {}
+        for store, blobs_attr in with_blobs:
+            for snipe in store.of_user(user_id):
+                user_blobs.setdefault(shard_for(snipe.guild_id), set()).update(_keys(getattr(snipe, blobs_attr)))
+
+        counts = {table.name: store.clear_user(user_id) for _, table, store, _ in registered}
+
+        for store, blobs_attr in with_blobs:
+            for snipe in store:
+                user_blobs.get(shard_for(snipe.guild_id), set()).difference_update(_keys(getattr(snipe, blobs_attr)))
+        for shard, keys in user_blobs.items():
+            blob_store.forget(shard, keys)
+            self.erased_blobs += len(keys)
+
+        return counts
+
+
+def _keys(blobs: str | None, /) -> list[str]:
+    return blobs.split() if blobs else []
+
+
+async def _aiter(items: Iterable[Any], /) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+
+user_data = UserDataRegistry()
+
+
 @dataclass(slots=True)
 class BotUser:
     id: int
@@ -96,11 +351,13 @@ class BotUser:
         Self
             The created or updated BotUser
         """
-        async with asqlite.connect(DB_FILENAME) as db:
+        async with acquire() as db:
             async with db.cursor() as cur:
                 await cur.execute("INSERT INTO botuser VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET opted_out = ? RETURNING *", id, opted_out, opted_out)
                 res = await cur.fetchone()
                 await db.commit()
+
+                optout_cache.set(id, bool(res['opted_out']))
                 return cls(**res)
 
     @classmethod
@@ -117,7 +374,7 @@ class BotUser:
         Self | None
             The BotUser if found, else None.
         """
-        async with asqlite.connect(DB_FILENAME) as db:
+        async with acquire() as db:
             async with db.cursor() as cur:
                 await cur.execute("SELECT * FROM botuser WHERE id = ?", id)
                 res = await cur.fetchone()
@@ -138,16 +395,22 @@ class BotUser:
         int
             The number of removed entries.
         """
-        async with asqlite.connect(DB_FILENAME) as db:
+        async with acquire() as db:
             async with db.cursor() as cur:
                 await cur.execute("DELETE FROM botuser WHERE id = ?", id)
                 await db.commit()
 
+                optout_cache.set(id, False)
                 return cur.get_cursor().rowcount
 
     @staticmethod
     async def is_opt_out(user_id: int, /) -> bool:
-        async with asqlite.connect(DB_FILENAME) as db:
+        if optout_cache.ids is not None:
+            optout_cache.hits += 1
+            return user_id in optout_cache.ids
+
+        optout_cache.misses += 1
+        async with acquire() as db:
             async with db.cursor() as cur:
                 await cur.execute("SELECT * FROM botuser WHERE id = ?", user_id)
                 res = await cur.fetchone()
@@ -156,14 +419,45 @@ class BotUser:
                     return bool(res['opted_out'])
                 return False
 
+    @staticmethod
+    async def opted_out_among(user_ids: Iterable[int], /) -> set[int]:
+        """Gets which of the given users are opted out with a single lookup.
+
+        Parameters
+        ----------
+        user_ids : Iterable[int]
+            The user ids to check
+
+        Returns
+        -------
+        set[int]
+            The ids of the users that are opted out.
+        """
+        user_ids = set(user_ids)
+        if not user_ids:
+            return set()
+
+        if optout_cache.ids is not None:
+            optout_cache.hits += 1
+            return user_ids & optout_cache.ids
+
+        optout_cache.misses += 1
+        placeholders = ", ".join("?" * len(user_ids))
+        async with acquire() as db:
+            rows = await db.fetchall(f"SELECT id FROM botuser WHERE opted_out AND id IN ({placeholders})", *user_ids)
+            return {row["id"] for row in rows}
+
     @staticmethod
     async def toggle(user_id: int, /) -> bool:
-        async with asqlite.connect(DB_FILENAME) as db:
+        async with acquire() as db:
             async with db.cursor() as cur:
                 await cur.execute("INSERT INTO botuser VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET opted_out = NOT opted_out RETURNING *", user_id, True)
                 res = await cur.fetchone()
                 await db.commit()
-                return bool(res['opted_out'])
+
+                opted_out = bool(res['opted_out'])
+                optout_cache.set(user_id, opted_out)
+                return opted_out
 
 
 class OptOutCog(commands.Cog):
@@ -171,8 +465,23 @@ class OptOutCog(commands.Cog):
         self.bot = bot
 
     async def cog_load(self) -> None:
-        async with asqlite.connect(DB_FILENAME) as db:
+        await open_pool()
+        async with acquire() as db:
             await db.execute(BOTUSER_SETUP_SQL)
+        await optout_cache.load()
+
+    async def cog_unload(self) -> None:
+        await close_pool()
+
+    @commands.Cog.listener()
+    async def on_optout_status_change(self, user: discord.User, new_status: bool) -> None:
+        optout_cache.set(user.id, new_status)
+        if not new_status:
+            return
+
+        author_cache.forget(user.id)
+        counts = await user_data.erase(user.id)
+        _logger.info("Erased snipes of %s after opting out: %s.", str(user), ", ".join(f"{count} {name}s" for name, count in counts.items()))
 
     @commands.command()
     @commands.guild_only()
@@ -186,6 +495,34 @@ class OptOutCog(commands.Cog):
         else:
             await ctx.reply("You're opted back in.")
 
+    @commands.command()
+    @commands.cooldown(1, 600, commands.BucketType.user) # 1 per 10 minutes per user
+    async def mydata(self, ctx: commands.Context) -> None:
+        """DMs you a file of the snipes stored about you."""
+        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as fp:
+            lines = 0
+            with gzip.GzipFile(fileobj=fp, mode="wb") as gz:
+                async for line in user_data.export(ctx.author.id):
+                    gz.write(line.encode())
+                    lines += 1
+
+            if fp.tell() > EXPORT_MAX_BYTES:
+                await ctx.reply("Your data is too large to send, please contact the bot owner.")
+                return
+
+            fp.seek(0)
+            try:
+                await ctx.author.send(
+                    f"There are {lines} snipes stored about you, one JSON object per line.",
+                    file=discord.File(fp, filename=f"snipes-{ctx.author.id}.ndjson.gz"),  # type: ignore
+                )
+            except discord.Forbidden:
+                await ctx.reply("I couldn't DM you, check your privacy settings.")
+                return
+
+        if ctx.guild is not None:
+            await ctx.reply("I've sent you a DM with your data.")
+
 
 async def setup(bot: commands.Bot):
     _logger.info("Loading cog OptOutCog")
@@ -25,27 +25,44 @@ from __future__ import annotations
 This module uses the following third party libs installed via pip: asqlite (https://github.com/Rapptz/asqlite)
 """
 
+import asyncio
 import datetime
+import itertools
 import logging
-from dataclasses import dataclass
+import sqlite3
+from collections.abc import AsyncIterator
+from dataclasses import asdict, dataclass
+from enum import IntEnum
+from typing import Any
 
-import asqlite
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 # If not using all snipe categories, you'll need to bring these items into this file,
-# along with making sure the BotUser table is created and handling deleting opted out users data
-# from the database (the custom event won't work unless you maintain that logic.)
-from .optout import BotUser
-from .snipescommon import DB_FILENAME
+# along with making sure the BotUser table is created. Opted out users' data is erased by
+# OptOutCog for every snipe type registered with `user_data`, keep that registration.
+from .authorcache import author_cache, set_embed_author
+from .embedcache import embed_cache
+from .optout import BotUser, optout_cache, user_data
+from .snipepolicy import SnipeCategory, policy_cache
+from .snipepurge import purge_coordinator
+from .snipequeue import close_queue, open_queue, write_queue
+from .snipescommon import PERSIST_SNIPES, BucketedTable, acquire, close_pool, next_snipe_id, open_pool, shard_for
+from .snipestore import SnipeStore
 
 _logger = logging.getLogger(__name__)
 
 # Maximum age will be TTL_MINUTES * 2
 TTL_MINUTES = 5
 
+# Reaction removals are held this long and then recorded together, so a storm of removals is
+# checked for opt-outs and queued as one batch, with repeat removals of the same emoji by the
+# same user on the same message recorded once. Clears are held with them, so everything is
+# recorded in the order it happened. Set to 0 to record each removal as it happens.
+STORM_WINDOW_MS = 500
+
 SETUP_SQL = """
-CREATE TABLE IF NOT EXISTS reactionsnipe (
+CREATE TABLE IF NOT EXISTS {table} (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     removed_at BIGINT NOT NULL,
     user_id BIGINT NOT NULL,
@@ -57,22 +74,102 @@ CREATE TABLE IF NOT EXISTS reactionsnipe (
 )
 """
 
+# Applied in order by `migrate` to every window table, `{table}` is replaced with its name.
+# Never edit or reorder these, only append.
+MIGRATIONS = [
+    SETUP_SQL,
+    # Lookups by channel, the TTL purge and clearing a user's snipes
+    """
+    CREATE INDEX IF NOT EXISTS {table}_channel_idx ON {table} (channel_id, removed_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS {table}_removed_idx ON {table} (removed_at);
+    CREATE INDEX IF NOT EXISTS {table}_user_idx ON {table} (user_id)
+    """,
+    # Expiry drops whole window tables, nothing deletes by time anymore
+    "DROP INDEX IF EXISTS {table}_removed_idx",
+    # Guild wide timelines
+    "CREATE INDEX IF NOT EXISTS {table}_guild_idx ON {table} (guild_id, removed_at DESC, id DESC)",
+    # Integer message ids, and custom emojis as an id and animated flag instead of their URL.
+    # Column types can't be altered, so the table is rebuilt. Emoji URLs are `.../emojis/<id>.<png|gif>`.
+    """
+    CREATE TABLE {table}_rebuild (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        removed_at BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        message_id BIGINT NULL,
+        guild_id BIGINT NOT NULL,
+        channel_id BIGINT NOT NULL,
+        unicode_codepoint TEXT NULL,
+        emoji_id BIGINT NULL,
+        emoji_animated BOOLEAN NOT NULL DEFAULT 0
+    );
+    INSERT INTO {table}_rebuild
+    SELECT id, removed_at, user_id, CAST(message_id AS INTEGER), guild_id, channel_id, unicode_codepoint,
+        CAST(substr(emoji_url, instr(emoji_url, '/emojis/') + 8) AS INTEGER), COALESCE(emoji_url LIKE '%.gif%', 0)
+    FROM {table};
+    DROP TABLE {table};
+    ALTER TABLE {table}_rebuild RENAME TO {table};
+    CREATE INDEX {table}_channel_idx ON {table} (channel_id, removed_at DESC, id DESC);
+    CREATE INDEX {table}_user_idx ON {table} (user_id);
+    CREATE INDEX {table}_guild_idx ON {table} (guild_id, removed_at DESC, id DESC)
+    """,
+    # Clears of all reactions or of one emoji are recorded once, with no user, see `RemovalKind`.
+    """
+    CREATE TABLE {table}_rebuild (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        removed_at BIGINT NOT NULL,
+        user_id BIGINT NULL,
+        message_id BIGINT NULL,
+        guild_id BIGINT NOT NULL,
+        channel_id BIGINT NOT NULL,
+        unicode_codepoint TEXT NULL,
+        emoji_id BIGINT NULL,
+        emoji_animated BOOLEAN NOT NULL DEFAULT 0,
+        kind INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT INTO {table}_rebuild SELECT *, 0 FROM {table};
+    DROP TABLE {table};
+    ALTER TABLE {table}_rebuild RENAME TO {table};
+    CREATE INDEX {table}_channel_idx ON {table} (channel_id, removed_at DESC, id DESC);
+    CREATE INDEX {table}_user_idx ON {table} (user_id);
+    CREATE INDEX {table}_guild_idx ON {table} (guild_id, removed_at DESC, id DESC)
+    """,
+]
+
+INSERT_SQL = """INSERT INTO {table}
+(id, removed_at, user_id, message_id, guild_id, channel_id, unicode_codepoint, emoji_id, emoji_animated, kind)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+class RemovalKind(IntEnum):
+    """How reactions were removed."""
+    # A user removed their reaction
+    REMOVE = 0
+    # Every reaction was cleared from the message, usually by a moderator
+    CLEAR = 1
+    # Every reaction of one emoji was cleared from the message
+    CLEAR_EMOJI = 2
+
+
 @dataclass(slots=True)
 class ReactionSnipe:
     """Represents a deleted Discord Message"""
     id: int
     removed_at: int
-    user_id: int
+    user_id: int | None
     message_id: int
     guild_id: int
     channel_id: int
-    unicode_codepoint: str
-    emoji_url: str
+    unicode_codepoint: str | None
+    emoji_id: int | None
+    emoji_animated: bool = False
+    kind: RemovalKind = RemovalKind.REMOVE
 
     @classmethod
-    async def from_payload(cls, payload: discord.RawReactionActionEvent, /) -> ReactionSnipe:
+    def from_payload(cls, payload: discord.RawReactionActionEvent, /) -> ReactionSnipe:
         """Creates a ReactionSnipe from a given `discord.RawReactionActionEvent`.
 
+        This does not store the snipe, see `save`.
+
         Parameters
         ----------
         payload : discord.RawReactionActionEvent
@@ -85,28 +182,90 @@ class ReactionSnipe:
         """
         assert payload.guild_id is not None
 
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                removed_at = int(discord.utils.utcnow().timestamp())
-                user_id = payload.user_id
-                message_id = payload.message_id
-                guild_id = payload.guild_id
-                channel_id = payload.channel_id
+        return cls(
+            id=next_snipe_id(),
+            removed_at=int(discord.utils.utcnow().timestamp()),
+            user_id=payload.user_id,
+            message_id=payload.message_id,
+            guild_id=payload.guild_id,
+            channel_id=payload.channel_id,
+            unicode_codepoint=payload.emoji.name if payload.emoji.is_unicode_emoji() else None,
+            emoji_id=payload.emoji.id,
+            emoji_animated=payload.emoji.animated,
+        )
+
+    @classmethod
+    def from_clear(cls, payload: discord.RawReactionClearEvent | discord.RawReactionClearEmojiEvent, /) -> ReactionSnipe:
+        """Creates a single ReactionSnipe for reactions being cleared from a message.
 
-                unicode_codepoint = payload.emoji.name if payload.emoji.is_unicode_emoji() else None
-                emoji_url = payload.emoji.url if payload.emoji.is_custom_emoji() else None
+        This does not store the snipe, see `save`.
 
+        Parameters
+        ----------
+        payload : discord.RawReactionClearEvent | discord.RawReactionClearEmojiEvent
+            The payload to create from
 
-                await cur.execute(f"""INSERT INTO reactionsnipe
-                (removed_at, user_id, message_id, guild_id, channel_id, unicode_codepoint, emoji_url)
-                VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING *""", removed_at, user_id, message_id, guild_id, channel_id, unicode_codepoint, emoji_url)
-                res = await cur.fetchone()
-                await db.commit()
+        Returns
+        -------
+        Self
+            The generated ReactionSnipe, with no user.
+        """
+        assert payload.guild_id is not None
 
-                return cls(**res)
+        emoji = payload.emoji if isinstance(payload, discord.RawReactionClearEmojiEvent) else None
+        return cls(
+            id=next_snipe_id(),
+            removed_at=int(discord.utils.utcnow().timestamp()),
+            user_id=None,
+            message_id=payload.message_id,
+            guild_id=payload.guild_id,
+            channel_id=payload.channel_id,
+            unicode_codepoint=emoji.name if emoji is not None and emoji.is_unicode_emoji() else None,
+            emoji_id=emoji.id if emoji is not None else None,
+            emoji_animated=emoji.animated if emoji is not None else False,
+            kind=RemovalKind.CLEAR if emoji is None else RemovalKind.CLEAR_EMOJI,
+        )
 
     @classmethod
-    async def get_in_channel(cls, channel_id: int, /, *, offset: int = 0) -> ReactionSnipe | None:
+    def from_row(cls, row: sqlite3.Row, /) -> ReactionSnipe:
+        """Creates a ReactionSnipe from a database row."""
+        data = dict(zip(row.keys(), row))
+        data["emoji_animated"] = bool(data["emoji_animated"])
+        data["kind"] = RemovalKind(data["kind"])
+        return cls(**data)
+
+    def _row(self) -> tuple:
+        return (self.id, self.removed_at, self.user_id, self.message_id, self.guild_id, self.channel_id, self.unicode_codepoint, self.emoji_id, self.emoji_animated, int(self.kind))
+
+    def save(self) -> None:
+        """Stores this snipe in memory and queues it to be written to the database."""
+        snipe_store.add(self)
+        embed_cache.invalidate_channel(snipe_table.name, self.channel_id)
+
+        if PERSIST_SNIPES:
+            write_queue.put(shard_for(self.guild_id), INSERT_SQL.format(table=snipe_table.table_for(self.id)), self._row())
+
+    @staticmethod
+    def save_many(snipes: list[ReactionSnipe], /) -> None:
+        """Stores several snipes in memory and queues them to be written together.
+
+        Parameters
+        ----------
+        snipes : list[ReactionSnipe]
+            The snipes to store, oldest first.
+        """
+        for snipe in snipes:
+            snipe_store.add(snipe)
+            embed_cache.invalidate_channel(snipe_table.name, snipe.channel_id)
+
+        if PERSIST_SNIPES:
+            # Ordered by shard first so each shard and window table is one `executemany`.
+            ordered = sorted(snipes, key=lambda s: (shard_for(s.guild_id), s.id))
+            for (shard, table), group in itertools.groupby(ordered, key=lambda s: (shard_for(s.guild_id), snipe_table.table_for(s.id))):
+                write_queue.put_many(shard, INSERT_SQL.format(table=table), [snipe._row() for snipe in group])
+
+    @classmethod
+    async def get_in_channel(cls, channel_id: int, /, *, guild_id: int, offset: int = 0) -> ReactionSnipe | None:
         """Gets a ReactionSnipe in a given channel at a given offset.
 
         This is ordered by deletion time.
@@ -115,6 +274,8 @@ class ReactionSnipe:
         ----------
         channel_id : int
             The channel to retrieve from
+        guild_id : int
+            The guild the channel is in
         offset : int, optional
             The number of entries back to check, by default 0
 
@@ -123,90 +284,136 @@ class ReactionSnipe:
         Self | None
             The ReactionSnipe if found, else None.
         """
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("SELECT * FROM reactionsnipe WHERE channel_id = ? ORDER BY removed_at DESC LIMIT 1 OFFSET ?", channel_id, offset)
-                res = await cur.fetchone()
+        snipe = snipe_store.get(channel_id, offset=offset)
+        if snipe is not None or not PERSIST_SNIPES:
+            return snipe
+
+        # Not held in memory, it may be older than what is.
+        return await cls._get_older(channel_id, guild_id, offset)
 
-                return cls(**res) if res is not None else None
+    @classmethod
+    async def _get_older(cls, channel_id: int, guild_id: int, offset: int, /) -> ReactionSnipe | None:
+        # The snipes held in memory are the newest in the database, so the search continues
+        # from the oldest of them instead of counting from the newest.
+        held, oldest = snipe_store.oldest(channel_id)
+        async for snipe in cls.iter_newest(guild_id=guild_id, channel_id=channel_id, before=oldest.cursor if oldest is not None else None):
+            if held == offset:
+                return snipe
+            held += 1
+        return None
 
     @classmethod
-    async def delete_one_in(cls, channel_id: int, /, *, offset: int = 0) -> int:
-        """Deletes a single database entry in given channel
+    async def iter_newest(cls, *, guild_id: int | None = None, channel_id: int | None = None, before: tuple[int, int] | None = None) -> AsyncIterator[ReactionSnipe]:
+        """Lazily yields the ReactionSnipes in a guild or channel, newest first.
 
         Parameters
         ----------
-        channel_id : int
-            The channel to remove in
-        offset : int, optional
-            The number of entries to delete back, by default 0
-
-        Returns
-        -------
-        int
-            The number of database entries removed.
+        guild_id : int | None, optional
+            The guild to get from, or the guild the channel is in, by default None
+        channel_id : int | None, optional
+            The channel to get from, by default None
+        before : tuple[int, int] | None, optional
+            Only yield snipes ordered before this `cursor`, by default None
         """
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("""DELETE FROM reactionsnipe
-                WHERE channel_id = ? AND id IN
-                 (SELECT id FROM reactionsnipe WHERE channel_id = ? ORDER BY removed_at DESC LIMIT 1 OFFSET ?)""", channel_id, channel_id, offset)
-                await db.commit()
+        if not PERSIST_SNIPES:
+            for snipe in snipe_store.newest(guild_id=guild_id, channel_id=channel_id, before=before):
+                yield snipe
+            return
 
-                return cur.get_cursor().rowcount
+        shard = shard_for(guild_id) if guild_id is not None else None # Without a guild every shard is read
+        await write_queue.flush(shard) # Make sure queued snipes are visible
+
+        column, value = ("channel_id", channel_id) if channel_id is not None else ("guild_id", guild_id)
+        async for row in snipe_table.iter_newest(column, value, shard=shard, before=before): # type: ignore
+            yield cls.from_row(row)
 
     @classmethod
-    async def delete_all_in(cls, channel_id: int, /) -> int:
-        """Removes all items from database with given channel id.
+    async def delete_one_in(cls, channel_id: int, /, *, guild_id: int, offset: int = 0) -> int:
+        """Deletes a single entry in given channel
 
         Parameters
         ----------
         channel_id : int
-            The channel id to clear
+            The channel to remove in
+        guild_id : int
+            The guild the channel is in
+        offset : int, optional
+            The number of entries to delete back, by default 0
 
         Returns
         -------
         int
-            The number of removed database entries
+            The number of entries removed.
         """
-        async with asqlite.connect(DB_FILENAME) as db:
+        snipe = snipe_store.remove_at(channel_id, offset=offset)
+        if snipe is not None:
+            embed_cache.invalidate_channel(snipe_table.name, channel_id)
+            if PERSIST_SNIPES:
+                write_queue.put(shard_for(snipe.guild_id), f"DELETE FROM {snipe_table.table_for(snipe.id)} WHERE id = ?", (snipe.id,))
+            return 1
+
+        if not PERSIST_SNIPES:
+            return 0
+
+        snipe = await cls._get_older(channel_id, guild_id, offset)
+        if snipe is None:
+            return 0
+
+        async with acquire(shard_for(guild_id)) as db:
             async with db.cursor() as cur:
-                await cur.execute("DELETE FROM reactionsnipe WHERE channel_id = ?", channel_id)
-                await db.commit()
+                await cur.execute(f"DELETE FROM {snipe_table.table_for(snipe.id)} WHERE id = ?", snipe.id)
+                num_deleted = cur.get_cursor().rowcount
 
-                return cur.get_cursor().rowcount
+        # Invalidated once deleted, so a snipe rendered meanwhile isn't held.
+        embed_cache.invalidate_channel(snipe_table.name, channel_id)
+        return num_deleted
 
-    @staticmethod
-    async def clear_all_for_user(user_id: int, /) -> int:
-        """Removes all snipes for given user_id
+    @classmethod
+    async def delete_all_in(cls, channel_id: int, /, *, guild_id: int) -> int:
+        """Removes all items with given channel id.
 
         Parameters
         ----------
-        user_id : int
-            The user_id to clear.
+        channel_id : int
+            The channel id to clear
+        guild_id : int
+            The guild the channel is in
 
         Returns
         -------
         int
-            The number of removed database entries.
+            The number of removed entries
         """
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("DELETE FROM reactionsnipe WHERE user_id = ?", user_id)
-                await db.commit()
+        num_deleted = snipe_store.clear_channel(channel_id)
+        if not PERSIST_SNIPES:
+            embed_cache.invalidate_channel(snipe_table.name, channel_id)
+            return num_deleted
+
+        shard = shard_for(guild_id)
+        await write_queue.flush(shard) # Make sure queued snipes are visible
 
-                return cur.get_cursor().rowcount
+        # Everything held in memory is also in the database
+        num_deleted = await snipe_table.delete_where("channel_id = ?", channel_id, shard=shard)
+        embed_cache.invalidate_channel(snipe_table.name, channel_id)
+        return num_deleted
 
     @property
     def is_custom(self) -> bool:
         """Whether the emoji is custom."""
-        return self.emoji_url is not None
+        return self.emoji_id is not None
 
     @property
     def is_unicode(self) -> bool:
         """Whether the emoji is unicode."""
         return self.unicode_codepoint is not None
 
+    @property
+    def emoji_url(self) -> str | None:
+        """The asset url of a custom emoji, built the same way as `discord.PartialEmoji.url`."""
+        if self.emoji_id is None:
+            return None
+        return f"{discord.Asset.BASE}/emojis/{self.emoji_id}.{'gif' if self.emoji_animated else 'png'}"
+
     @property
     def emoji(self) -> str:
         """Returns the emoji asset url or unicode codepoint as applicable."""
@@ -217,6 +424,15 @@ class ReactionSnipe:
         """Jump URL for the message the reaction was removed from."""
         return f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.message_id}"
 
+    @property
+    def cursor(self) -> tuple[int, int]:
+        """The `(time, id)` this snipe is ordered by, newest first."""
+        return (self.removed_at, self.id)
+
+    def to_dict(self) -> dict[str, Any]:
+        """This snipe as a JSON serializable dict, as included in data exports."""
+        return asdict(self)
+
     @property
     def timestamp(self) -> datetime.datetime:
         """Returns a UTC datetime representing time of deletion"""
@@ -235,12 +451,19 @@ class ReactionSnipe:
         discord.Embed
             The generated Embed
         """
-        author = ctx.guild.get_member(self.user_id) or await ctx.bot.fetch_member(self.user_id)
-
         embed = discord.Embed(description=f'[Message Reacted To]({self.message_jump_url} "Message Reacted To")', color=discord.Color.blue())
-        embed.set_author(name=author, icon_url=author.display_avatar.url)
         embed.timestamp = self.timestamp
 
+        if self.user_id is not None:
+            author = await author_cache.resolve(ctx.bot, ctx.guild, self.user_id)
+            set_embed_author(embed, author, self.user_id)
+
+        if self.kind == RemovalKind.CLEAR:
+            embed.set_author(name="All reactions were cleared")
+            return embed
+        if self.kind == RemovalKind.CLEAR_EMOJI:
+            embed.set_author(name="All reactions of an emoji were cleared")
+
         if self.is_custom:
             embed.set_image(url=self.emoji) # emoji is the Asset url for custom emojis
             embed.description += f"\n[Emoji Link]({self.emoji})"
@@ -250,58 +473,163 @@ class ReactionSnipe:
 
         return embed
 
+    def summary(self, guild: discord.Guild, /) -> str:
+        """A one line description of this snipe for timelines.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild the snipe is being shown in.
+
+        Returns
+        -------
+        str
+            The line.
+        """
+        prefix = f"\N{HEAVY MINUS SIGN} <t:{self.removed_at}:T> <#{self.channel_id}>"
+        if self.kind == RemovalKind.CLEAR:
+            return f"{prefix} all reactions were cleared from [a message]({self.message_jump_url})"
+
+        emoji = f"[emoji]({self.emoji})" if self.is_custom else self.emoji
+        if self.kind == RemovalKind.CLEAR_EMOJI:
+            return f"{prefix} all {emoji} reactions were cleared from [a message]({self.message_jump_url})"
+        return f"{prefix} <@{self.user_id}> removed {emoji} from [a message]({self.message_jump_url})"
+
+snipe_store: SnipeStore[ReactionSnipe] = SnipeStore(user_attr="user_id", time_attr="removed_at")
+snipe_table = BucketedTable("reactionsnipe", MIGRATIONS, time_column="removed_at", window_seconds=TTL_MINUTES * 60)
+
 
 class ReactionSnipeCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
+        # Removals and clears waiting for the storm window to end, by (message_id, user_id) then emoji.
+        # Clears have no user, and a clear of every emoji has no emoji.
+        self._pending: dict[tuple[int, int | None], dict[int | str | None, ReactionSnipe]] = {}
+        self._record_task: asyncio.Task | None = None
+        self._record_now = asyncio.Event()
+
     async def cog_load(self) -> None:
-        async with asqlite.connect(DB_FILENAME) as db:
-            await db.executescript(SETUP_SQL)
-        self.reaction_snipe_db_purge.start()
+        await open_pool()
+        if PERSIST_SNIPES:
+            await snipe_table.load()
+        await optout_cache.load()
+        await policy_cache.load()
+        open_queue()
+        purge_coordinator.register(snipe_table, snipe_store)
+        user_data.register(ReactionSnipe, snipe_table, snipe_store)
 
     async def cog_unload(self) -> None:
-        self.reaction_snipe_db_purge.cancel()
+        # A batch may be waiting on its opt-out check, it needs the queue and pool to be recorded.
+        self._record_now.set()
+        if self._record_task is not None:
+            await self._record_task
+        await self._record_pending()
+
+        user_data.unregister(snipe_table)
+        await purge_coordinator.unregister(snipe_table)
+        await close_queue()
+        await close_pool()
+
+    async def _record_after_window(self) -> None:
+        # The task is held until nothing is pending, so one batch is recorded at a time and in order.
+        try:
+            while self._pending:
+                try:
+                    await asyncio.wait_for(self._record_now.wait(), timeout=STORM_WINDOW_MS / 1000)
+                except asyncio.TimeoutError:
+                    pass
+
+                try:
+                    await self._record_pending()
+                except Exception:
+                    _logger.exception("Failed to record held reaction removals, they have been dropped.")
+        finally:
+            self._record_task = None
+
+    async def _record_pending(self) -> None:
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        opted_out = await BotUser.opted_out_among(user_id for _, user_id in pending if user_id is not None)
+        snipes = [snipe for (_, user_id), group in pending.items() if user_id not in opted_out for snipe in group.values()]
+        snipes.sort(key=lambda s: s.id)
+
+        _logger.debug("Recording %d reaction removals on %d messages", len(snipes), len({message_id for message_id, _ in pending}))
+        ReactionSnipe.save_many(snipes)
+
+    def _hold(self, snipe: ReactionSnipe, /) -> None:
+        # Removing the same emoji again replaces the earlier removal, keeping the latest.
+        key = snipe.emoji_id or snipe.unicode_codepoint
+        group = self._pending.setdefault((snipe.message_id, snipe.user_id), {})
+        group.pop(key, None)
+        group[key] = snipe
+
+        if self._record_task is None:
+            self._record_task = asyncio.create_task(self._record_after_window())
 
     @commands.Cog.listener()
-    async def on_optout_status_change(self, user: discord.User, _: bool) -> None:
-        """Custom event handler for opt out status changes
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent) -> None:
+        if payload.guild_id is None: return
+        if not policy_cache.allows(payload.guild_id, SnipeCategory.REACTION): return
 
-        Parameters
-        ----------
-        user : discord.User
-            The user whose opt out status changed
-        _ : bool
-            The new opt out status
-        """
-        num_deleted = await ReactionSnipe.clear_all_for_user(user.id)
-        _logger.info("Processed reactionsnipe clear for %s, removed %d reactionsnipes.", str(user), num_deleted)
+        if STORM_WINDOW_MS <= 0:
+            if await BotUser.is_opt_out(payload.user_id): return
+
+            _logger.debug("Processing reaction remove in channel with id %d", payload.channel_id)
+            ReactionSnipe.from_payload(payload).save()
+            return
+
+        self._hold(ReactionSnipe.from_payload(payload))
 
     @commands.Cog.listener()
-    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent) -> None:
+    async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent) -> None:
         if payload.guild_id is None: return
-        if await BotUser.is_opt_out(payload.user_id): return
+        if not policy_cache.allows(payload.guild_id, SnipeCategory.REACTION): return
 
-        _logger.debug("Processing reaction remove in channel with id %d", payload.channel_id)
-        await ReactionSnipe.from_payload(payload)
+        _logger.debug("Processing reaction clear in channel with id %d", payload.channel_id)
+        if STORM_WINDOW_MS <= 0:
+            ReactionSnipe.from_clear(payload).save()
+        else:
+            self._hold(ReactionSnipe.from_clear(payload))
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear_emoji(self, payload: discord.RawReactionClearEmojiEvent) -> None:
+        if payload.guild_id is None: return
+        if not policy_cache.allows(payload.guild_id, SnipeCategory.REACTION): return
+
+        _logger.debug("Processing reaction emoji clear in channel with id %d", payload.channel_id)
+        if STORM_WINDOW_MS <= 0:
+            ReactionSnipe.from_clear(payload).save()
+        else:
+            self._hold(ReactionSnipe.from_clear(payload))
 
     @commands.command()
     @commands.guild_only()
     async def rsnipe(self, ctx: commands.Context, num_back: int = 0) -> None:
         """Snipes a removed reaction in current channel."""
-        snipe = await ReactionSnipe.get_in_channel(ctx.channel.id, offset=num_back)
+        # Read before the lookup, which may wait on the database or the API.
+        latest_id, generation = snipe_store.latest_id(ctx.channel.id), embed_cache.generation_of(snipe_table.name, ctx.channel.id)
 
-        if snipe:
-            await ctx.send(embed=await snipe.embed(ctx))
-        else:
-            await ctx.send("No snipe found.")
+        embed = embed_cache.get(snipe_table.name, ctx.channel.id, num_back, latest_id)
+        if embed is None:
+            snipe = await ReactionSnipe.get_in_channel(ctx.channel.id, guild_id=ctx.guild.id, offset=num_back)
+            if not snipe:
+                await ctx.send("No snipe found.")
+                return
+
+            embed = await snipe.embed(ctx)
+            embed_cache.put(snipe_table.name, ctx.channel.id, num_back, latest_id, embed, generation=generation)
+
+        await ctx.send(embed=embed)
 
     @commands.command()
     @commands.guild_only()
     @commands.has_permissions(manage_messages=True)
     async def rmrsnipe(self, ctx: commands.Context, num_back: int = 0) -> None:
         """Removes a reaction snipe in current channel."""
-        num_deleted = await ReactionSnipe.delete_one_in(ctx.channel.id, offset=num_back)
+        num_deleted = await ReactionSnipe.delete_one_in(ctx.channel.id, guild_id=ctx.guild.id, offset=num_back)
 
         if num_deleted > 0:
             await ctx.send(f"Deleted snipe at index {num_back} in {ctx.channel.mention}")
@@ -315,26 +643,13 @@ class ReactionSnipeCog(commands.Cog):
         """Removes all snipes in a channel. Defaults to current channel."""
         channel = channel or ctx.channel
 
-        num_deleted = await ReactionSnipe.delete_all_in(channel.id)
+        num_deleted = await ReactionSnipe.delete_all_in(channel.id, guild_id=ctx.guild.id)
 
         if num_deleted > 0:
             await ctx.send(f"Deleted {num_deleted} snipes in {channel.mention}")
         else:
             await ctx.send(f"I couldn't find anything to delete in {channel.mention}")
 
-    @tasks.loop(minutes=TTL_MINUTES)
-    async def reaction_snipe_db_purge(self):
-        oldest_time = discord.utils.utcnow() - datetime.timedelta(minutes=TTL_MINUTES)
-        oldest_timestamp = int(oldest_time.timestamp())
-
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("DELETE FROM reactionsnipe WHERE removed_at < ?", oldest_timestamp)
-                await db.commit()
-
-                deleted = cur.get_cursor().rowcount
-                _logger.info("Performing periodic reactionsnipe purge. %d reactionsnipes removed.", deleted)
-
 
 async def setup(bot: commands.Bot):
     _logger.info("Loading cog ReactionSnipeCog")
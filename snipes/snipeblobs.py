@@ -0,0 +1,372 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from __future__ import annotations
+
+"""
+Attachment and embed metadata of sniped messages, stored once per shard however often it is seen.
+
+Each attachment or embed is reduced to a few fields and given a key. Snipes keep only
+the keys, and the fields are stored in the `snipeblob` table of the snipe's shard.
+Embeds are keyed by a hash of every field stored, so a link posted and deleted a hundred
+times is one row and a row never tells anything the snipes referring to it don't.
+Attachments are keyed by their id and are not deduplicated. Discord gives no hash of an
+attachment's content, every upload is its own file and the link to it must only be shown
+with the snipe it was deleted in.
+
+Which snipes refer to a row is recorded in `snipeblob_ref`, so erasing a user's snipes
+finds the rows nobody else refers to without reading other snipes. Recently seen metadata
+is held in memory, so showing a recent snipe reads nothing. Rows record when they were
+last written and are purged with the snipes once no snipe can still refer to them.
+
+This module uses the following third party libs installed via pip: asqlite (https://github.com/Rapptz/asqlite)
+"""
+
+import asyncio
+import datetime
+import enum
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import discord
+
+from .snipequeue import write_queue
+from .snipescommon import PERSIST_SNIPES, SHARD_COUNT, acquire, migrate
+
+_logger = logging.getLogger(__name__)
+
+# Maximum metadata entries held in memory.
+BLOB_CACHE_SIZE = 10_000
+# Most attachments and embeds kept per snipe.
+MAX_BLOBS_PER_SNIPE = 10
+
+# Applied in order by `migrate` to every shard. Never edit or reorder these, only append.
+BLOB_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS snipeblob (
+        hash TEXT PRIMARY KEY,
+        kind INTEGER NOT NULL,
+        name TEXT NULL,
+        size INTEGER NULL,
+        content_type TEXT NULL,
+        url TEXT NULL,
+        last_seen BIGINT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS snipeblob_seen_idx ON snipeblob (last_seen)
+    """,
+    # Attachments are keyed by id rather than a hash, the snipes referring to each row are recorded
+    """
+    ALTER TABLE snipeblob RENAME COLUMN hash TO key;
+    CREATE TABLE IF NOT EXISTS snipeblob_ref (
+        key TEXT NOT NULL,
+        snipe_id BIGINT NOT NULL,
+        PRIMARY KEY (key, snipe_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS snipeblob_ref_snipe_idx ON snipeblob_ref (snipe_id)
+    """,
+]
+
+UPSERT_SQL = """INSERT INTO snipeblob (key, kind, name, size, content_type, url, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET last_seen = max(last_seen, excluded.last_seen)"""
+
+REF_SQL = "INSERT OR IGNORE INTO snipeblob_ref (key, snipe_id) VALUES (?, ?)"
+
+
+class BlobKind(enum.IntEnum):
+    ATTACHMENT = 0
+    EMBED = 1
+
+
+def _hash(*fields: object) -> str:
+    return hashlib.blake2b("\x1f".join("" if f is None else str(f) for f in fields).encode("utf-8"), digest_size=12).hexdigest()
+
+
+@dataclass(slots=True)
+class SnipeBlob:
+    """The metadata of an attachment or embed.
+
+    `key` is the attachment id, or a hash of the other fields for embeds.
+    For embeds `name` is the title, `content_type` the embed type and `url` the link or image shown.
+    """
+    key: str
+    kind: BlobKind
+    name: str | None
+    size: int | None
+    content_type: str | None
+    url: str | None
+
+    @classmethod
+    def from_attachment(cls, attachment: discord.Attachment, /) -> SnipeBlob:
+        return cls(
+            key=str(attachment.id),
+            kind=BlobKind.ATTACHMENT,
+            name=attachment.filename,
+            size=attachment.size,
+            content_type=attachment.content_type,
+            url=attachment.proxy_url,
+        )
+
+    @classmethod
+    def from_embed(cls, embed: discord.Embed, /) -> SnipeBlob | None:
+        url = embed.url or embed.image.proxy_url or embed.thumbnail.proxy_url or embed.video.url
+        name = embed.title or embed.provider.name or embed.author.name
+        if url is None and name is None:
+            return None
+
+        return cls(key=_hash(BlobKind.EMBED, name, embed.type, url), kind=BlobKind.EMBED, name=name, size=None, content_type=embed.type, url=url)
+
+    @classmethod
+    def from_message(cls, message: discord.Message, /) -> list[SnipeBlob]:
+        """The metadata of a message's attachments, then of its embeds, at most `MAX_BLOBS_PER_SNIPE`."""
+        blobs = [cls.from_attachment(attachment) for attachment in message.attachments]
+        blobs += [blob for blob in map(cls.from_embed, message.embeds) if blob is not None]
+        return blobs[:MAX_BLOBS_PER_SNIPE]
+
+    def to_dict(self) -> dict[str, Any]:
+        """This blob as a JSON serializable dict, as included in data exports."""
+        return asdict(self)
+
+    def describe(self) -> str:
+        """A one line description for snipe embeds, linking the file or embed if possible."""
+        label = discord.utils.escape_markdown(self.name or self.url or "Unknown").replace("[", "\\[").replace("]", "\\]")
+        line = f"[{label}]({self.url})" if self.url else label
+
+        if self.kind is BlobKind.ATTACHMENT and self.size is not None:
+            size = f"{self.size / 1024 / 1024:.1f}MB" if self.size >= 1024 * 1024 else f"{self.size / 1024:.1f}KB"
+            return f"\N{PAPERCLIP} {line} ({size})"
+        return f"\N{LINK SYMBOL} {line}" + (f" ({self.content_type})" if self.content_type else "")
+
+
+def describe_all(blobs: list[SnipeBlob], /, *, width: int = 1024) -> str:
+    """Describes blobs one per line, as many as fit in `width` characters, an embed field by default.
+
+    Parameters
+    ----------
+    blobs : list[SnipeBlob]
+        The blobs to describe.
+    width : int, optional
+        The maximum length, by default 1024
+
+    Returns
+    -------
+    str
+        The lines.
+    """
+    lines: list[str] = []
+    length = 0
+    for i, blob in enumerate(blobs):
+        line = blob.describe()
+        # Room is left for the line saying how many more there are, unless this is the last.
+        rest = len(f"\nand {len(blobs) - i - 1} more") if i < len(blobs) - 1 else 0
+        if length + len(line) + rest > width:
+            lines.append(f"and {len(blobs) - i} more")
+            break
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)
+
+
+class BlobStore:
+    """Stores and looks up `SnipeBlob`s by shard and key, holding recent ones in memory.
+
+    A blob is only written again once its row might be purged, so repeats cost nothing.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        The number of blobs held in memory, by default BLOB_CACHE_SIZE
+    """
+    def __init__(self, *, max_size: int = BLOB_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        # The longest any snipe type keeps snipes. Rows are kept twice this after they were last written.
+        self.keep_seconds = 0
+
+        # (shard, key) to the time the row was last written and the blob.
+        self._entries: OrderedDict[tuple[int, str], tuple[int, SnipeBlob]] = OrderedDict()
+        self._loaded = False
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.deduplicated = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of blobs held and the lookup and write counters."""
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "writes": self.writes, "deduplicated": self.deduplicated}
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    async def load(self, *, keep_seconds: int) -> None:
+        """Creates or upgrades the blob table in every shard, if snipes are persisted.
+
+        Parameters
+        ----------
+        keep_seconds : int
+            The longest a snipe referring to a blob is kept. The largest given is used.
+        """
+        self.keep_seconds = max(self.keep_seconds, keep_seconds)
+        if self._loaded:
+            return
+
+        if PERSIST_SNIPES:
+            await asyncio.gather(*(migrate("snipeblob", BLOB_MIGRATIONS, shard=shard) for shard in range(SHARD_COUNT)))
+        self._loaded = True
+
+    def _hold(self, key: tuple[int, str], written_at: int, blob: SnipeBlob, /) -> None:
+        self._entries[key] = (written_at, blob)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def add(self, shard: int, snipe_id: int, blobs: list[SnipeBlob], seen_at: int, /) -> str | None:
+        """Holds blobs seen in a snipe and queues the writes of any not written recently.
+
+        The snipe's references to them are queued either way.
+
+        Parameters
+        ----------
+        shard : int
+            The shard of the snipe.
+        snipe_id : int
+            The id of the snipe.
+        blobs : list[SnipeBlob]
+            The blobs of the snipe.
+        seen_at : int
+            The unix timestamp of the snipe.
+
+        Returns
+        -------
+        str | None
+            The keys to store with the snipe, None if there are no blobs.
+        """
+        if not blobs:
+            return None
+
+        rows = []
+        for blob in blobs:
+            key = (shard, blob.key)
+            entry = self._entries.get(key)
+            # Written within the keep time, the row still outlives any snipe seen now.
+            if entry is not None and seen_at - entry[0] < self.keep_seconds:
+                self._entries.move_to_end(key)
+                self.deduplicated += 1
+                continue
+
+            self._hold(key, seen_at, blob)
+            rows.append((blob.key, int(blob.kind), blob.name, blob.size, blob.content_type, blob.url, seen_at))
+
+        if PERSIST_SNIPES:
+            if rows:
+                self.writes += len(rows)
+                write_queue.put_many(shard, UPSERT_SQL, rows)
+            write_queue.put_many(shard, REF_SQL, [(blob.key, snipe_id) for blob in blobs])
+
+        return " ".join(blob.key for blob in blobs)
+
+    async def get_many(self, shard: int, keys: str | None, /) -> list[SnipeBlob]:
+        """Gets the blobs of a snipe, reading only those not held in memory.
+
+        Parameters
+        ----------
+        shard : int
+            The shard of the snipe.
+        keys : str | None
+            The keys stored with the snipe.
+
+        Returns
+        -------
+        list[SnipeBlob]
+            The blobs in the order they were stored. Blobs no longer stored are left out.
+        """
+        if not keys:
+            return []
+
+        found: dict[str, SnipeBlob] = {}
+        missing = []
+        for key in keys.split():
+            entry = self._entries.get((shard, key))
+            if entry is not None:
+                self.hits += 1
+                found[key] = entry[1]
+            else:
+                self.misses += 1
+                missing.append(key)
+
+        if missing and PERSIST_SNIPES:
+            await write_queue.flush(shard) # Make sure queued blobs are visible
+            async with acquire(shard) as db:
+                rows = await db.fetchall(f"SELECT * FROM snipeblob WHERE key IN ({', '.join('?' * len(missing))})", *missing)
+
+            for row in rows:
+                blob = SnipeBlob(key=row["key"], kind=BlobKind(row["kind"]), name=row["name"], size=row["size"], content_type=row["content_type"], url=row["url"])
+                self._hold((shard, blob.key), row["last_seen"], blob)
+                found[blob.key] = blob
+
+        return [found[key] for key in keys.split() if key in found]
+
+    def forget(self, shard: int, keys: set[str], /) -> None:
+        """Stops holding blobs of a shard whose rows were deleted, such as by erasing a user's data."""
+        for key in keys:
+            self._entries.pop((shard, key), None)
+
+    async def purge(self, now: int, /) -> int:
+        """Deletes the blobs and references no snipe can refer to anymore from memory and every shard.
+
+        Parameters
+        ----------
+        now : int
+            The unix timestamp of the purge.
+
+        Returns
+        -------
+        int
+            The number of blob rows deleted.
+        """
+        cutoff = now - 2 * self.keep_seconds
+        # No snipe is kept longer than this, ids are snowflakes of when the snipe was made.
+        ref_cutoff = discord.utils.time_snowflake(datetime.datetime.fromtimestamp(now - self.keep_seconds, tz=datetime.timezone.utc))
+
+        async def purge_in(shard: int) -> int:
+            async with acquire(shard) as db:
+                async with db.transaction():
+                    await db.execute("DELETE FROM snipeblob_ref WHERE snipe_id < ?", ref_cutoff)
+                    cur = await db.execute("DELETE FROM snipeblob WHERE last_seen < ?", cutoff)
+                    return cur.get_cursor().rowcount
+
+        for key in [key for key, (written_at, _) in self._entries.items() if written_at < cutoff]:
+            del self._entries[key]
+
+        if not PERSIST_SNIPES:
+            return 0
+        return sum(await asyncio.gather(*(purge_in(shard) for shard in range(SHARD_COUNT))))
+
+
+blob_store = BlobStore()
@@ -0,0 +1,258 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from __future__ import annotations
+
+"""
+Per-guild snipe policies.
+
+A guild can record only some snipe categories, keep snipes for less than the `TTL_MINUTES`
+of each snipe type, and keep at most a number of snipes per channel. Guilds without a policy
+use the defaults: every category, each type's `TTL_MINUTES` and no cap.
+
+Policies are held in memory by `policy_cache` once any snipe cog loads, so the listeners
+check them before doing any work. Retention and caps are enforced by the purge coordinator.
+`SnipePolicyCog` adds the `snipepolicy` commands to change them.
+
+This module uses the following third party libs installed via pip: asqlite (https://github.com/Rapptz/asqlite)
+"""
+
+import enum
+import logging
+from dataclasses import dataclass, replace
+from typing import Literal
+
+from discord.ext import commands
+
+from .snipescommon import acquire, close_pool, migrate, open_pool
+
+_logger = logging.getLogger(__name__)
+
+
+class SnipeCategory(enum.IntFlag):
+    DELETE = 1
+    EDIT = 2
+    REACTION = 4
+
+
+ALL_CATEGORIES = SnipeCategory.DELETE | SnipeCategory.EDIT | SnipeCategory.REACTION
+
+# Applied in order by `migrate`. Never edit or reorder these, only append.
+POLICY_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS snipepolicy (
+        guild_id BIGINT PRIMARY KEY,
+        ttl_minutes INTEGER NULL,
+        max_per_channel INTEGER NULL,
+        enabled INTEGER NOT NULL
+    )
+    """,
+]
+
+
+@dataclass(slots=True)
+class GuildPolicy:
+    """The snipe policy of a guild. None means the default for that setting."""
+    guild_id: int
+    ttl_minutes: int | None = None
+    max_per_channel: int | None = None
+    enabled: SnipeCategory = ALL_CATEGORIES
+
+    @property
+    def is_default(self) -> bool:
+        return self.ttl_minutes is None and self.max_per_channel is None and self.enabled == ALL_CATEGORIES
+
+    def limits(self, now: int, window_seconds: int, /) -> tuple[int | None, int | None] | None:
+        """What the purge coordinator enforces for this guild in one snipe type.
+
+        Parameters
+        ----------
+        now : int
+            The unix timestamp of the purge.
+        window_seconds : int
+            The snipe type's window, its default retention.
+
+        Returns
+        -------
+        tuple[int | None, int | None] | None
+            The unix timestamp snipes older than are removed, and the number of snipes kept
+            per channel, each None if not limited. None if neither is.
+        """
+        # Retention longer than the default is not possible, window tables are dropped regardless.
+        before = now - self.ttl_minutes * 60 if self.ttl_minutes is not None and self.ttl_minutes * 60 < window_seconds else None
+        if before is None and self.max_per_channel is None:
+            return None
+        return before, self.max_per_channel
+
+
+class PolicyCache:
+    """In memory map of guild id to `GuildPolicy`, holding only guilds that have one.
+
+    Until loaded every guild gets the default policy, nothing here ever touches the
+    database on the listeners' behalf.
+    """
+    def __init__(self) -> None:
+        self.policies: dict[int, GuildPolicy] | None = None
+
+        # Counters
+        self.skipped = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.policies is not None
+
+    async def load(self) -> None:
+        """Loads every guild's policy from the database, if not loaded already."""
+        if self.is_loaded:
+            return
+
+        await migrate("snipepolicy", POLICY_MIGRATIONS)
+        async with acquire() as db:
+            rows = await db.fetchall("SELECT * FROM snipepolicy")
+
+        self.policies = {row["guild_id"]: GuildPolicy(**{**dict(row), "enabled": SnipeCategory(row["enabled"])}) for row in rows}
+        _logger.info("Loaded snipe policy cache with %d guild policies.", len(self.policies))
+
+    def get(self, guild_id: int, /) -> GuildPolicy:
+        """Gets the policy of a guild, the default if it has none."""
+        policy = self.policies.get(guild_id) if self.policies is not None else None
+        return policy if policy is not None else GuildPolicy(guild_id)
+
+    def allows(self, guild_id: int, category: SnipeCategory, /) -> bool:
+        """Whether a guild records a snipe category. Meant to be the first check of each listener."""
+        if not self.policies:
+            return True
+
+        policy = self.policies.get(guild_id)
+        if policy is None or category in policy.enabled:
+            return True
+
+        self.skipped += 1
+        return False
+
+    def limits(self, now: int, window_seconds: int, /) -> dict[int, tuple[int | None, int | None]]:
+        """The limits of every guild that has any in a snipe type, see `GuildPolicy.limits`."""
+        limits = {}
+        for guild_id, policy in (self.policies or {}).items():
+            limit = policy.limits(now, window_seconds)
+            if limit is not None:
+                limits[guild_id] = limit
+        return limits
+
+    async def update(self, guild_id: int, /, **changes: int | SnipeCategory | None) -> GuildPolicy:
+        """Changes and stores a guild's policy. A policy back to the defaults is deleted.
+
+        Parameters
+        ----------
+        guild_id : int
+            The guild to change.
+        **changes : int | SnipeCategory | None
+            The `GuildPolicy` fields to set.
+
+        Returns
+        -------
+        GuildPolicy
+            The new policy.
+        """
+        policy = replace(self.get(guild_id), **changes)
+
+        async with acquire() as db:
+            if policy.is_default:
+                await db.execute("DELETE FROM snipepolicy WHERE guild_id = ?", guild_id)
+            else:
+                await db.execute(
+                    "INSERT OR REPLACE INTO snipepolicy VALUES (?, ?, ?, ?)",
+                    guild_id, policy.ttl_minutes, policy.max_per_channel, int(policy.enabled),
+                )
+
+        if self.policies is not None:
+            if policy.is_default:
+                self.policies.pop(guild_id, None)
+            else:
+                self.policies[guild_id] = policy
+        return policy
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of guild policies and events skipped by them."""
+        return {"size": len(self.policies) if self.policies is not None else 0, "skipped": self.skipped}
+
+
+policy_cache = PolicyCache()
+
+_CATEGORIES = {"delete": SnipeCategory.DELETE, "edit": SnipeCategory.EDIT, "reaction": SnipeCategory.REACTION}
+
+
+class SnipePolicyCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_load(self) -> None:
+        await open_pool()
+        await policy_cache.load()
+
+    async def cog_unload(self) -> None:
+        await close_pool()
+
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def snipepolicy(self, ctx: commands.Context) -> None:
+        """Shows this server's snipe policy."""
+        policy = policy_cache.get(ctx.guild.id)
+
+        enabled = ", ".join(name for name, category in _CATEGORIES.items() if category in policy.enabled) or "none"
+        ttl = f"{policy.ttl_minutes} minutes" if policy.ttl_minutes is not None else "default"
+        cap = str(policy.max_per_channel) if policy.max_per_channel is not None else "none"
+        await ctx.send(f"Recording: {enabled}\nKept for: {ttl}\nMost kept per channel: {cap}")
+
+    @snipepolicy.command(name="ttl")
+    async def snipepolicy_ttl(self, ctx: commands.Context, minutes: commands.Range[int, 1, None] | None = None) -> None:
+        """Sets how long snipes are kept, at most each type's default. Leave empty to reset."""
+        await policy_cache.update(ctx.guild.id, ttl_minutes=minutes)
+        await ctx.send(f"Snipes are now kept for {minutes} minutes at most." if minutes is not None else "Snipes are now kept for the default time.")
+
+    @snipepolicy.command(name="cap")
+    async def snipepolicy_cap(self, ctx: commands.Context, snipes: commands.Range[int, 0, None] | None = None) -> None:
+        """Sets the most snipes of each type kept per channel. Leave empty to remove the cap."""
+        await policy_cache.update(ctx.guild.id, max_per_channel=snipes)
+        await ctx.send(f"At most {snipes} snipes of each type are now kept per channel." if snipes is not None else "Snipes per channel are no longer capped.")
+
+    @snipepolicy.command(name="enable")
+    async def snipepolicy_enable(self, ctx: commands.Context, category: Literal["delete", "edit", "reaction"]) -> None:
+        """Starts recording a snipe category."""
+        policy = policy_cache.get(ctx.guild.id)
+        await policy_cache.update(ctx.guild.id, enabled=policy.enabled | _CATEGORIES[category])
+        await ctx.send(f"Now recording {category} snipes.")
+
+    @snipepolicy.command(name="disable")
+    async def snipepolicy_disable(self, ctx: commands.Context, category: Literal["delete", "edit", "reaction"]) -> None:
+        """Stops recording a snipe category. Snipes already recorded expire as usual."""
+        policy = policy_cache.get(ctx.guild.id)
+        await policy_cache.update(ctx.guild.id, enabled=policy.enabled & ~_CATEGORIES[category])
+        await ctx.send(f"No longer recording {category} snipes.")
+
+
+async def setup(bot: commands.Bot):
+    _logger.info("Loading cog SnipePolicyCog")
+    await bot.add_cog(SnipePolicyCog(bot))
+
+async def teardown(_: commands.Bot):
+    _logger.info("Unloading cog SnipePolicyCog")
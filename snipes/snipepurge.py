@@ -0,0 +1,283 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from __future__ import annotations
+
+"""
+Purge coordinator for all snipe types.
+
+Each snipe cog registers its window table and memory store on load. A single background
+task expires old snipes from memory and drops expired window tables for every registered
+type together, instead of each cog purging on its own schedule with its own connection.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from .embedcache import embed_cache
+from .snipeblobs import blob_store
+from .snipequeue import write_queue
+from .snipepolicy import policy_cache
+from .snipescommon import PERSIST_SNIPES, SHARD_COUNT, BucketedTable, acquire, shard_for
+from .snipestore import SnipeStore
+
+_logger = logging.getLogger(__name__)
+
+# How often a purge runs.
+PURGE_INTERVAL_SECONDS = 60
+# Most window tables dropped in one transaction per shard, bounding how long each write lock is held.
+PURGE_CHUNK_TABLES = 4
+# A chunk waits while at least this many writes are queued for ingestion...
+BACKOFF_DEPTH = 1_000
+# ...backing off exponentially up to this long in total before going ahead anyway.
+MAX_BACKOFF_SECONDS = 30.0
+# Number of past runs kept for inspection.
+HISTORY_SIZE = 20
+
+
+@dataclass(slots=True)
+class PurgeRun:
+    """Counts and timings of one purge, keyed by snipe type.
+
+    `expired` counts snipes removed from memory, including by guild policies, `dropped_rows`
+    counts the rows in dropped window tables and `trimmed_rows` the rows deleted by guild
+    policies. A snipe held in memory is also in the database, so they overlap.
+    `purged_blobs` counts attachment and embed metadata rows no snipe refers to anymore.
+    """
+    started_at: int
+    duration_ms: float = 0.0
+    backoff_ms: float = 0.0
+    chunks: int = 0
+    expired: dict[str, int] = field(default_factory=dict)
+    dropped_rows: dict[str, int] = field(default_factory=dict)
+    dropped_tables: dict[str, int] = field(default_factory=dict)
+    trimmed_rows: dict[str, int] = field(default_factory=dict)
+    purged_blobs: int = 0
+
+
+class PurgeCoordinator:
+    """Expires snipes of every registered type on one schedule.
+
+    Memory stores are expired first. Then upcoming window tables of every type are created,
+    and expired ones are dropped together, at most `PURGE_CHUNK_TABLES` per transaction,
+    waiting between chunks while the write queue is deep. Each chunk is dropped from all
+    shards at once. Last, guilds with a shorter retention or a per channel cap in their
+    policy are trimmed, one transaction per shard.
+    """
+    def __init__(self, *, interval: float = PURGE_INTERVAL_SECONDS, chunk_tables: int = PURGE_CHUNK_TABLES) -> None:
+        self.interval = interval
+        self.chunk_tables = chunk_tables
+
+        self._registered: dict[str, tuple[BucketedTable, SnipeStore[Any]]] = {}
+        self._run_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+        # Metrics
+        self.runs: deque[PurgeRun] = deque(maxlen=HISTORY_SIZE)
+        self.total_runs = 0
+        self.total_expired = 0
+        self.total_dropped_rows = 0
+        self.total_trimmed_rows = 0
+        self.total_backoff_ms = 0.0
+        self.max_duration_ms = 0.0
+
+    @property
+    def last_run(self) -> PurgeRun | None:
+        return self.runs[-1] if self.runs else None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stats(self) -> dict[str, float]:
+        """Returns totals across all runs and the counts of the last run."""
+        last = self.last_run
+        return {
+            "runs": self.total_runs,
+            "expired": self.total_expired,
+            "dropped_rows": self.total_dropped_rows,
+            "trimmed_rows": self.total_trimmed_rows,
+            "backoff_ms": self.total_backoff_ms,
+            "max_duration_ms": self.max_duration_ms,
+            "last_expired": sum(last.expired.values()) if last else 0,
+            "last_dropped_rows": sum(last.dropped_rows.values()) if last else 0,
+            "last_trimmed_rows": sum(last.trimmed_rows.values()) if last else 0,
+            "last_duration_ms": last.duration_ms if last else 0.0,
+        }
+
+    def register(self, table: BucketedTable, store: SnipeStore[Any], /) -> None:
+        """Registers a snipe type to be purged, starting the background task if needed.
+
+        Parameters
+        ----------
+        table : BucketedTable
+            The window table the snipe type is persisted to.
+        store : SnipeStore[Any]
+            The memory store the snipe type is held in.
+        """
+        self._registered[table.name] = (table, store)
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run())
+
+    async def unregister(self, table: BucketedTable, /) -> None:
+        """Stops purging a snipe type. The background task stops with the last one."""
+        self._registered.pop(table.name, None)
+        if not self._registered and self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _back_off(self) -> float:
+        waited = 0.0
+        delay = 0.05
+        while write_queue.depth >= BACKOFF_DEPTH and waited < MAX_BACKOFF_SECONDS:
+            await asyncio.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, MAX_BACKOFF_SECONDS - waited)
+        return waited * 1000
+
+    async def run(self) -> PurgeRun:
+        """Purges every registered snipe type once.
+
+        Returns
+        -------
+        PurgeRun
+            The counts and timings of this run.
+        """
+        async with self._run_lock:
+            run = PurgeRun(started_at=int(time.time()))
+            start = time.perf_counter()
+
+            limits = {name: policy_cache.limits(run.started_at, table.window_seconds) for name, (table, _) in self._registered.items()}
+            for name, (table, store) in self._registered.items():
+                run.expired[name] = store.expire(run.started_at - table.window_seconds)
+                if limits[name]:
+                    run.expired[name] += store.trim_guilds(limits[name])
+
+            if PERSIST_SNIPES:
+                # Inserts go to the window of the current time, its table has to exist before it comes round
+                for table, _ in self._registered.values():
+                    await table.create_upcoming()
+                await self._drop_expired(run)
+                if any(limits.values()):
+                    await self._trim_guilds(run, limits)
+            if blob_store.is_loaded:
+                run.purged_blobs = await blob_store.purge(run.started_at)
+
+            # Rendered embeds may show snipes that are gone now
+            if sum(run.expired.values()) or sum(run.dropped_tables.values()) or sum(run.trimmed_rows.values()):
+                embed_cache.clear()
+
+            run.duration_ms = (time.perf_counter() - start) * 1000 - run.backoff_ms
+            self.runs.append(run)
+            self.total_runs += 1
+            self.total_expired += sum(run.expired.values())
+            self.total_dropped_rows += sum(run.dropped_rows.values())
+            self.total_trimmed_rows += sum(run.trimmed_rows.values())
+            self.total_backoff_ms += run.backoff_ms
+            self.max_duration_ms = max(self.max_duration_ms, run.duration_ms)
+
+            _logger.info(
+                "Purged %d snipes from memory, %d snipes in %d window tables and %d snipes by guild policies in %.2fms.",
+                sum(run.expired.values()), sum(run.dropped_rows.values()), sum(run.dropped_tables.values()), sum(run.trimmed_rows.values()), run.duration_ms,
+            )
+            return run
+
+    async def _drop_expired(self, run: PurgeRun, /) -> None:
+        expired = [(table, window) for table, _ in self._registered.values() for window in table.expired()]
+
+        for i in range(0, len(expired), self.chunk_tables):
+            chunk = expired[i:i + self.chunk_tables]
+
+            run.backoff_ms += await self._back_off()
+            await write_queue.flush() # Queued writes may target a window being dropped
+
+            # Readers stop using the windows first, a reader already inside one finds it empty.
+            for table, window in chunk:
+                table.forget(window)
+            try:
+                shard_counts = await asyncio.gather(*(self._drop_chunk(shard, chunk) for shard in range(SHARD_COUNT)))
+            except BaseException:
+                for table, window in chunk:
+                    table.remember(window)
+                raise
+            counts = [sum(shard_count) for shard_count in zip(*shard_counts)]
+
+            for (table, window), count in zip(chunk, counts):
+                run.dropped_rows[table.name] = run.dropped_rows.get(table.name, 0) + count
+                run.dropped_tables[table.name] = run.dropped_tables.get(table.name, 0) + 1
+            run.chunks += 1
+
+    async def _trim_guilds(self, run: PurgeRun, limits: dict[str, dict[int, tuple[int | None, int | None]]], /) -> None:
+        by_shard: dict[int, set[int]] = {}
+        for guild_limits in limits.values():
+            for guild_id in guild_limits:
+                by_shard.setdefault(shard_for(guild_id), set()).add(guild_id)
+
+        run.backoff_ms += await self._back_off()
+
+        async def trim_in(shard: int, guild_ids: set[int]) -> dict[str, int]:
+            await write_queue.flush(shard) # Queued snipes count towards the caps
+            trimmed = dict.fromkeys(limits, 0)
+            async with acquire(shard) as db:
+                async with db.transaction():
+                    for name, (table, _) in self._registered.items():
+                        for guild_id in guild_ids & limits[name].keys():
+                            before, keep = limits[name][guild_id]
+                            trimmed[name] += await table.trim_guild(db, guild_id, before=before, keep=keep)
+            return trimmed
+
+        for trimmed in await asyncio.gather(*(trim_in(shard, guild_ids) for shard, guild_ids in by_shard.items())):
+            for name, count in trimmed.items():
+                run.trimmed_rows[name] = run.trimmed_rows.get(name, 0) + count
+
+    async def _drop_chunk(self, shard: int, chunk: list[tuple[BucketedTable, int]], /) -> list[int]:
+        async with acquire(shard) as db:
+            # Nothing writes to expired windows, so they are counted before taking the write lock.
+            # A shard may have dropped the table already if an earlier run failed on another shard.
+            counts = []
+            for table, window in chunk:
+                exists = await db.fetchone("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", f"{table.name}_{window}")
+                counts.append((await db.fetchone(f"SELECT COUNT(*) FROM {table.name}_{window}"))[0] if exists else 0)
+
+            async with db.transaction():
+                for table, window in chunk:
+                    await table.drop(db, window)
+
+        return counts
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run()
+            except Exception:
+                _logger.exception("Snipe purge failed, it will be retried next interval.")
+
+
+purge_coordinator = PurgeCoordinator()
@@ -0,0 +1,261 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from __future__ import annotations
+
+"""
+Write-behind queue for snipe ingestion.
+
+Listeners put rows on the queue instead of writing them directly. The queue writes
+everything it holds once FLUSH_MAX_ROWS rows are waiting or FLUSH_INTERVAL_MS milliseconds
+have passed, whichever comes first, in one transaction per shard with all shards at once.
+"""
+
+import asyncio
+import itertools
+import logging
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Any
+
+import asqlite
+
+from .snipescommon import acquire
+
+_logger = logging.getLogger(__name__)
+
+# A flush is triggered once this many rows are waiting.
+FLUSH_MAX_ROWS = 500
+# Otherwise waiting rows are flushed this often.
+FLUSH_INTERVAL_MS = 250
+
+
+class SnipeWriteQueue:
+    """Buffers parameterized writes and flushes them with `executemany`, one transaction per shard.
+
+    Writes to a shard are flushed in the order they were put, consecutive writes using
+    the same statement are grouped into a single `executemany` call. Shards are flushed
+    independently, a shard that fails to flush only drops its own writes. Within a shard,
+    a group that fails is retried a row at a time, so only the rows that fail are dropped.
+    """
+    def __init__(self, *, max_rows: int = FLUSH_MAX_ROWS, interval_ms: int = FLUSH_INTERVAL_MS) -> None:
+        self.max_rows = max_rows
+        self.interval_ms = interval_ms
+
+        self._pending: defaultdict[int, list[tuple[str, tuple[Any, ...]]]] = defaultdict(list)
+        self._depth = 0
+        self._wakeup = asyncio.Event()
+        self._flush_locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+        # Counters
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def depth(self) -> int:
+        """The number of writes waiting to be flushed."""
+        return self._depth
+
+    @property
+    def avg_flush_ms(self) -> float:
+        """The average time taken by a flush in milliseconds."""
+        return self.total_flush_ms / self.flushes if self.flushes else 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stats(self) -> dict[str, float]:
+        """Returns the current queue depth and flush counters."""
+        return {
+            "depth": self.depth,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "avg_flush_ms": self.avg_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+    def put(self, shard: int, sql: str, params: tuple[Any, ...], /) -> None:
+        """Queues a single write.
+
+        Parameters
+        ----------
+        shard : int
+            The shard to write to, see `shard_for`.
+        sql : str
+            The parameterized statement to execute.
+        params : tuple[Any, ...]
+            The parameters for the statement.
+        """
+        self._pending[shard].append((sql, params))
+        self._depth += 1
+        if self._depth >= self.max_rows:
+            self._wakeup.set()
+
+    def put_many(self, shard: int, sql: str, params: list[tuple[Any, ...]], /) -> None:
+        """Queues several writes to one shard that use the same statement.
+
+        Parameters
+        ----------
+        shard : int
+            The shard to write to, see `shard_for`.
+        sql : str
+            The parameterized statement to execute.
+        params : list[tuple[Any, ...]]
+            The parameters for each write.
+        """
+        self._pending[shard].extend((sql, p) for p in params)
+        self._depth += len(params)
+        if self._depth >= self.max_rows:
+            self._wakeup.set()
+
+    async def _flush_shard(self, shard: int, /) -> int:
+        async with self._flush_locks[shard]:
+            batch = self._pending.pop(shard, [])
+            if not batch:
+                return 0
+            self._depth -= len(batch)
+
+            dropped = 0
+            try:
+                async with acquire(shard) as db:
+                    async with db.transaction():
+                        for sql, group in itertools.groupby(batch, key=lambda item: item[0]):
+                            dropped += await self._write_group(db, shard, sql, [params for _, params in group])
+            except Exception:
+                self.rows_dropped += len(batch)
+                _logger.exception("Failed to flush %d queued snipe writes to shard %d, they have been dropped.", len(batch), shard)
+                return 0
+
+            self.rows_dropped += dropped
+            self.rows_written += len(batch) - dropped
+            return len(batch) - dropped
+
+    async def _write_group(self, db: asqlite.Connection, shard: int, sql: str, group: list[tuple[Any, ...]], /) -> int:
+        # A failing statement only loses its own rows, the rest of the flush goes ahead.
+        await db.execute("SAVEPOINT flush_group")
+        try:
+            await db.executemany(sql, group)
+        except sqlite3.Error:
+            await db.execute("ROLLBACK TO flush_group")
+        else:
+            await db.execute("RELEASE flush_group")
+            return 0
+
+        # Retried one row at a time, a failed statement leaves nothing behind in SQLite.
+        dropped = 0
+        for params in group:
+            try:
+                await db.execute(sql, params)
+            except sqlite3.Error as e:
+                dropped += 1
+                _logger.error("Dropped a queued snipe write to shard %d that failed with %r: %s", shard, e, " ".join(sql.split()))
+        await db.execute("RELEASE flush_group")
+        return dropped
+
+    async def flush(self, shard: int | None = None, /) -> int:
+        """Writes what is currently queued, one transaction per shard with all shards at once.
+
+        Parameters
+        ----------
+        shard : int | None, optional
+            Only flush the writes to this shard, by default None for all shards.
+            Reads from one shard only need to wait for its writes.
+
+        Returns
+        -------
+        int
+            The number of rows written.
+        """
+        # Shards being flushed already are waited for, so everything queued before this call is written when it returns.
+        shards = set(self._pending).union(self._flush_locks) if shard is None else {shard}
+
+        start = time.perf_counter()
+        written = sum(await asyncio.gather(*(self._flush_shard(s) for s in shards)))
+        if not written:
+            return 0
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.last_flush_ms = elapsed
+        self.total_flush_ms += elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+
+        _logger.debug("Flushed %d snipe writes to %d shards in %.2fms.", written, len(shards), elapsed)
+        return written
+
+    def start(self) -> None:
+        """Starts flushing in the background."""
+        if not self.is_running:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stops the background flush and writes anything still queued."""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            await self.flush()
+
+
+write_queue = SnipeWriteQueue()
+_queue_users = 0
+
+
+def open_queue() -> None:
+    """Starts the shared write queue. Every call must be paired with `close_queue`."""
+    global _queue_users
+
+    _queue_users += 1
+    write_queue.start()
+
+
+async def close_queue() -> None:
+    """Releases a user of the shared write queue. The last user flushes and stops it."""
+    global _queue_users
+
+    _queue_users = max(_queue_users - 1, 0)
+    if _queue_users == 0:
+        await write_queue.close()
+    else:
+        await write_queue.flush()
@@ -19,5 +19,632 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+from __future__ import annotations
 
+"""
+This module uses the following third party libs installed via pip: asqlite (https://github.com/Rapptz/asqlite)
+"""
+
+import asyncio
+import json
+import logging
+import re
+import heapq
+import sqlite3
+import time
+from collections.abc import AsyncIterator, Callable
+from typing import Any, TypeVar
+
+import asqlite
+import discord
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Holds opt-outs and the schema versions of its own tables.
 DB_FILENAME = "snipes.sqlite"
+
+# Snipes are split by guild across this many files, so guilds on different shards never
+# wait on each other's write lock. Changing this leaves existing snipes in the file they
+# were written to, delete the shard files when changing it.
+SHARD_COUNT = 4
+SHARD_FILENAME = "snipes_{shard}.sqlite"
+
+# Snipes are served from memory. When this is True they are also written to the shard files
+# so that older snipes, and snipes from before a restart, can still be retrieved.
+PERSIST_SNIPES = True
+
+# Number of connections kept open to each shard file while any snipe cog is loaded.
+POOL_SIZE = 4
+# Number of connections kept open to DB_FILENAME, opt-out lookups are few and small.
+MAIN_POOL_SIZE = 2
+
+SCHEMA_VERSION_SETUP_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+)
+"""
+
+_pools: dict[str, asqlite.Pool] = {}
+_pool_users = 0
+_pool_lock = asyncio.Lock()
+
+
+def shard_for(guild_id: int, /) -> int:
+    """The shard a guild's snipes are stored in.
+
+    Guild ids are snowflakes, the creation time in their upper bits spreads guilds evenly.
+    """
+    return (guild_id >> 22) % SHARD_COUNT
+
+
+def is_missing_table(error: sqlite3.OperationalError, /) -> bool:
+    """Whether a statement failed because its window table was dropped as expired meanwhile."""
+    return str(error).startswith("no such table")
+
+
+def _filename(shard: int | None, /) -> str:
+    return DB_FILENAME if shard is None else SHARD_FILENAME.format(shard=shard)
+
+
+async def open_pool(*, size: int = POOL_SIZE) -> None:
+    """Opens the connection pools shared by all snipe models, one per database file.
+
+    Every cog that calls this must call `close_pool` when it unloads,
+    the pools are only closed once the last user releases them.
+
+    Parameters
+    ----------
+    size : int, optional
+        The number of connections to open per shard, by default POOL_SIZE.
+        Ignored if the pools are already open.
+    """
+    global _pool_users
+
+    async with _pool_lock:
+        if not _pools:
+            _pools[DB_FILENAME] = await asqlite.create_pool(DB_FILENAME, size=MAIN_POOL_SIZE)
+            for shard in range(SHARD_COUNT):
+                _pools[_filename(shard)] = await asqlite.create_pool(_filename(shard), size=size)
+            _logger.info("Opened snipe connection pools for %d shards with %d connections each.", SHARD_COUNT, size)
+        _pool_users += 1
+
+
+async def close_pool() -> None:
+    """Releases a user of the shared connection pools, closing them if it was the last one."""
+    global _pool_users
+
+    async with _pool_lock:
+        _pool_users = max(_pool_users - 1, 0)
+        if _pool_users == 0 and _pools:
+            pools = list(_pools.values())
+            _pools.clear()
+            for pool in pools:
+                await pool.close()
+            _logger.info("Closed snipe connection pools.")
+
+
+def acquire(shard: int | None = None, /):
+    """Gets a connection to a snipe database.
+
+    This is used in an async-with statement. A pooled connection is used when
+    the pools are open, otherwise a new connection is made for the duration of the block.
+
+    Parameters
+    ----------
+    shard : int | None, optional
+        The shard to connect to, see `shard_for`. By default None, which connects to DB_FILENAME.
+    """
+    pool = _pools.get(_filename(shard))
+    if pool is not None:
+        return pool.acquire()
+    return asqlite.connect(_filename(shard))
+
+
+async def migrate(name: str, migrations: list[str], /, *, shard: int | None = None) -> int:
+    """Brings a table's schema up to date.
+
+    The version of each table is kept in the schema_version table. Migrations newer than
+    that version are run in order, each in its own transaction along with the version bump.
+    Existing migrations must never be edited or reordered, only appended to.
+
+    Parameters
+    ----------
+    name : str
+        The name the version is tracked under, usually the table name.
+    migrations : list[str]
+        The SQL script for each version, starting with version 1.
+    shard : int | None, optional
+        The shard the table is in, by default None for DB_FILENAME.
+
+    Returns
+    -------
+    int
+        The number of migrations run.
+    """
+    assert name.isidentifier()
+
+    async with acquire(shard) as db:
+        await db.execute(SCHEMA_VERSION_SETUP_SQL)
+        row = await db.fetchone("SELECT version FROM schema_version WHERE name = ?", name)
+        current = row["version"] if row is not None else 0
+
+        for version, migration in enumerate(migrations[current:], current + 1):
+            script = (
+                f"BEGIN;\n{migration};\n"
+                f"INSERT INTO schema_version (name, version) VALUES ('{name}', {version}) "
+                f"ON CONFLICT(name) DO UPDATE SET version = excluded.version;\n"
+                "COMMIT;"
+            )
+            try:
+                await db.executescript(script)
+            except Exception:
+                await db.rollback()
+                raise
+
+            # New tables are created this way too, only upgrades are worth noting.
+            _logger.log(logging.INFO if current else logging.DEBUG, "Migrated %s to schema version %d.", name, version)
+
+        return max(len(migrations) - current, 0)
+
+
+_last_snipe_id = 0
+
+
+def next_snipe_id() -> int:
+    """Generates a new snipe id.
+
+    Ids are snowflakes based on the current time, so they are unique
+    and increase in the order the snipes were created.
+    """
+    global _last_snipe_id
+
+    _last_snipe_id = max(discord.utils.time_snowflake(discord.utils.utcnow()), _last_snipe_id + 1)
+    return _last_snipe_id
+
+
+async def merge_newest(sources: list[AsyncIterator[T]], /, *, key: Callable[[T], tuple[int, int]]) -> AsyncIterator[T]:
+    """Lazily merges sources that are each ordered newest first into one ordered newest first.
+
+    Only one item per source is held at a time, so sources are only read as far as the
+    merged output is.
+
+    Parameters
+    ----------
+    sources : list[AsyncIterator[T]]
+        The sources, each ordered by descending `key`.
+    key : Callable[[T], tuple[int, int]]
+        The `(time, id)` of an item.
+    """
+    heap: list[tuple[tuple[int, int], int, T]] = []
+
+    async def push(index: int) -> None:
+        item = await anext(sources[index], None)
+        if item is not None:
+            time_, id_ = key(item)
+            heapq.heappush(heap, ((-time_, -id_), index, item))
+
+    for index in range(len(sources)):
+        await push(index)
+
+    while heap:
+        _, index, item = heapq.heappop(heap)
+        yield item
+        await push(index)
+
+
+# Snipe ids before this value are database generated rather than snowflakes.
+_SNOWFLAKE_MIN = 1 << 22
+
+
+class BucketedTable:
+    """A snipe table split into one table per time window, named `<name>_<window number>`.
+
+    Each snipe is stored in the table for the window its id was created in. Expiring a
+    window drops its whole table instead of deleting rows from a shared one, so expiry
+    costs the same no matter how many rows there are and leaves no holes in live tables.
+
+    Every window table exists in every shard, holding the snipes of that shard's guilds.
+    They are created and upgraded from the same migrations, which are templates with a
+    `{table}` placeholder. Their versions are tracked per window table in each shard.
+
+    Parameters
+    ----------
+    name : str
+        The snipe type, used as the prefix of each window table.
+    migrations : list[str]
+        The migration templates, see `migrate`.
+    time_column : str
+        The column holding the unix timestamp of the snipe.
+    window_seconds : int
+        The length of each window. A window is dropped once all of it is older than this,
+        so snipes live between one and two windows.
+    """
+    # Windows created ahead of time, so inserts never hit a missing table.
+    AHEAD = 2
+
+    def __init__(self, name: str, migrations: list[str], *, time_column: str, window_seconds: int) -> None:
+        self.name = name
+        self.migrations = migrations
+        self.time_column = time_column
+        self.window_seconds = window_seconds
+
+        self._windows: set[int] = set()
+
+    def window_for(self, snipe_id: int, /) -> int:
+        """The window number a snipe id belongs to."""
+        created_ms = (snipe_id >> 22) + discord.utils.DISCORD_EPOCH
+        return created_ms // 1000 // self.window_seconds
+
+    def table_for(self, snipe_id: int, /) -> str:
+        """The name of the table a snipe id is stored in."""
+        return f"{self.name}_{self.window_for(snipe_id)}"
+
+    @property
+    def tables(self) -> list[str]:
+        """The names of all live window tables, oldest first."""
+        return [f"{self.name}_{window}" for window in sorted(self._windows)]
+
+    async def _create(self, window: int, /) -> None:
+        table = f"{self.name}_{window}"
+        migrations = [migration.format(table=table) for migration in self.migrations]
+        await asyncio.gather(*(migrate(table, migrations, shard=shard) for shard in range(SHARD_COUNT)))
+        self._windows.add(window)
+
+    async def load(self) -> None:
+        """Finds and upgrades existing window tables, then creates upcoming ones.
+
+        Expired windows are left for the purge coordinator to drop.
+
+        Tables from before sharding, in DB_FILENAME, have their rows moved into the window
+        tables of each shard and are dropped. That includes a table from before windows
+        were used, named just `name`.
+        """
+        windows: set[int] = set()
+        for shard in range(SHARD_COUNT):
+            async with acquire(shard) as db:
+                rows = await db.fetchall("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?", f"{self.name}_[0-9]*")
+            windows.update(int(row["name"].rsplit("_", 1)[1]) for row in rows)
+
+        for window in sorted(windows):
+            await self._create(window)
+
+        async with acquire() as db:
+            rows = await db.fetchall(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND (name = ? OR name GLOB ?)", self.name, f"{self.name}_[0-9]*"
+            )
+
+        for row in rows:
+            await self._move_to_shards(row["name"])
+
+        await self.create_upcoming()
+
+    async def _move_to_shards(self, source: str, /) -> None:
+        # Bring the columns in line with the window tables first.
+        await migrate(source, [migration.format(table=source) for migration in self.migrations])
+
+        async with acquire() as db:
+            # Rows from before snowflake ids get one, so they land in the right window.
+            await db.execute(f"""UPDATE {source} SET id = (({self.time_column} * 1000 - ?) << 22) + id
+            WHERE id < ?""", discord.utils.DISCORD_EPOCH, _SNOWFLAKE_MIN)
+
+            window_expr = f"((id >> 22) + {discord.utils.DISCORD_EPOCH}) / 1000 / {self.window_seconds}"
+            windows = [row["w"] for row in await db.fetchall(f"SELECT DISTINCT {window_expr} AS w FROM {source}")]
+
+        for window in windows:
+            await self._create(window)
+
+        for shard in range(SHARD_COUNT):
+            async with acquire(shard) as db:
+                await db.execute("ATTACH DATABASE ? AS unsharded", DB_FILENAME)
+                try:
+                    async with db.transaction():
+                        for window in windows:
+                            # Ignoring rows already there lets a move cut short be run again.
+                            await db.execute(
+                                f"INSERT OR IGNORE INTO {self.name}_{window} SELECT * FROM unsharded.{source} WHERE {window_expr} = ? AND (guild_id >> 22) % ? = ?",
+                                window, SHARD_COUNT, shard,
+                            )
+                finally:
+                    await db.execute("DETACH DATABASE unsharded")
+
+        async with acquire() as db:
+            async with db.transaction():
+                await db.execute(f"DROP TABLE {source}")
+                await db.execute("DELETE FROM schema_version WHERE name = ?", source)
+
+        _logger.info("Moved %s into %d window tables across %d shards.", source, len(windows), SHARD_COUNT)
+
+    async def create_upcoming(self) -> None:
+        """Creates the tables for the current window and the next `AHEAD` windows if missing."""
+        current = int(time.time()) // self.window_seconds
+        for window in range(current, current + self.AHEAD + 1):
+            if window not in self._windows:
+                await self._create(window)
+
+    def expired(self) -> list[int]:
+        """The live windows that are entirely older than `window_seconds`, oldest first."""
+        cutoff = int(time.time()) - self.window_seconds
+        return [window for window in sorted(self._windows) if (window + 1) * self.window_seconds <= cutoff]
+
+    async def drop(self, db: asqlite.Connection, window: int, /) -> None:
+        """Drops a window table using the given shard connection.
+
+        This is meant to be run inside the caller's transaction, once for every shard.
+        Call `forget` first, so nothing reads from the window while it is dropped.
+        """
+        table = f"{self.name}_{window}"
+        await db.execute(f"DROP TABLE IF EXISTS {table}")
+        await db.execute("DELETE FROM schema_version WHERE name = ?", table)
+
+    def forget(self, window: int, /) -> None:
+        """Stops reading from a window whose table is about to be dropped."""
+        self._windows.discard(window)
+
+    def remember(self, window: int, /) -> None:
+        """Reads from a forgotten window again after its table failed to drop, so it is retried."""
+        self._windows.add(window)
+
+    async def _iter_table(self, shard: int, table: str, column: str, value: int, before: tuple[int, int] | None, batch_size: int, /) -> AsyncIterator[sqlite3.Row]:
+        while True:
+            if table not in self.tables:
+                return # Dropped as expired since
+
+            try:
+                async with acquire(shard) as db:
+                    if before is None:
+                        rows = await db.fetchall(
+                            f"SELECT * FROM {table} WHERE {column} = ? ORDER BY {self.time_column} DESC, id DESC LIMIT ?", value, batch_size
+                        )
+                    else:
+                        rows = await db.fetchall(
+                            f"SELECT * FROM {table} WHERE {column} = ? AND ({self.time_column}, id) < (?, ?) ORDER BY {self.time_column} DESC, id DESC LIMIT ?",
+                            value, *before, batch_size,
+                        )
+            except sqlite3.OperationalError as e:
+                if is_missing_table(e):
+                    return # Dropped while reading
+                raise
+
+            for row in rows:
+                yield row
+
+            if len(rows) < batch_size:
+                return
+            before = (rows[-1][self.time_column], rows[-1]["id"])
+
+    def iter_newest(
+        self, column: str, value: int, /, *, shard: int | None = None, before: tuple[int, int] | None = None, batch_size: int = 50
+    ) -> AsyncIterator[sqlite3.Row]:
+        """Lazily yields the rows where `column = value` from every window, newest first.
+
+        Each window is read in batches that continue from the last row read, by
+        `(time, id)` rather than by OFFSET, so reading further back stays as fast.
+
+        Parameters
+        ----------
+        column : str
+            The indexed column to match, `guild_id` or `channel_id`.
+        value : int
+            The value to match.
+        shard : int | None, optional
+            The shard holding the rows, see `shard_for`. By default None, which reads every shard.
+        before : tuple[int, int] | None, optional
+            Only yield rows ordered before this `(time, id)` cursor, by default None
+        batch_size : int, optional
+            The rows read from a window at a time, by default 50
+        """
+        shards = range(SHARD_COUNT) if shard is None else [shard]
+        sources = [self._iter_table(s, table, column, value, before, batch_size) for s in shards for table in reversed(self.tables)]
+        return merge_newest(sources, key=lambda row: (row[self.time_column], row["id"]))
+
+    async def iter_matching(self, column: str, value: int, /, *, batch_size: int = 500) -> AsyncIterator[sqlite3.Row]:
+        """Lazily yields every row where `column = value`, from every shard and window.
+
+        Rows are read in batches continuing from the last id read, so only one batch is
+        held at a time however many rows match. They come in id order within each window
+        table, not overall.
+
+        Parameters
+        ----------
+        column : str
+            The indexed column to match.
+        value : int
+            The value to match.
+        batch_size : int, optional
+            The rows read at a time, by default 500
+        """
+        for shard in range(SHARD_COUNT):
+            for table in self.tables:
+                after = 0
+                while True:
+                    if table not in self.tables:
+                        break # Dropped as expired since
+
+                    try:
+                        async with acquire(shard) as db:
+                            rows = await db.fetchall(f"SELECT * FROM {table} WHERE {column} = ? AND id > ? ORDER BY id LIMIT ?", value, after, batch_size)
+                    except sqlite3.OperationalError as e:
+                        if is_missing_table(e):
+                            break # Dropped while reading
+                        raise
+
+                    for row in rows:
+                        yield row
+
+                    if len(rows) < batch_size:
+                        break
+                    after = rows[-1]["id"]
+
+    async def trim_guild(self, db: asqlite.Connection, guild_id: int, /, *, before: int | None, keep: int | None) -> int:
+        """Deletes a guild's snipes older than `before`, and all but the newest `keep` in each of its channels.
+
+        This is meant to be run inside the caller's transaction, on the guild's shard.
+        Every delete goes through the guild or channel index.
+
+        Parameters
+        ----------
+        db : asqlite.Connection
+            A connection to the guild's shard.
+        guild_id : int
+            The guild to trim.
+        before : int | None
+            The unix timestamp to delete snipes from before, None to keep them all.
+        keep : int | None
+            The number of snipes to keep per channel, None to keep them all.
+
+        Returns
+        -------
+        int
+            The number of rows deleted.
+        """
+        deleted = 0
+        if before is not None:
+            for table in self.tables:
+                cur = await db.execute(f"DELETE FROM {table} WHERE guild_id = ? AND {self.time_column} < ?", guild_id, before)
+                deleted += cur.get_cursor().rowcount
+
+        if keep is None:
+            return deleted
+
+        # Rows left to keep per channel, counted down from the newest window.
+        remaining: dict[int, int] = {}
+        for table in reversed(self.tables):
+            counts = await db.fetchall(f"SELECT channel_id, COUNT(*) AS count FROM {table} WHERE guild_id = ? GROUP BY channel_id", guild_id)
+            for row in counts:
+                channel_id, count = row["channel_id"], row["count"]
+                left = remaining.setdefault(channel_id, keep)
+                remaining[channel_id] = max(left - count, 0)
+                if left >= count:
+                    continue
+
+                if left == 0:
+                    cur = await db.execute(f"DELETE FROM {table} WHERE channel_id = ?", channel_id)
+                else:
+                    # The newest row past what is kept, everything from it back goes.
+                    cutoff = await db.fetchone(
+                        f"SELECT {self.time_column}, id FROM {table} WHERE channel_id = ? ORDER BY {self.time_column} DESC, id DESC LIMIT 1 OFFSET ?",
+                        channel_id, left,
+                    )
+                    cur = await db.execute(f"DELETE FROM {table} WHERE channel_id = ? AND ({self.time_column}, id) <= (?, ?)", channel_id, *cutoff)
+                deleted += cur.get_cursor().rowcount
+
+        return deleted
+
+    async def delete_where(self, condition: str, /, *params: Any, shard: int | None = None) -> int:
+        """Deletes matching rows from every live window table.
+
+        Each shard is deleted from in its own transaction, all shards at once.
+
+        Parameters
+        ----------
+        condition : str
+            The WHERE clause to delete by.
+        *params : Any
+            The parameters for the clause.
+        shard : int | None, optional
+            The only shard that can hold matching rows, see `shard_for`. By default None, which deletes from every shard.
+
+        Returns
+        -------
+        int
+            The number of rows deleted.
+        """
+        async def delete_in(shard: int) -> int:
+            deleted = 0
+            async with acquire(shard) as db:
+                async with db.transaction():
+                    for table in self.tables:
+                        try:
+                            cur = await db.execute(f"DELETE FROM {table} WHERE {condition}", *params)
+                        except sqlite3.OperationalError as e:
+                            if is_missing_table(e):
+                                continue # Dropped as expired, nothing left to delete
+                            raise
+                        deleted += cur.get_cursor().rowcount
+            return deleted
+
+        shards = range(SHARD_COUNT) if shard is None else [shard]
+        return sum(await asyncio.gather(*(delete_in(s) for s in shards)))
+
+
+_MENTION_RE = re.compile(r"<(@[!&]?|#)([0-9]{15,20})>")
+
+
+def mention_names(*messages: discord.Message) -> str | None:
+    """Captures the display names of users mentioned in messages.
+
+    Mentioned users are sent along with the message, so this is cheap. They are kept
+    so mentions of users that left can still be rendered by `clean_content`.
+
+    Returns
+    -------
+    str | None
+        A JSON object of user id to display name, or None if nobody was mentioned.
+    """
+    names = {str(user.id): user.display_name for message in messages for user in message.mentions}
+    return json.dumps(names) if names else None
+
+
+def clean_content(content: str | None, guild: discord.Guild, names: str | None, /) -> str | None:
+    """Renders raw message content the way `discord.Message.clean_content` does.
+
+    This is done when a snipe is shown rather than when it is recorded,
+    as most snipes expire without ever being shown.
+
+    Parameters
+    ----------
+    content : str | None
+        The raw message content.
+    guild : discord.Guild
+        The guild to resolve mentions in.
+    names : str | None
+        The names captured by `mention_names` when the snipe was recorded.
+
+    Returns
+    -------
+    str | None
+        The cleaned content.
+    """
+    if not content:
+        return content
+
+    users = json.loads(names) if names is not None else {}
+
+    def repl(match: re.Match) -> str:
+        kind, id = match[1], int(match[2])
+
+        if kind == "#":
+            channel = guild.get_channel_or_thread(id)
+            return f"#{channel.name}" if channel else "#deleted-channel"
+        if kind == "@&":
+            role = guild.get_role(id)
+            return f"@{role.name}" if role else "@deleted-role"
+
+        member = guild.get_member(id)
+        if member is not None:
+            return f"@{member.display_name}"
+        return f"@{users[str(id)]}" if str(id) in users else "@deleted-user"
+
+    return discord.utils.escape_mentions(_MENTION_RE.sub(repl, content))
+
+
+def shorten(text: str, /, *, width: int = 100) -> str:
+    """Cuts text down to a given length for one line summaries, on a single line.
+
+    Parameters
+    ----------
+    text : str
+        The text to shorten
+    width : int, optional
+        The maximum length, by default 100
+
+    Returns
+    -------
+    str
+        The shortened text.
+    """
+    text = " ".join(text.split())
+    return text if len(text) <= width else text[:width - 1] + "\N{HORIZONTAL ELLIPSIS}"
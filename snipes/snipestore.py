@@ -0,0 +1,371 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from __future__ import annotations
+
+"""
+In memory store for recent snipes.
+
+Each snipe type keeps one of these. Every channel holds a bounded deque of its newest
+snipes, newest last. When the store holds more than its record limit, the channels
+that were least recently used are dropped entirely.
+"""
+
+from collections import OrderedDict, deque
+from typing import Generic, Iterator, Mapping, Protocol, TypeVar
+
+# Maximum snipes held in memory per channel.
+MAX_PER_CHANNEL = 100
+# Maximum snipes held in memory per snipe type across all channels.
+MAX_RECORDS = 50_000
+
+
+class _Snipe(Protocol):
+    id: int
+    guild_id: int
+    channel_id: int
+
+
+T = TypeVar("T", bound=_Snipe)
+
+
+class SnipeStore(Generic[T]):
+    """Bounded per-channel storage of snipes with LRU eviction of idle channels.
+
+    Parameters
+    ----------
+    user_attr : str
+        The attribute holding the id of the user the snipe belongs to.
+    time_attr : str
+        The attribute holding the unix timestamp the snipe expires by.
+    max_per_channel : int, optional
+        The number of snipes kept per channel, by default MAX_PER_CHANNEL
+    max_records : int, optional
+        The number of snipes kept across all channels, by default MAX_RECORDS
+    """
+    def __init__(self, *, user_attr: str, time_attr: str, max_per_channel: int = MAX_PER_CHANNEL, max_records: int = MAX_RECORDS) -> None:
+        self.user_attr = user_attr
+        self.time_attr = time_attr
+        self.max_per_channel = max_per_channel
+        self.max_records = max_records
+
+        self._channels: OrderedDict[int, deque[T]] = OrderedDict()
+        self._size = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evicted_channels = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[T]:
+        return (s for snipes in self._channels.values() for s in snipes)
+
+    def _get_channel(self, channel_id: int, /) -> deque[T] | None:
+        snipes = self._channels.get(channel_id)
+        if snipes is not None:
+            self._channels.move_to_end(channel_id)
+        return snipes
+
+    def add(self, snipe: T, /) -> None:
+        """Adds a snipe as the newest in its channel.
+
+        Parameters
+        ----------
+        snipe : T
+            The snipe to add.
+        """
+        snipes = self._get_channel(snipe.channel_id)
+        if snipes is None:
+            snipes = self._channels[snipe.channel_id] = deque(maxlen=self.max_per_channel)
+
+        if len(snipes) == snipes.maxlen:
+            self._size -= 1 # The oldest is pushed out
+        snipes.append(snipe)
+        self._size += 1
+
+        while self._size > self.max_records and len(self._channels) > 1:
+            _, evicted = self._channels.popitem(last=False)
+            self._size -= len(evicted)
+            self.evicted_channels += 1
+
+    def get(self, channel_id: int, /, *, offset: int = 0) -> T | None:
+        """Gets a snipe in a channel at a given offset, newest first.
+
+        Parameters
+        ----------
+        channel_id : int
+            The channel to retrieve from
+        offset : int, optional
+            The number of entries back to check, by default 0
+
+        Returns
+        -------
+        T | None
+            The snipe if held in memory, else None.
+        """
+        snipes = self._get_channel(channel_id)
+        if snipes is None or not 0 <= offset < len(snipes):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return snipes[-1 - offset]
+
+    def move_to_newest(self, snipe: T, /) -> bool:
+        """Moves a snipe that was changed in place to the newest position in its channel.
+
+        Parameters
+        ----------
+        snipe : T
+            The snipe to move.
+
+        Returns
+        -------
+        bool
+            Whether the snipe was held in memory.
+        """
+        snipes = self._get_channel(snipe.channel_id)
+        if snipes is None:
+            return False
+
+        for i, held in enumerate(snipes):
+            if held is snipe:
+                del snipes[i]
+                snipes.append(snipe)
+                return True
+        return False
+
+    def latest_id(self, channel_id: int, /) -> int | None:
+        """Gets the id of the newest snipe held for a channel, without counting a lookup.
+
+        Parameters
+        ----------
+        channel_id : int
+            The channel to check
+
+        Returns
+        -------
+        int | None
+            The id, None if no snipes are held for the channel.
+        """
+        snipes = self._channels.get(channel_id)
+        if not snipes:
+            return None
+        return snipes[-1].id
+
+    def oldest(self, channel_id: int, /) -> tuple[int, T | None]:
+        """Gets the number of snipes held for a channel and the oldest of them.
+
+        Parameters
+        ----------
+        channel_id : int
+            The channel to check
+
+        Returns
+        -------
+        tuple[int, T | None]
+            The number of snipes held and the oldest, None if there are none.
+        """
+        snipes = self._channels.get(channel_id)
+        if not snipes:
+            return 0, None
+        return len(snipes), snipes[0]
+
+    def newest(self, *, guild_id: int | None = None, channel_id: int | None = None, before: tuple[int, int] | None = None) -> list[T]:
+        """Gets the snipes in a guild or channel, newest first by time then id.
+
+        Parameters
+        ----------
+        guild_id : int | None, optional
+            The guild to get from, by default None
+        channel_id : int | None, optional
+            The channel to get from, by default None
+        before : tuple[int, int] | None, optional
+            Only get snipes ordered before this `(time, id)` cursor, by default None
+
+        Returns
+        -------
+        list[T]
+            The snipes.
+        """
+        if channel_id is not None:
+            snipes = list(self._channels.get(channel_id, ()))
+        else:
+            snipes = [s for channel in self._channels.values() for s in channel if s.guild_id == guild_id]
+
+        key = lambda s: (getattr(s, self.time_attr), s.id)
+        if before is not None:
+            snipes = [s for s in snipes if key(s) < before]
+        return sorted(snipes, key=key, reverse=True)
+
+    def of_user(self, user_id: int, /) -> list[T]:
+        """Gets all snipes belonging to a user, oldest first within each channel.
+
+        Parameters
+        ----------
+        user_id : int
+            The user to get
+
+        Returns
+        -------
+        list[T]
+            The snipes.
+        """
+        return [s for snipes in self._channels.values() for s in snipes if getattr(s, self.user_attr) == user_id]
+
+    def remove_at(self, channel_id: int, /, *, offset: int = 0) -> T | None:
+        """Removes the snipe in a channel at a given offset, newest first.
+
+        Parameters
+        ----------
+        channel_id : int
+            The channel to remove in
+        offset : int, optional
+            The number of entries back to remove, by default 0
+
+        Returns
+        -------
+        T | None
+            The removed snipe if it was held in memory, else None.
+        """
+        snipes = self._channels.get(channel_id)
+        if snipes is None or not 0 <= offset < len(snipes):
+            return None
+
+        snipe = snipes[-1 - offset]
+        del snipes[-1 - offset]
+        self._size -= 1
+
+        if not snipes:
+            del self._channels[channel_id]
+        return snipe
+
+    def clear_channel(self, channel_id: int, /) -> int:
+        """Removes all snipes in a channel.
+
+        Parameters
+        ----------
+        channel_id : int
+            The channel to clear
+
+        Returns
+        -------
+        int
+            The number of snipes removed.
+        """
+        snipes = self._channels.pop(channel_id, None)
+        if snipes is None:
+            return 0
+
+        self._size -= len(snipes)
+        return len(snipes)
+
+    def clear_user(self, user_id: int, /) -> int:
+        """Removes all snipes belonging to a user.
+
+        Parameters
+        ----------
+        user_id : int
+            The user to clear
+
+        Returns
+        -------
+        int
+            The number of snipes removed.
+        """
+        removed = 0
+        for channel_id, snipes in list(self._channels.items()):
+            kept = [s for s in snipes if getattr(s, self.user_attr) != user_id]
+            if len(kept) == len(snipes):
+                continue
+
+            removed += len(snipes) - len(kept)
+            if kept:
+                self._channels[channel_id] = deque(kept, maxlen=self.max_per_channel)
+            else:
+                del self._channels[channel_id]
+
+        self._size -= removed
+        return removed
+
+    def expire(self, before: int, /) -> int:
+        """Removes all snipes older than a given time.
+
+        Parameters
+        ----------
+        before : int
+            The unix timestamp to remove snipes from before.
+
+        Returns
+        -------
+        int
+            The number of snipes removed.
+        """
+        removed = 0
+        for channel_id, snipes in list(self._channels.items()):
+            while snipes and getattr(snipes[0], self.time_attr) < before:
+                snipes.popleft()
+                removed += 1
+
+            if not snipes:
+                del self._channels[channel_id]
+
+        self._size -= removed
+        return removed
+
+    def trim_guilds(self, limits: Mapping[int, tuple[int | None, int | None]], /) -> int:
+        """Removes snipes of guilds with their own limits.
+
+        Parameters
+        ----------
+        limits : Mapping[int, tuple[int | None, int | None]]
+            Guild id to the unix timestamp to remove snipes from before, and the number of
+            snipes to keep per channel, each None if not limited.
+
+        Returns
+        -------
+        int
+            The number of snipes removed.
+        """
+        removed = 0
+        for channel_id, snipes in list(self._channels.items()):
+            limit = limits.get(snipes[0].guild_id)
+            if limit is None:
+                continue
+
+            before, keep = limit
+            kept = [s for s in snipes if before is None or getattr(s, self.time_attr) >= before]
+            if keep is not None:
+                kept = kept[len(kept) - keep:] if keep < len(kept) else kept
+            if len(kept) == len(snipes):
+                continue
+
+            removed += len(snipes) - len(kept)
+            if kept:
+                self._channels[channel_id] = deque(kept, maxlen=self.max_per_channel)
+            else:
+                del self._channels[channel_id]
+
+        self._size -= removed
+        return removed
@@ -0,0 +1,180 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from __future__ import annotations
+
+"""
+Guild and channel wide snipe timelines.
+
+Deleted messages, edits and removed reactions of a guild or channel are read lazily from
+each snipe type, newest first, and merged into one timeline shown a page at a time.
+
+This module uses the following third party libs installed via pip: asqlite (https://github.com/Rapptz/asqlite)
+"""
+
+import logging
+from collections.abc import AsyncIterator
+
+import discord
+from discord.ext import commands
+
+from utils.paginator import LazyEmbedPaginatorView
+
+from .editsnipe import EditSnipe
+from .messagesnipe import DeleteSnipe
+from .reactionsnipe import ReactionSnipe
+from .snipescommon import close_pool, merge_newest, open_pool
+
+_logger = logging.getLogger(__name__)
+
+# Snipes shown per timeline page.
+PAGE_SIZE = 10
+
+AnySnipe = DeleteSnipe | EditSnipe | ReactionSnipe
+
+
+def guild_timeline(guild_id: int, /, *, before: tuple[int, int] | None = None) -> AsyncIterator[AnySnipe]:
+    """Lazily yields every snipe in a guild, of all types, newest first.
+
+    Parameters
+    ----------
+    guild_id : int
+        The guild to get snipes from.
+    before : tuple[int, int] | None, optional
+        Only yield snipes ordered before this `cursor`, by default None
+    """
+    sources: list[AsyncIterator[AnySnipe]] = [
+        DeleteSnipe.iter_newest(guild_id=guild_id, before=before),
+        EditSnipe.iter_newest(guild_id=guild_id, before=before),
+        ReactionSnipe.iter_newest(guild_id=guild_id, before=before),
+    ]
+    return merge_newest(sources, key=lambda snipe: snipe.cursor)
+
+
+def channel_timeline(channel_id: int, /, *, guild_id: int, before: tuple[int, int] | None = None) -> AsyncIterator[AnySnipe]:
+    """Lazily yields every snipe in a channel, of all types, newest first.
+
+    Parameters
+    ----------
+    channel_id : int
+        The channel to get snipes from.
+    guild_id : int
+        The guild the channel is in.
+    before : tuple[int, int] | None, optional
+        Only yield snipes ordered before this `cursor`, by default None
+    """
+    sources: list[AsyncIterator[AnySnipe]] = [
+        DeleteSnipe.iter_newest(guild_id=guild_id, channel_id=channel_id, before=before),
+        EditSnipe.iter_newest(guild_id=guild_id, channel_id=channel_id, before=before),
+        ReactionSnipe.iter_newest(guild_id=guild_id, channel_id=channel_id, before=before),
+    ]
+    return merge_newest(sources, key=lambda snipe: snipe.cursor)
+
+
+async def render_pages(snipes: AsyncIterator[AnySnipe], guild: discord.Guild, viewer: discord.Member, /, *, title: str) -> AsyncIterator[discord.Embed]:
+    """Renders snipes into embeds of PAGE_SIZE snipes, skipping channels the viewer can't read.
+
+    Parameters
+    ----------
+    snipes : AsyncIterator[AnySnipe]
+        The snipes, in order.
+    guild : discord.Guild
+        The guild the snipes are from.
+    viewer : discord.Member
+        The member the snipes are shown to.
+    title : str
+        The title of every page.
+    """
+    lines: list[str] = []
+    readable: dict[int, bool] = {}
+
+    async for snipe in snipes:
+        if snipe.channel_id not in readable:
+            channel = guild.get_channel_or_thread(snipe.channel_id)
+            readable[snipe.channel_id] = channel is not None and channel.permissions_for(viewer).read_message_history
+        if not readable[snipe.channel_id]:
+            continue
+
+        lines.append(snipe.summary(guild))
+        if len(lines) == PAGE_SIZE:
+            yield discord.Embed(title=title, description="\n".join(lines), color=discord.Color.blue())
+            lines = []
+
+    if lines:
+        yield discord.Embed(title=title, description="\n".join(lines), color=discord.Color.blue())
+
+
+class SnipeTimelineCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_load(self) -> None:
+        await open_pool()
+
+    async def cog_unload(self) -> None:
+        await close_pool()
+
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    async def snipes(self, ctx: commands.Context) -> None:
+        """Commands for viewing several snipes at once."""
+        await ctx.send_help(ctx.command)
+
+    @snipes.command(name="all")
+    async def snipes_all(self, ctx: commands.Context) -> None:
+        """Shows deleted messages, edits and removed reactions across the server, newest first."""
+        assert ctx.guild
+        assert isinstance(ctx.author, discord.Member)
+
+        pages = render_pages(guild_timeline(ctx.guild.id), ctx.guild, ctx.author, title=f"Snipes in {ctx.guild.name}")
+        await self._send_pages(ctx, pages)
+
+    @snipes.command(name="channel", aliases=("browse",))
+    async def snipes_channel(self, ctx: commands.Context, channel: discord.TextChannel | discord.Thread | None = None) -> None:
+        """Pages through deleted messages, edits and removed reactions in a channel, newest first.
+
+        Parameters
+        ----------
+        channel : discord.TextChannel | discord.Thread | None
+            The channel to browse, defaults to the current channel.
+        """
+        assert ctx.guild
+        assert isinstance(ctx.author, discord.Member)
+
+        channel_id = channel.id if channel is not None else ctx.channel.id
+        pages = render_pages(channel_timeline(channel_id, guild_id=ctx.guild.id), ctx.guild, ctx.author, title=f"Snipes in #{channel or ctx.channel}")
+        await self._send_pages(ctx, pages)
+
+    async def _send_pages(self, ctx: commands.Context, pages: AsyncIterator[discord.Embed], /) -> None:
+        paginator = await LazyEmbedPaginatorView.start(ctx.author, pages)
+        if paginator is None:
+            await ctx.send("No snipes found.")
+            return
+
+        paginator.message = await ctx.send(embed=paginator.initial, view=paginator)
+
+
+async def setup(bot: commands.Bot):
+    _logger.info("Loading cog SnipeTimelineCog")
+    await bot.add_cog(SnipeTimelineCog(bot))
+
+async def teardown(_: commands.Bot):
+    _logger.info("Unloading cog SnipeTimelineCog")
@@ -0,0 +1,88 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Checks for the compressed text column codec.
+
+Run from the root of the repo with `python -m unittest discover tests`.
+"""
+
+import sqlite3
+import unittest
+
+from utils.codec import COMPRESS_MIN_BYTES, MARKER_ZLIB, MARKER_ZLIB_DICT, decode_row, decode_text, encode_text, register_dictionary
+
+DICTIONARY_ID = 200
+DICTIONARY = b"Traceback (most recent call last):\n  File "
+LONG = "Traceback (most recent call last):\n  File \"bot.py\", line 1\n" * 20
+
+
+class CodecTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        register_dictionary(DICTIONARY_ID, DICTIONARY)
+
+    def test_short_and_missing_values_are_kept(self) -> None:
+        for value in (None, "", "short", "\N{SNAKE}" * (COMPRESS_MIN_BYTES // 4 - 1)):
+            self.assertEqual(encode_text(value), value)
+            self.assertEqual(decode_text(value), value)
+
+    def test_round_trips_with_marker(self) -> None:
+        encoded = encode_text(LONG)
+        assert isinstance(encoded, bytes)
+        self.assertEqual(encoded[0], MARKER_ZLIB)
+        self.assertLess(len(encoded), len(LONG))
+        self.assertEqual(decode_text(encoded), LONG)
+
+    def test_round_trips_with_dictionary(self) -> None:
+        encoded = encode_text(LONG, dictionary_id=DICTIONARY_ID)
+        assert isinstance(encoded, bytes)
+        self.assertEqual(encoded[:2], bytes((MARKER_ZLIB_DICT, DICTIONARY_ID)))
+        self.assertEqual(decode_text(encoded), LONG)
+
+    def test_unknown_marker_raises(self) -> None:
+        with self.assertRaises(ValueError):
+            decode_text(b"\x03data")
+
+    def test_dictionary_can_not_change(self) -> None:
+        register_dictionary(DICTIONARY_ID, DICTIONARY)
+        with self.assertRaises(ValueError):
+            register_dictionary(DICTIONARY_ID, b"something else")
+        with self.assertRaises(ValueError):
+            register_dictionary(256, DICTIONARY)
+
+    def test_decodes_stored_rows(self) -> None:
+        # Plain text rows written before compression was used are read back unchanged.
+        with sqlite3.connect(":memory:") as db:
+            db.row_factory = sqlite3.Row
+            db.execute("CREATE TABLE t (id INTEGER, content TEXT NULL)")
+            db.executemany("INSERT INTO t VALUES (?, ?)", [(1, encode_text(LONG)), (2, "plain"), (3, None)])
+            rows = db.execute("SELECT * FROM t ORDER BY id").fetchall()
+        db.close()
+
+        self.assertEqual([decode_row(row, "content") for row in rows], [
+            {"id": 1, "content": LONG}, {"id": 2, "content": "plain"}, {"id": 3, "content": None},
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
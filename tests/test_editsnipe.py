@@ -0,0 +1,159 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Checks for coalescing successive edits of a message into one edit snipe and storing them as diffs.
+
+Run from the root of the repo with `python -m unittest discover tests`.
+"""
+
+import datetime
+import os
+import tempfile
+import time
+import unittest
+
+import discord
+
+from snipes.editsnipe import COALESCE_SECONDS, DELTA_MIN_LENGTH, EditSnipe, decode_delta, encode_delta, snipe_table
+from snipes.snipequeue import write_queue
+from snipes.snipescommon import acquire, shard_for
+
+GUILD_ID = 1 << 22
+
+
+def make_edit(edited_at: int, *, channel_id: int, message_id: int, before: str, after: str) -> EditSnipe:
+    snipe_id = discord.utils.time_snowflake(datetime.datetime.fromtimestamp(edited_at, tz=datetime.timezone.utc))
+    return EditSnipe(
+        id=snipe_id, edited_at=edited_at, sender_id=10, before_content=before, after_content=after,
+        guild_id=GUILD_ID, channel_id=channel_id, message_id=message_id,
+    )
+
+
+# The window tables known to `snipe_table` are shared by every test, so is the directory.
+_tmp = tempfile.TemporaryDirectory()
+_cwd = os.getcwd()
+
+
+def setUpModule() -> None:
+    os.chdir(_tmp.name)
+
+
+def tearDownModule() -> None:
+    os.chdir(_cwd)
+    _tmp.cleanup()
+
+
+class CoalesceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        await snipe_table.load()
+
+        # The end of the current window, whose next window exists ahead of time too.
+        self.window_end = (int(time.time()) // snipe_table.window_seconds + 1) * snipe_table.window_seconds
+
+    async def rows(self, snipe: EditSnipe) -> list[tuple[str, str]]:
+        await write_queue.flush()
+        async with acquire(shard_for(GUILD_ID)) as db:
+            rows = await db.fetchall(f"SELECT before_content, after_content FROM {snipe_table.table_for(snipe.id)} WHERE channel_id = ?", snipe.channel_id)
+        return [(row[0], row[1]) for row in rows]
+
+    async def test_coalesces_within_window(self) -> None:
+        first = make_edit(self.window_end - COALESCE_SECONDS, channel_id=100, message_id=1000, before="a", after="b")
+        first.save()
+        make_edit(self.window_end - 1, channel_id=100, message_id=1000, before="b", after="c").save()
+
+        newest = await EditSnipe.get_in_channel(100, guild_id=GUILD_ID)
+        assert newest is not None
+        self.assertEqual((newest.id, newest.before, newest.after_content), (first.id, "a", "c"))
+        self.assertIsNone(await EditSnipe.get_in_channel(100, guild_id=GUILD_ID, offset=1))
+        self.assertEqual(await self.rows(first), [("a", "c")])
+
+    async def test_records_anew_after_window_ends(self) -> None:
+        dropped = write_queue.rows_dropped
+        first = make_edit(self.window_end - 5, channel_id=200, message_id=2000, before="a", after="b")
+        first.save()
+        second = make_edit(self.window_end + 5, channel_id=200, message_id=2000, before="b", after="c")
+        second.save()
+
+        # The first snipe keeps the edit time of its window, so memory expires it with its table.
+        newest = await EditSnipe.get_in_channel(200, guild_id=GUILD_ID)
+        older = await EditSnipe.get_in_channel(200, guild_id=GUILD_ID, offset=1)
+        assert newest is not None and older is not None
+        self.assertEqual((newest.id, newest.after_content), (second.id, "c"))
+        self.assertEqual((older.id, older.edited_at, older.after_content), (first.id, self.window_end - 5, "b"))
+        self.assertLess(older.edited_at, (snipe_table.window_for(older.id) + 1) * snipe_table.window_seconds)
+
+        self.assertEqual(await self.rows(first), [("a", "b")])
+        self.assertEqual(await self.rows(second), [("b", "c")])
+        self.assertEqual(write_queue.rows_dropped, dropped)
+
+
+class DeltaTest(unittest.TestCase):
+    def test_round_trips(self) -> None:
+        text = "The quick brown fox \N{FOX FACE} jumps over the lazy dog. " * 10
+        edits = [
+            text.replace("lazy", "sleepy", 1),
+            text + " Edited.",
+            "Edit: " + text,
+            text[:100] + text[150:],
+            text[:100] + "\N{SNAKE}" + text[100:],
+        ]
+        for after in edits:
+            before_content, delta = encode_delta(text, after)
+            self.assertIsNone(before_content)
+            assert delta is not None
+            self.assertLess(len(delta), len(text))
+            self.assertEqual(decode_delta(after, delta), text)
+
+    def test_stores_plain_when_not_worthwhile(self) -> None:
+        short = "x" * (DELTA_MIN_LENGTH - 1)
+        self.assertEqual(encode_delta(short, short + "y"), (short, None))
+
+        long = "a" * DELTA_MIN_LENGTH
+        self.assertEqual(encode_delta(long, "b" * DELTA_MIN_LENGTH), (long, None))
+        self.assertEqual(encode_delta(long, None), (long, None))
+        self.assertEqual(encode_delta(None, long), (None, None))
+
+
+class DeltaStorageTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        await snipe_table.load()
+
+    async def test_reads_back_before_content(self) -> None:
+        before = "word " * DELTA_MIN_LENGTH
+        after = before.replace("word", "edited", 1)
+        before_content, before_delta = encode_delta(before, after)
+        snipe = make_edit(int(time.time()), channel_id=300, message_id=3000, before="", after=after)
+        snipe.before_content, snipe.before_delta = before_content, before_delta
+        snipe.save()
+        await write_queue.flush()
+
+        async with acquire(shard_for(GUILD_ID)) as db:
+            row = await db.fetchone(f"SELECT * FROM {snipe_table.table_for(snipe.id)} WHERE id = ?", snipe.id)
+        stored = EditSnipe.from_row(row)
+        self.assertIsNone(row["before_content"])
+        self.assertEqual(stored.before, before)
+        self.assertEqual(stored.to_dict()["before_content"], before)
+
+
+if __name__ == "__main__":
+    unittest.main()
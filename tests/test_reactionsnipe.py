@@ -0,0 +1,144 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Checks for the reaction snipe schema migrations and holding removal storms.
+
+Run from the root of the repo with `python -m unittest discover tests`.
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+import discord
+
+from snipes.optout import optout_cache
+from snipes.reactionsnipe import MIGRATIONS, STORM_WINDOW_MS, ReactionSnipe, ReactionSnipeCog, RemovalKind, snipe_table
+from snipes.snipequeue import write_queue
+from snipes.snipescommon import acquire, migrate, shard_for
+
+GUILD_ID = 1 << 22
+THUMBS_UP = discord.PartialEmoji(name="\N{THUMBS UP SIGN}")
+PARTY = discord.PartialEmoji(name="party", id=1234, animated=True)
+
+
+def removal(message_id: int, user_id: int, emoji: discord.PartialEmoji, *, channel_id: int) -> discord.RawReactionActionEvent:
+    data = {"message_id": message_id, "channel_id": channel_id, "user_id": user_id, "guild_id": GUILD_ID}
+    return discord.RawReactionActionEvent(data, emoji, "REACTION_REMOVE")  # type: ignore
+
+
+def clear(message_id: int, *, channel_id: int) -> discord.RawReactionClearEvent:
+    return discord.RawReactionClearEvent({"message_id": message_id, "channel_id": channel_id, "guild_id": GUILD_ID})  # type: ignore
+
+
+# The window tables known to `snipe_table` are shared by every test, so is the directory.
+_tmp = tempfile.TemporaryDirectory()
+_cwd = os.getcwd()
+
+
+def setUpModule() -> None:
+    os.chdir(_tmp.name)
+
+
+def tearDownModule() -> None:
+    os.chdir(_cwd)
+    _tmp.cleanup()
+
+
+class MigrationTest(unittest.IsolatedAsyncioTestCase):
+    async def test_rebuilds_version_4_rows(self) -> None:
+        # A window table from before emojis were stored by id, with text message ids.
+        table = "reactionmigrate_1"
+        migrations = [migration.format(table=table) for migration in MIGRATIONS]
+        self.assertEqual(await migrate(table, migrations[:4], shard=0), 4)
+        async with acquire(0) as db:
+            await db.executemany(
+                f"INSERT INTO {table} (removed_at, user_id, message_id, guild_id, channel_id, unicode_codepoint, emoji_url) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (100, 1, "10", GUILD_ID, 2, "\N{THUMBS UP SIGN}", None),
+                    (101, 1, "11", GUILD_ID, 2, None, "https://cdn.discordapp.com/emojis/1234.gif"),
+                    (102, 1, "12", GUILD_ID, 2, None, "https://cdn.discordapp.com/emojis/5678.png?v=1"),
+                ],
+            )
+
+        self.assertEqual(await migrate(table, migrations, shard=0), len(MIGRATIONS) - 4)
+        async with acquire(0) as db:
+            rows = await db.fetchall(f"SELECT * FROM {table} ORDER BY id")
+        snipes = [ReactionSnipe.from_row(row) for row in rows]
+
+        self.assertEqual([snipe.message_id for snipe in snipes], [10, 11, 12])
+        self.assertEqual([snipe.emoji for snipe in snipes], [
+            "\N{THUMBS UP SIGN}", "https://cdn.discordapp.com/emojis/1234.gif", "https://cdn.discordapp.com/emojis/5678.png",
+        ])
+        self.assertEqual([snipe.kind for snipe in snipes], [RemovalKind.REMOVE] * 3)
+
+
+class StormTest(unittest.IsolatedAsyncioTestCase):
+    # One test, the shared write queue is started and stopped once per event loop.
+    async def asyncSetUp(self) -> None:
+        self.cog = ReactionSnipeCog(None)  # type: ignore # The bot is only used by the commands
+        await self.cog.cog_load()
+
+        # Opted out for this test only.
+        optout_cache.set(30, True)
+        self.addCleanup(optout_cache.set, 30, False)
+
+    async def storm(self, channel_id: int) -> None:
+        await self.cog.on_raw_reaction_remove(removal(10, 1, THUMBS_UP, channel_id=channel_id))
+        await self.cog.on_raw_reaction_remove(removal(10, 1, THUMBS_UP, channel_id=channel_id))
+        await self.cog.on_raw_reaction_remove(removal(10, 2, PARTY, channel_id=channel_id))
+        await self.cog.on_raw_reaction_remove(removal(10, 30, THUMBS_UP, channel_id=channel_id))
+        await self.cog.on_raw_reaction_clear(clear(10, channel_id=channel_id))
+
+    async def recorded(self, channel_id: int) -> list[tuple[RemovalKind, int | None]]:
+        found = []
+        while (snipe := await ReactionSnipe.get_in_channel(channel_id, guild_id=GUILD_ID, offset=len(found))) is not None:
+            found.append((snipe.kind, snipe.user_id))
+        return found
+
+    async def stored(self, channel_id: int) -> int:
+        await write_queue.flush()
+        async with acquire(shard_for(GUILD_ID)) as db:
+            counts = [(await db.fetchone(f"SELECT COUNT(*) FROM {table} WHERE channel_id = ?", channel_id))[0] for table in snipe_table.tables]
+        return sum(counts)
+
+    async def test_records_storms_once_in_order(self) -> None:
+        # Repeat removals are recorded once, opted out users not at all, newest first.
+        expected = [(RemovalKind.CLEAR, None), (RemovalKind.REMOVE, 2), (RemovalKind.REMOVE, 1)]
+
+        await self.storm(100)
+        self.assertEqual(await self.recorded(100), [])
+        await asyncio.sleep(STORM_WINDOW_MS / 1000 + 0.5)
+        self.assertEqual(await self.recorded(100), expected)
+        self.assertEqual(await self.stored(100), 3)
+
+        # Removals still held when the cog unloads are recorded too.
+        await self.storm(200)
+        await self.cog.cog_unload()
+        self.assertEqual(await self.recorded(200), expected)
+        self.assertEqual(await self.stored(200), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
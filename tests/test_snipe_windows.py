@@ -0,0 +1,133 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Regression checks for the snipe window tables staying writable while the bot runs.
+
+Run from the root of the repo with `python -m unittest discover tests`.
+"""
+
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import discord
+
+from snipes.messagesnipe import INSERT_SQL, MIGRATIONS
+from snipes.snipepurge import PurgeCoordinator
+from snipes.snipequeue import write_queue
+from snipes.snipescommon import BucketedTable, acquire, shard_for
+from snipes.snipestore import SnipeStore
+
+WINDOW_SECONDS = 300
+GUILD_ID = 1 << 22
+
+
+class WindowRotationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+
+    async def asyncTearDown(self) -> None:
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    async def test_inserts_work_after_several_windows(self) -> None:
+        table = BucketedTable("windowtest", MIGRATIONS, time_column="deleted_at", window_seconds=WINDOW_SECONDS)
+        # Run by hand, the background task waits far longer than the test takes.
+        coordinator = PurgeCoordinator(interval=3600)
+        coordinator.register(table, SnipeStore(user_attr="sender_id", time_attr="deleted_at"))
+        self.addAsyncCleanup(coordinator.unregister, table)
+
+        now = time.time()
+        await table.load()
+
+        for step in range(1, 9): # Past (AHEAD + 1) windows a few times over
+            now += WINDOW_SECONDS
+            utcnow = datetime.datetime.fromtimestamp(now, tz=datetime.timezone.utc)
+
+            with mock.patch("time.time", return_value=now), mock.patch("discord.utils.utcnow", return_value=utcnow):
+                await coordinator.run()
+
+                snipe_id = discord.utils.time_snowflake(utcnow)
+                row = (snipe_id, int(now), 1, "content", GUILD_ID, 2, None, None, None)
+                dropped = write_queue.rows_dropped
+                write_queue.put(shard_for(GUILD_ID), INSERT_SQL.format(table=table.table_for(snipe_id)), row)
+                await write_queue.flush()
+
+            self.assertEqual(write_queue.rows_dropped, dropped, f"insert dropped {step} windows in")
+            async with acquire(shard_for(GUILD_ID)) as db:
+                found = await db.fetchone(f"SELECT 1 FROM {table.table_for(snipe_id)} WHERE id = ?", snipe_id)
+            self.assertIsNotNone(found)
+            self.assertIn(table.table_for(snipe_id), table.tables)
+
+
+class MissingWindowTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+
+        self.table = BucketedTable("missingtest", MIGRATIONS, time_column="deleted_at", window_seconds=WINDOW_SECONDS)
+        await self.table.load()
+
+        now = time.time()
+        self.snipe_id = discord.utils.time_snowflake(datetime.datetime.fromtimestamp(now, tz=datetime.timezone.utc))
+        async with acquire(shard_for(GUILD_ID)) as db:
+            await db.execute(INSERT_SQL.format(table=self.table.table_for(self.snipe_id)), self.snipe_id, int(now), 1, "content", GUILD_ID, 2, None, None, None)
+
+    async def asyncTearDown(self) -> None:
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    async def drop_behind(self) -> None:
+        # As if the purge dropped the window while it was still being read.
+        async with acquire(shard_for(GUILD_ID)) as db:
+            await db.execute(f"DROP TABLE {self.table.table_for(self.snipe_id)}")
+
+    async def test_readers_find_dropped_window_empty(self) -> None:
+        rows = [row async for row in self.table.iter_newest("channel_id", 2, shard=shard_for(GUILD_ID))]
+        self.assertEqual([row["id"] for row in rows], [self.snipe_id])
+
+        await self.drop_behind()
+        self.assertIn(self.table.table_for(self.snipe_id), self.table.tables)
+        self.assertEqual([row async for row in self.table.iter_newest("channel_id", 2, shard=shard_for(GUILD_ID))], [])
+        self.assertEqual([row async for row in self.table.iter_matching("sender_id", 1)], [])
+        self.assertEqual(await self.table.delete_where("sender_id = ?", 1), 0)
+
+    async def test_forgotten_window_is_not_read(self) -> None:
+        window = self.table.window_for(self.snipe_id)
+        self.table.forget(window)
+        self.assertNotIn(self.table.table_for(self.snipe_id), self.table.tables)
+        self.assertEqual([row async for row in self.table.iter_matching("sender_id", 1)], [])
+
+        self.table.remember(window)
+        self.assertEqual([row["id"] async for row in self.table.iter_matching("sender_id", 1)], [self.snipe_id])
+
+
+if __name__ == "__main__":
+    unittest.main()
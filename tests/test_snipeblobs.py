@@ -0,0 +1,135 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Checks for storing attachment and embed metadata and erasing it with a user's snipes.
+
+Run from the root of the repo with `python -m unittest discover tests`.
+"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from snipes.messagesnipe import TTL_MINUTES, DeleteSnipe, snipe_store, snipe_table
+from snipes.optout import UserDataRegistry
+from snipes.snipeblobs import BLOB_MIGRATIONS, BlobKind, SnipeBlob, blob_store
+from snipes.snipequeue import write_queue
+from snipes.snipescommon import acquire, migrate, next_snipe_id, shard_for
+
+GUILD_ID = 1 << 22
+SHARD = shard_for(GUILD_ID)
+LINK = SnipeBlob(key="linkkey", kind=BlobKind.EMBED, name="A link", size=None, content_type="link", url="https://example.com")
+
+
+def attachment(attachment_id: int) -> SnipeBlob:
+    return SnipeBlob(key=str(attachment_id), kind=BlobKind.ATTACHMENT, name="file.png", size=1024, content_type="image/png", url="https://example.com/file.png")
+
+
+def save_snipe(sender_id: int, blobs: list[SnipeBlob]) -> DeleteSnipe:
+    snipe_id = next_snipe_id()
+    now = int(time.time())
+    snipe = DeleteSnipe(
+        id=snipe_id, deleted_at=now, sender_id=sender_id, content="content", guild_id=GUILD_ID, channel_id=2,
+        message_reference_id=None, blobs=blob_store.add(SHARD, snipe_id, blobs, now),
+    )
+    snipe.save()
+    return snipe
+
+
+# The window tables known to `snipe_table` are shared by every test, so is the directory.
+_tmp = tempfile.TemporaryDirectory()
+_cwd = os.getcwd()
+
+
+def setUpModule() -> None:
+    os.chdir(_tmp.name)
+
+
+def tearDownModule() -> None:
+    os.chdir(_cwd)
+    _tmp.cleanup()
+
+
+class EraseTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        await snipe_table.load()
+        await blob_store.load(keep_seconds=TTL_MINUTES * 60 * 2)
+        self.user_data = UserDataRegistry()
+        self.user_data.register(DeleteSnipe, snipe_table, snipe_store, blobs_attr="blobs")
+
+    async def stored_keys(self) -> set[str]:
+        await write_queue.flush()
+        async with acquire(SHARD) as db:
+            rows = await db.fetchall("SELECT key FROM snipeblob")
+        return {row["key"] for row in rows}
+
+    async def test_keeps_blobs_others_refer_to(self) -> None:
+        save_snipe(10, [attachment(100), LINK])
+        save_snipe(10, [LINK])
+        other = save_snipe(20, [attachment(200), LINK])
+        self.assertLessEqual({"100", "200", "linkkey"}, await self.stored_keys())
+
+        exported = [json.loads(line) async for line in self.user_data.export(10)]
+        self.assertEqual(sorted(len(data["attachments"]) for data in exported), [1, 2])
+        self.assertIn({**attachment(100).to_dict(), "kind": int(BlobKind.ATTACHMENT)}, exported[0]["attachments"] + exported[1]["attachments"])
+
+        counts = await self.user_data.erase(10)
+        self.assertEqual(counts[snipe_table.name], 2)
+        self.assertEqual(self.user_data.erased_blobs, 1)
+
+        keys = await self.stored_keys()
+        self.assertNotIn("100", keys)
+        self.assertLessEqual({"200", "linkkey"}, keys)
+        self.assertEqual([blob.key for blob in await blob_store.get_many(SHARD, other.blobs)], ["200", "linkkey"])
+
+    async def test_purge_removes_old_references(self) -> None:
+        save_snipe(30, [attachment(300)])
+        await write_queue.flush()
+
+        # Long after any snipe could still refer to them.
+        await blob_store.purge(int(time.time()) + 3 * blob_store.keep_seconds)
+        async with acquire(SHARD) as db:
+            refs = await db.fetchall("SELECT * FROM snipeblob_ref")
+            blobs = await db.fetchall("SELECT * FROM snipeblob")
+        self.assertEqual((refs, blobs), ([], []))
+
+
+class MigrationTest(unittest.IsolatedAsyncioTestCase):
+    async def test_keeps_rows_keyed_by_hash(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                self.assertEqual(await migrate("snipeblob", BLOB_MIGRATIONS[:1], shard=0), 1)
+                async with acquire(0) as db:
+                    await db.execute("INSERT INTO snipeblob (hash, kind, name, size, content_type, url, last_seen) VALUES ('abc', 1, 'A link', NULL, 'link', NULL, 0)")
+
+                self.assertEqual(await migrate("snipeblob", BLOB_MIGRATIONS, shard=0), len(BLOB_MIGRATIONS) - 1)
+                self.assertEqual([blob.key for blob in await blob_store.get_many(0, "abc")], ["abc"])
+            finally:
+                os.chdir(_tmp.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Checks for the write-behind snipe queue.
+
+Run from the root of the repo with `python -m unittest discover tests`.
+"""
+
+import os
+import tempfile
+import unittest
+
+from snipes.snipequeue import SnipeWriteQueue
+from snipes.snipescommon import acquire
+
+SHARD = 0
+INSERT_SQL = "INSERT INTO queued (id, content) VALUES (?, ?)"
+MISSING_SQL = "INSERT INTO missing (id) VALUES (?)"
+
+
+class FlushTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+
+        async with acquire(SHARD) as db:
+            await db.execute("CREATE TABLE queued (id INTEGER PRIMARY KEY, content TEXT NOT NULL)")
+
+        self.queue = SnipeWriteQueue()
+
+    async def asyncTearDown(self) -> None:
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    async def ids(self) -> list[int]:
+        async with acquire(SHARD) as db:
+            rows = await db.fetchall("SELECT id FROM queued ORDER BY id")
+        return [row[0] for row in rows]
+
+    async def test_flushes_in_groups(self) -> None:
+        self.queue.put_many(SHARD, INSERT_SQL, [(1, "a"), (2, "b")])
+        self.queue.put(SHARD, INSERT_SQL, (3, "c"))
+        self.assertEqual(self.queue.depth, 3)
+
+        self.assertEqual(await self.queue.flush(), 3)
+        self.assertEqual(self.queue.depth, 0)
+        self.assertEqual(await self.ids(), [1, 2, 3])
+        self.assertEqual(self.queue.stats()["rows_written"], 3)
+        self.assertEqual(self.queue.stats()["rows_dropped"], 0)
+
+    async def test_bad_row_only_drops_itself(self) -> None:
+        self.queue.put_many(SHARD, INSERT_SQL, [(1, "a"), (2, None), (3, "c")])
+        self.queue.put(SHARD, MISSING_SQL, (4,))
+        self.queue.put_many(SHARD, INSERT_SQL, [(5, "e"), (1, "duplicate")])
+
+        with self.assertLogs("snipes.snipequeue", "ERROR") as logs:
+            self.assertEqual(await self.queue.flush(), 3)
+
+        self.assertEqual(await self.ids(), [1, 3, 5])
+        self.assertEqual(self.queue.stats()["rows_written"], 3)
+        self.assertEqual(self.queue.stats()["rows_dropped"], 3)
+        self.assertEqual(len(logs.records), 3)
+        self.assertIn(MISSING_SQL, logs.output[1])
+
+        async with acquire(SHARD) as db:
+            row = await db.fetchone("SELECT content FROM queued WHERE id = 1")
+        self.assertEqual(row[0], "a")
+
+
+if __name__ == "__main__":
+    unittest.main()
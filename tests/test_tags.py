@@ -0,0 +1,199 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""
+Checks for the tags schema migrations, tag search and the tag cache.
+
+Run from the root of the repo with `python -m unittest discover tests`.
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import asqlite
+
+from utility.tags import DB_FILENAME, ENTRY_OVERHEAD_BYTES, TAGS_MIGRATIONS, TAGS_SETUP_SQL, TagCache, TagEntry, migrate_tags, tag_cache
+
+GUILD_ID = 1
+NAMES = [
+    "hello world", "Yellow submarine", "say hello", "shell_script", "100% done", "a%b", "ab",
+    "HELLO", "hel", "welcome", "the rules", "rules", "Rule of thumb", "x_y", "mellow",
+]
+
+
+def like_search(names: list[str], query: str) -> list[str]:
+    """What `name LIKE '%query%'` finds, in the order search returns it."""
+    found = [name for name in names if query.lower() in name.lower()]
+    return sorted(found, key=lambda name: (name.lower().index(query.lower()), len(name), name))
+
+
+class TagsTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+
+    async def asyncTearDown(self) -> None:
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+
+class MigrationTest(TagsTestCase):
+    async def test_migrates_from_version_0(self) -> None:
+        # A tags.sqlite made before migrations were tracked.
+        with sqlite3.connect(DB_FILENAME) as db:
+            db.execute(TAGS_SETUP_SQL)
+            db.executemany("INSERT INTO tags VALUES (?, ?, ?, ?)", [(name, 10, GUILD_ID, "content") for name in NAMES])
+            db.execute("INSERT INTO tags VALUES ('hello elsewhere', 10, 2, 'content')")
+        db.close()
+
+        async with asqlite.connect(DB_FILENAME) as db:
+            self.assertEqual(await migrate_tags(db), len(TAGS_MIGRATIONS))
+            self.assertEqual((await db.fetchone("PRAGMA user_version"))[0], len(TAGS_MIGRATIONS))
+            self.assertEqual(await migrate_tags(db), 0)
+
+            rows = await db.fetchall("SELECT name FROM tags WHERE guild_id = ?", GUILD_ID)
+            self.assertCountEqual([row["name"] for row in rows], NAMES)
+            integrity = await db.fetchall("INSERT INTO tags_fts (tags_fts, rank) VALUES ('integrity-check', 1)")
+            self.assertEqual(integrity, [])
+
+        # Existing tags are found through the backfilled index.
+        self.assertEqual(await TagEntry.search("hello", guild_id=GUILD_ID), like_search(NAMES, "hello"))
+        self.assertEqual(await TagEntry.search("hello", guild_id=2), ["hello elsewhere"])
+
+
+class SearchTest(TagsTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        async with asqlite.connect(DB_FILENAME) as db:
+            await migrate_tags(db)
+        for name in NAMES:
+            await TagEntry.create(name=name, owner_id=10, guild_id=GUILD_ID, content="content")
+        await TagEntry.create(name="hello there", owner_id=10, guild_id=2, content="content")
+
+    async def test_matches_like(self) -> None:
+        # Queries of 3 or more characters use the index, shorter ones LIKE.
+        for query in ["hello", "HELLO", "ell", "ule", "rules", "o w", "100%", "l_s", "zzz", "b", "%", "_", "ab", "he"]:
+            with self.subTest(query=query):
+                self.assertEqual(await TagEntry.search(query, guild_id=GUILD_ID), like_search(NAMES, query))
+
+    async def test_quotes_are_literal(self) -> None:
+        await TagEntry.create(name='say "hi" now', owner_id=10, guild_id=GUILD_ID, content="content")
+        self.assertEqual(await TagEntry.search('"hi"', guild_id=GUILD_ID), ['say "hi" now'])
+        self.assertEqual(await TagEntry.search('hi" OR "hel', guild_id=GUILD_ID), [])
+
+    async def test_index_follows_writes(self) -> None:
+        tag = await TagEntry.get_or_none(name="welcome", guild_id=GUILD_ID)
+        assert tag is not None
+        await tag.update(new_content="new content")
+        self.assertEqual(await TagEntry.search("welc", guild_id=GUILD_ID), ["welcome"])
+
+        await tag.delete()
+        self.assertEqual(await TagEntry.search("welc", guild_id=GUILD_ID), [])
+
+        await TagEntry.create(name="farewell", owner_id=10, guild_id=GUILD_ID, content="content")
+        self.assertEqual(await TagEntry.search("rewe", guild_id=GUILD_ID), ["farewell"])
+
+
+def make_tag(name: str, *, guild_id: int = GUILD_ID, content: str = "content") -> TagEntry:
+    return TagEntry(name=name, owner_id=10, guild_id=guild_id, content=content, id=0)
+
+
+class TagCacheTest(unittest.TestCase):
+    def test_remembers_tags_and_missing_names(self) -> None:
+        cache = TagCache()
+        self.assertEqual(cache.get(GUILD_ID, "rules"), (False, None))
+
+        cache.put(GUILD_ID, "rules", make_tag("rules"), generation=cache.generation)
+        cache.put(GUILD_ID, "missing", None, generation=cache.generation)
+        self.assertEqual(cache.get(GUILD_ID, "rules"), (True, make_tag("rules")))
+        self.assertEqual(cache.get(GUILD_ID, "missing"), (True, None))
+        self.assertEqual(cache.get(2, "rules"), (False, None))
+        self.assertEqual({key: cache.stats()[key] for key in ("hits", "negative_hits", "misses")}, {"hits": 1, "negative_hits": 1, "misses": 2})
+
+    def test_missing_names_expire(self) -> None:
+        cache = TagCache(not_found_ttl=0)
+        cache.put(GUILD_ID, "missing", None, generation=cache.generation)
+        self.assertEqual(cache.get(GUILD_ID, "missing"), (False, None))
+
+    def test_skips_lookups_older_than_a_write(self) -> None:
+        cache = TagCache()
+        generation = cache.generation
+        cache.write(GUILD_ID, "rules", make_tag("rules", content="new"))
+        cache.put(GUILD_ID, "rules", make_tag("rules", content="old"), generation=generation)
+        self.assertEqual(cache.get(GUILD_ID, "rules"), (True, make_tag("rules", content="new")))
+
+    def test_evicts_within_budgets(self) -> None:
+        size = len("tag0") + len("content") + ENTRY_OVERHEAD_BYTES
+        cache = TagCache(max_bytes=4 * size, guild_max_bytes=3 * size)
+
+        for i in range(4):
+            cache.put(GUILD_ID, f"tag{i}", make_tag(f"tag{i}"), generation=cache.generation)
+        # The guild's least recently used tag goes first.
+        self.assertEqual(cache.get(GUILD_ID, "tag0"), (False, None))
+        self.assertEqual(cache.stats()["bytes"], 3 * size)
+
+        cache.get(GUILD_ID, "tag1")
+        cache.put(2, "tag0", make_tag("tag0", guild_id=2), generation=cache.generation)
+        cache.put(2, "tag1", make_tag("tag1", guild_id=2), generation=cache.generation)
+        # Over the whole budget, the least recently used guild loses its oldest tag.
+        self.assertEqual(cache.get(GUILD_ID, "tag2"), (False, None))
+        self.assertEqual(cache.get(GUILD_ID, "tag1")[0], True)
+        self.assertEqual(len(cache), 4)
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_skips_tags_over_guild_budget(self) -> None:
+        cache = TagCache(guild_max_bytes=ENTRY_OVERHEAD_BYTES + 100)
+        cache.put(GUILD_ID, "big", make_tag("big", content="x" * 100), generation=cache.generation)
+        self.assertEqual((len(cache), cache.stats()["bytes"]), (0, 0))
+
+
+class WriteThroughTest(TagsTestCase):
+    # A guild of its own, `tag_cache` is shared by every test.
+    guild_id = 3
+
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        async with asqlite.connect(DB_FILENAME) as db:
+            await migrate_tags(db)
+
+    async def test_writes_update_cache(self) -> None:
+        self.assertIsNone(await TagEntry.get_or_none(name="faq", guild_id=self.guild_id))
+        self.assertEqual(tag_cache.get(self.guild_id, "faq"), (True, None))
+
+        created = await TagEntry.create(name="faq", owner_id=10, guild_id=self.guild_id, content="first")
+        assert created is not None
+        self.assertEqual(await TagEntry.get_or_none(name="faq", guild_id=self.guild_id), created)
+
+        updated = await created.update(new_content="second")
+        self.assertEqual(tag_cache.get(self.guild_id, "faq"), (True, updated))
+        self.assertEqual(updated.content, "second")
+
+        self.assertEqual(await updated.delete(), 1)
+        self.assertEqual(tag_cache.get(self.guild_id, "faq"), (True, None))
+        self.assertIsNone(await TagEntry.get_or_none(name="faq", guild_id=self.guild_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,22 +22,41 @@ SOFTWARE.
 from __future__ import annotations
 
 """
+Tags are held in memory by `tag_cache` once looked up, including names that don't exist,
+and the cache is updated by every write made through `TagEntry`.
+
+Tag names are indexed by an FTS5 trigram index, `tags_fts`, kept in sync with triggers,
+so searching for part of a name doesn't scan the guild's tags. Contents are not indexed,
+large ones are stored compressed and can't be read by the triggers.
+
 This module uses the following third party libs installed via pip: asqlite (https://github.com/Rapptz/asqlite)
 """
 
 import logging
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
 
 import asqlite
 import discord
 from discord.ext import commands
 
+from utils.codec import decode_row, encode_text
 from utils.paginator import EmbedPaginatorView
 
 ALLOWED_MENTIONS = discord.AllowedMentions.none()
 
 DB_FILENAME = "tags.sqlite"
 
+# Most memory held by the tag cache, counting the UTF-8 length of names and contents and ENTRY_OVERHEAD_BYTES per tag.
+TAG_CACHE_BYTES = 16 * 1024 * 1024
+# Most of TAG_CACHE_BYTES one guild may use, so a guild with huge tags doesn't push out every other guild.
+TAG_CACHE_GUILD_BYTES = 2 * 1024 * 1024
+# Rough size of a cached tag besides its name and content.
+ENTRY_OVERHEAD_BYTES = 200
+# How long a tag name that doesn't exist is remembered as missing.
+NOT_FOUND_TTL_SECONDS = 5 * 60
+
 TAGS_SETUP_SQL = """
 CREATE TABLE IF NOT EXISTS tags (
     name TEXT NOT NULL,
@@ -48,23 +67,131 @@ CREATE TABLE IF NOT EXISTS tags (
 )
 """
 
+# Applied in order by `migrate_tags`, the version is kept in `PRAGMA user_version`.
+# Never edit or reorder these, only append.
+TAGS_MIGRATIONS = [
+    TAGS_SETUP_SQL,
+    # An INTEGER PRIMARY KEY, so the search index can refer to rows by an id VACUUM won't change.
+    # Then a trigram index over names, backfilled from the existing tags.
+    """
+    CREATE TABLE tags_rebuild (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        owner_id BIGINT NOT NULL,
+        guild_id BIGINT NOT NULL,
+        content TEXT NOT NULL,
+        UNIQUE (guild_id, name)
+    );
+    INSERT INTO tags_rebuild (id, name, owner_id, guild_id, content) SELECT rowid, name, owner_id, guild_id, content FROM tags;
+    DROP TABLE tags;
+    ALTER TABLE tags_rebuild RENAME TO tags;
+
+    CREATE VIRTUAL TABLE tags_fts USING fts5(name, guild_id UNINDEXED, content='tags', content_rowid='id', tokenize='trigram');
+    INSERT INTO tags_fts (tags_fts) VALUES ('rebuild');
+
+    CREATE TRIGGER tags_fts_insert AFTER INSERT ON tags BEGIN
+        INSERT INTO tags_fts (rowid, name, guild_id) VALUES (new.id, new.name, new.guild_id);
+    END;
+    CREATE TRIGGER tags_fts_delete AFTER DELETE ON tags BEGIN
+        INSERT INTO tags_fts (tags_fts, rowid, name, guild_id) VALUES ('delete', old.id, old.name, old.guild_id);
+    END;
+    CREATE TRIGGER tags_fts_update AFTER UPDATE OF name, guild_id ON tags BEGIN
+        INSERT INTO tags_fts (tags_fts, rowid, name, guild_id) VALUES ('delete', old.id, old.name, old.guild_id);
+        INSERT INTO tags_fts (rowid, name, guild_id) VALUES (new.id, new.name, new.guild_id);
+    END
+    """,
+]
+
+# The trigram index can only match queries at least this long, shorter ones are matched with LIKE.
+TRIGRAM_MIN_LENGTH = 3
+
 _logger = logging.getLogger(__name__)
 
+
+async def migrate_tags(db: asqlite.Connection) -> int:
+    """Brings the schema of tags.sqlite up to date.
+
+    Migrations newer than `PRAGMA user_version` are run in order, each in its own
+    transaction along with the version bump.
+
+    Parameters
+    ----------
+    db : asqlite.Connection
+        A connection to tags.sqlite.
+
+    Returns
+    -------
+    int
+        The number of migrations run.
+    """
+    current = (await db.fetchone("PRAGMA user_version"))[0]
+
+    for version, migration in enumerate(TAGS_MIGRATIONS[current:], current + 1):
+        try:
+            await db.executescript(f"BEGIN;\n{migration};\nPRAGMA user_version = {version};\nCOMMIT;")
+        except Exception:
+            await db.rollback()
+            raise
+
+        _logger.log(logging.INFO if current else logging.DEBUG, "Migrated tags to schema version %d.", version)
+
+    return max(len(TAGS_MIGRATIONS) - current, 0)
+
+
 @dataclass(slots=True)
 class TagEntry:
     name: str
     owner_id: int
     guild_id: int
     content: str
+    id: int
+
+    @staticmethod
+    async def search(query: str, /, *, guild_id: int) -> list[str]:
+        """Finds the names of tags in a guild containing a query, ignoring case.
+
+        Parameters
+        ----------
+        query : str
+            The text to look for.
+        guild_id : int
+            The guild to search in.
+
+        Returns
+        -------
+        list[str]
+            The names found, best match first.
+        """
+        async with asqlite.connect(DB_FILENAME) as db:
+            # Both ways give the same order: names the query appears earlier in first, then shorter names.
+            if len(query) >= TRIGRAM_MIN_LENGTH:
+                rows = await db.fetchall(
+                    "SELECT name FROM tags_fts WHERE tags_fts MATCH ? AND guild_id = ? ORDER BY instr(lower(name), lower(?)), length(name), name",
+                    'name : "' + query.replace('"', '""') + '"', guild_id, query,
+                )
+            else:
+                rows = await db.fetchall(
+                    "SELECT name FROM tags WHERE guild_id = ? AND name LIKE ? ESCAPE '\\' ORDER BY instr(lower(name), lower(?)), length(name), name",
+                    guild_id, "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%", query,
+                )
+
+            return [row["name"] for row in rows]
 
     @classmethod
     async def get_or_none(cls, *, name: str, guild_id: int) -> TagEntry | None:
+        cached, tag = tag_cache.get(guild_id, name)
+        if cached:
+            return tag
+
+        generation = tag_cache.generation
         async with asqlite.connect(DB_FILENAME) as db:
             async with db.cursor() as cur:
                 await cur.execute("SELECT * FROM tags WHERE name = ? AND guild_id = ?", name, guild_id)
                 res = await cur.fetchone()
 
-                return cls(**res) if res is not None else None
+                tag = cls(**decode_row(res, "content")) if res is not None else None
+                tag_cache.put(guild_id, name, tag, generation=generation)
+                return tag
 
     @classmethod
     async def create(cls, *, name: str, owner_id: int, guild_id: int, content: str) -> TagEntry | None:
@@ -72,12 +199,17 @@ class TagEntry:
             async with db.cursor() as cur:
                 # TODO upsert?
                 await cur.execute("""INSERT INTO tags (name, owner_id, guild_id, content) VALUES (?, ?, ?, ?)
-                ON CONFLICT(name, guild_id) DO NOTHING RETURNING *""", name, owner_id, guild_id, content)
+                ON CONFLICT(name, guild_id) DO NOTHING RETURNING *""", name, owner_id, guild_id, encode_text(content))
 
                 res = await cur.fetchone()
                 await db.commit()
 
-                return cls(**res) if res is not None else None
+                if res is None:
+                    return None
+
+                tag = cls(**decode_row(res, "content"))
+                tag_cache.write(tag.guild_id, tag.name, tag)
+                return tag
 
     async def delete(self) -> int:
         async with asqlite.connect(DB_FILENAME) as db:
@@ -85,17 +217,174 @@ class TagEntry:
                 await cur.execute("DELETE FROM tags WHERE name = ? AND guild_id = ?", self.name, self.guild_id)
                 await db.commit()
 
+                tag_cache.write(self.guild_id, self.name, None)
                 return cur.get_cursor().rowcount
 
     async def update(self, *, new_content: str) -> TagEntry:
         async with asqlite.connect(DB_FILENAME) as db:
             async with db.cursor() as cur:
-                await cur.execute("UPDATE tags SET content = ? WHERE name = ? AND guild_id = ? RETURNING *", new_content, self.name, self.guild_id)
+                await cur.execute("UPDATE tags SET content = ? WHERE name = ? AND guild_id = ? RETURNING *", encode_text(new_content), self.name, self.guild_id)
                 await db.commit()
 
                 res = await cur.fetchone()
 
-                return TagEntry(**res)
+                tag = TagEntry(**decode_row(res, "content"))
+                tag_cache.write(tag.guild_id, tag.name, tag)
+                return tag
+
+
+class TagCache:
+    """Per-guild LRU cache of tags by name, bounded by memory, that also remembers missing names.
+
+    Each guild's tags are kept in their own LRU order, and the guilds in another. When the
+    cache is over budget, tags are dropped from the guild used least recently first.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        The memory budget of the whole cache, by default TAG_CACHE_BYTES
+    guild_max_bytes : int, optional
+        The memory budget of each guild, by default TAG_CACHE_GUILD_BYTES
+    not_found_ttl : float, optional
+        The seconds a missing name is held, by default NOT_FOUND_TTL_SECONDS
+    """
+    def __init__(self, *, max_bytes: int = TAG_CACHE_BYTES, guild_max_bytes: int = TAG_CACHE_GUILD_BYTES, not_found_ttl: float = NOT_FOUND_TTL_SECONDS) -> None:
+        self.max_bytes = max_bytes
+        self.guild_max_bytes = guild_max_bytes
+        self.not_found_ttl = not_found_ttl
+
+        # Guild id to tag name to the time a missing entry expires (None for tags), the tag or None if missing, and its size.
+        self._guilds: OrderedDict[int, OrderedDict[str, tuple[float | None, TagEntry | None, int]]] = OrderedDict()
+        self._guild_bytes: dict[int, int] = {}
+        self._bytes = 0
+        # Bumped by every write, see `put`
+        self.generation = 0
+
+        # Counters
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return sum(len(tags) for tags in self._guilds.values())
+
+    def stats(self) -> dict[str, int]:
+        """Returns the cache size and lookup counters."""
+        return {
+            "size": len(self),
+            "guilds": len(self._guilds),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def get(self, guild_id: int, name: str, /) -> tuple[bool, TagEntry | None]:
+        """Looks up a tag.
+
+        Parameters
+        ----------
+        guild_id : int
+            The guild of the tag.
+        name : str
+            The name of the tag.
+
+        Returns
+        -------
+        tuple[bool, TagEntry | None]
+            Whether the name is cached, and the tag or None if it is cached as missing.
+        """
+        tags = self._guilds.get(guild_id)
+        entry = tags.get(name) if tags is not None else None
+        if entry is None or (entry[0] is not None and entry[0] <= time.monotonic()):
+            self.misses += 1
+            return False, None
+
+        self._guilds.move_to_end(guild_id)
+        tags.move_to_end(name)  # type: ignore # tags is set when entry is
+        if entry[1] is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return True, entry[1]
+
+    def put(self, guild_id: int, name: str, tag: TagEntry | None, /, *, generation: int) -> None:
+        """Caches the result of a lookup, unless a write happened since it started.
+
+        Parameters
+        ----------
+        guild_id : int
+            The guild of the tag.
+        name : str
+            The name looked up.
+        tag : TagEntry | None
+            The tag found, None if it doesn't exist.
+        generation : int
+            The `generation` read before the lookup.
+        """
+        if generation == self.generation:
+            self._set(guild_id, name, tag)
+
+    def write(self, guild_id: int, name: str, tag: TagEntry | None, /) -> None:
+        """Updates the cache after a tag is created, updated or deleted.
+
+        Parameters
+        ----------
+        guild_id : int
+            The guild of the tag.
+        name : str
+            The name of the tag.
+        tag : TagEntry | None
+            The tag as written, None if it was deleted.
+        """
+        self.generation += 1
+        self._set(guild_id, name, tag)
+
+    def _set(self, guild_id: int, name: str, tag: TagEntry | None, /) -> None:
+        self._remove(guild_id, name)
+
+        size = len(name.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+        if tag is not None:
+            size += len(tag.content.encode("utf-8"))
+        if size > self.guild_max_bytes:
+            return # Never fits, caching it would only push everything else out
+
+        tags = self._guilds.get(guild_id)
+        if tags is None:
+            tags = self._guilds[guild_id] = OrderedDict()
+        self._guilds.move_to_end(guild_id)
+
+        expires = time.monotonic() + self.not_found_ttl if tag is None else None
+        tags[name] = (expires, tag, size)
+        self._guild_bytes[guild_id] = self._guild_bytes.get(guild_id, 0) + size
+        self._bytes += size
+
+        while self._guild_bytes[guild_id] > self.guild_max_bytes:
+            self._evict(guild_id)
+        while self._bytes > self.max_bytes:
+            self._evict(next(iter(self._guilds)))
+
+    def _remove(self, guild_id: int, name: str, /) -> None:
+        tags = self._guilds.get(guild_id)
+        entry = tags.pop(name, None) if tags is not None else None
+        if entry is None:
+            return
+
+        self._guild_bytes[guild_id] -= entry[2]
+        self._bytes -= entry[2]
+        if not tags:
+            del self._guilds[guild_id]
+            del self._guild_bytes[guild_id]
+
+    def _evict(self, guild_id: int, /) -> None:
+        name = next(iter(self._guilds[guild_id]))
+        self._remove(guild_id, name)
+        self.evictions += 1
+
+
+tag_cache = TagCache()
 
 
 class TagsCog(commands.Cog):
@@ -104,7 +393,7 @@ class TagsCog(commands.Cog):
 
     async def cog_load(self) -> None:
         async with asqlite.connect(DB_FILENAME) as db:
-            await db.execute(TAGS_SETUP_SQL)
+            await migrate_tags(db)
 
     @commands.group(invoke_without_command=True)
     @commands.guild_only()
@@ -209,36 +498,31 @@ class TagsCog(commands.Cog):
         """
         assert ctx.guild
 
-        async with asqlite.connect(DB_FILENAME) as db:
-            async with db.cursor() as cur:
-                await cur.execute("SELECT name FROM tags WHERE name LIKE ? and guild_id = ?", f"%{query}%", ctx.guild.id)
+        results = list(enumerate(await TagEntry.search(query, guild_id=ctx.guild.id), 1))
+        embeds = []
 
-                results = await cur.fetchall()
-                results = list(enumerate(results, 1))
-                embeds = []
+        for result in discord.utils.as_chunks(results, 20):
+            out = "\n".join(f"{res[0]}.) {res[1]}" for res in result)
+            embed = discord.Embed(color=discord.Color.blue(), description=out, title=query)
+            embeds.append(embed)
 
-                for result in discord.utils.as_chunks(results, 20):
-                    out = "\n".join(f"{res[0]}.) {res[1]['name']}" for res in result)
-                    embed = discord.Embed(color=discord.Color.blue(), description=out, title=query)
-                    embeds.append(embed)
-
-                if len(embeds) > 1:
-                    paginator = EmbedPaginatorView(ctx.author, embeds)
-                    paginator.message = await ctx.send(embed=paginator.initial, view=paginator)
-                elif len(embeds) == 1:
-                    await ctx.send(embed=embeds[0])
-                else:
-                    await ctx.send(f"No tags matching search: `{discord.utils.escape_mentions(query)}`")
-
-                # IMPLEMENTATION WITHOUT PAGINATION:
-                # if results:
-                #     out = "\n".join(res['name'] for res in results[:20])
-                #     if (num_results := len(results)) > 20:
-                #         out += f"\n{num_results-20:,} other results."
-                #     embed = discord.Embed(color=discord.Color.blue(), description=out, title=query)
-                #     await ctx.send(embed=embed)
-                # else:
-                #     await ctx.send(f"No results found for `{query}`")
+        if len(embeds) > 1:
+            paginator = EmbedPaginatorView(ctx.author, embeds)
+            paginator.message = await ctx.send(embed=paginator.initial, view=paginator)
+        elif len(embeds) == 1:
+            await ctx.send(embed=embeds[0])
+        else:
+            await ctx.send(f"No tags matching search: `{discord.utils.escape_mentions(query)}`")
+
+        # IMPLEMENTATION WITHOUT PAGINATION:
+        # if results:
+        #     out = "\n".join(name for _, name in results[:20])
+        #     if (num_results := len(results)) > 20:
+        #         out += f"\n{num_results-20:,} other results."
+        #     embed = discord.Embed(color=discord.Color.blue(), description=out, title=query)
+        #     await ctx.send(embed=embed)
+        # else:
+        #     await ctx.send(f"No results found for `{query}`")
 
     @tag.command()
     async def list(self, ctx: commands.Context, *, member: discord.Member | None = None) -> None:
@@ -285,6 +569,23 @@ class TagsCog(commands.Cog):
                 # else:
                 #     await ctx.send(f"No results found for `{member}`")
 
+    @tag.command()
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context) -> None:
+        """Shows how well the tag cache is doing."""
+        stats = tag_cache.stats()
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        hit_rate = (stats["hits"] + stats["negative_hits"]) / lookups if lookups else 0.0
+
+        embed = discord.Embed(color=discord.Color.blue(), title="Tag Cache")
+        embed.add_field(name="Hit Rate", value=f"{hit_rate:.1%} of {lookups:,} lookups")
+        embed.add_field(name="Hits", value=f"{stats['hits']:,} found, {stats['negative_hits']:,} missing")
+        embed.add_field(name="Misses", value=f"{stats['misses']:,}")
+        embed.add_field(name="Size", value=f"{stats['size']:,} names in {stats['guilds']:,} guilds")
+        embed.add_field(name="Memory", value=f"{stats['bytes'] / 1024:,.1f}KiB of {tag_cache.max_bytes / 1024:,.0f}KiB")
+        embed.add_field(name="Evictions", value=f"{stats['evictions']:,}")
+        await ctx.send(embed=embed)
+
     @tag.command()
     async def raw(self, ctx: commands.Context, *, name: str) -> None:
         assert ctx.guild
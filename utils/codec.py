@@ -0,0 +1,150 @@
+"""
+Copyright 2022-present fretgfr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from __future__ import annotations
+
+"""
+Transparent compression for large text columns.
+
+Values at least COMPRESS_MIN_BYTES long are stored as a BLOB holding a marker byte followed
+by zlib compressed UTF-8. Anything else, including every row written before this was used,
+is stored and read back as plain TEXT.
+"""
+
+import sqlite3
+import zlib
+from typing import Any
+
+__all__ = ["COMPRESS_MIN_BYTES", "register_dictionary", "encode_text", "decode_text", "decode_row"]
+
+# Values shorter than this, in UTF-8 bytes, are stored as plain text.
+COMPRESS_MIN_BYTES = 256
+# zlib compression level, 1 (fastest) to 9 (smallest).
+COMPRESS_LEVEL = 6
+
+# First byte of a compressed value. Followed by the zlib stream.
+MARKER_ZLIB = 0x01
+# First byte of a value compressed with a preset dictionary. Followed by the dictionary id, then the zlib stream.
+MARKER_ZLIB_DICT = 0x02
+
+_dictionaries: dict[int, bytes] = {}
+
+
+def register_dictionary(dictionary_id: int, data: bytes, /) -> None:
+    """Registers a preset dictionary for `encode_text` and `decode_text`.
+
+    A dictionary holds text common to the values it is used for, so even short values
+    compress well. Values are decoded with the dictionary registered under the id they
+    were encoded with, so a dictionary must never change once used. Add a new id instead.
+
+    Parameters
+    ----------
+    dictionary_id : int
+        The id of the dictionary, 0-255.
+    data : bytes
+        The dictionary. zlib only uses the last 32KiB, the most common text should be last.
+    """
+    if not 0 <= dictionary_id <= 255:
+        raise ValueError("dictionary_id must be between 0 and 255")
+
+    existing = _dictionaries.get(dictionary_id)
+    if existing is not None and existing != data:
+        raise ValueError(f"A different dictionary is already registered with id {dictionary_id}")
+
+    _dictionaries[dictionary_id] = data
+
+
+def encode_text(value: str | None, /, *, dictionary_id: int | None = None) -> str | bytes | None:
+    """Encodes a value for storage, compressing it if it is large enough and compression helps.
+
+    Parameters
+    ----------
+    value : str | None
+        The value to encode.
+    dictionary_id : int | None, optional
+        The id of a dictionary registered with `register_dictionary` to compress with, by default None
+
+    Returns
+    -------
+    str | bytes | None
+        The compressed value, or the value unchanged.
+    """
+    if value is None:
+        return None
+
+    raw = value.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return value
+
+    if dictionary_id is None:
+        encoded = bytes((MARKER_ZLIB,)) + zlib.compress(raw, COMPRESS_LEVEL)
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zdict=_dictionaries[dictionary_id])
+        encoded = bytes((MARKER_ZLIB_DICT, dictionary_id)) + compressor.compress(raw) + compressor.flush()
+
+    return encoded if len(encoded) < len(raw) else value
+
+
+def decode_text(value: str | bytes | None, /) -> str | None:
+    """Decodes a value stored by `encode_text`.
+
+    Parameters
+    ----------
+    value : str | bytes | None
+        The stored value.
+
+    Returns
+    -------
+    str | None
+        The original value.
+    """
+    if value is None or isinstance(value, str):
+        return value
+
+    marker = value[0]
+    if marker == MARKER_ZLIB:
+        return zlib.decompress(value[1:]).decode("utf-8")
+    if marker == MARKER_ZLIB_DICT:
+        decompressor = zlib.decompressobj(zdict=_dictionaries[value[1]])
+        return (decompressor.decompress(value[2:]) + decompressor.flush()).decode("utf-8")
+
+    raise ValueError(f"Unknown compression marker {marker:#04x}")
+
+
+def decode_row(row: sqlite3.Row, /, *columns: str) -> dict[str, Any]:
+    """Copies a database row into a dict, decoding the given columns with `decode_text`.
+
+    Parameters
+    ----------
+    row : sqlite3.Row
+        The row.
+    *columns : str
+        The names of the columns to decode.
+
+    Returns
+    -------
+    dict[str, Any]
+        The row, ready to be passed to a model as keyword arguments.
+    """
+    decoded = {key: row[key] for key in row.keys()}
+    for column in columns:
+        decoded[column] = decode_text(decoded[column])
+    return decoded
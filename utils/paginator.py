@@ -19,6 +19,7 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+import asyncio
 import logging
 import traceback
 import typing
@@ -167,3 +168,83 @@ class EmbedPaginatorView(discord.ui.View):
     @property
     def initial(self) -> discord.Embed:
         return self.embeds[0]
+
+
+class LazyEmbedPaginatorView(EmbedPaginatorView):
+    """An EmbedPaginatorView that renders pages from an async iterator as they are reached.
+
+    One page beyond the current one is always rendered, so the forward button is only
+    enabled when there is somewhere to go. Until the last page has been rendered, the
+    page count is shown with a trailing "+". Moving to the furthest page rendered answers
+    the interaction first, the next page is rendered after and the buttons are updated
+    once it is.
+
+    Use `start` to create one.
+    """
+    def __init__(self, owner: discord.Member | discord.User, embeds: list[discord.Embed], pages: typing.AsyncIterator[discord.Embed]) -> None:
+        self.pages = pages
+        self.exhausted = False
+        self._render_task: asyncio.Task | None = None
+        super().__init__(owner, embeds)
+
+    @classmethod
+    async def start(cls, owner: discord.Member | discord.User, pages: typing.AsyncIterator[discord.Embed]) -> "LazyEmbedPaginatorView | None":
+        """Renders the first pages and creates the view.
+
+        Parameters
+        ----------
+        owner : discord.Member | discord.User
+            The user allowed to use the view.
+        pages : typing.AsyncIterator[discord.Embed]
+            The pages, in order.
+
+        Returns
+        -------
+        LazyEmbedPaginatorView | None
+            The view, or None if there are no pages.
+        """
+        first = await anext(pages, None)
+        if first is None:
+            return None
+
+        view = cls(owner, [first], pages)
+        await view._render_ahead()
+        view._update_buttons()
+        return view
+
+    async def _render_ahead(self) -> None:
+        while not self.exhausted and self.current_index >= self.max_index:
+            page = await anext(self.pages, None)
+            if page is None:
+                self.exhausted = True
+            else:
+                self.embeds.append(page)
+                self.max_index += 1
+
+    def _update_buttons(self) -> None:
+        super()._update_buttons()
+        if not self.exhausted:
+            self.count_btn.label = f"{self.current_index + 1}/{self.max_index + 1}+"
+
+    async def _render_in_background(self, interaction: discord.Interaction) -> None:
+        # Moves made while rendering or updating the buttons may need another page.
+        while not self.exhausted and self.current_index >= self.max_index and not self.is_finished():
+            try:
+                await self._render_ahead()
+            except Exception:
+                _logger.exception("Failed to render the next page of a paginator.")
+                self.exhausted = True
+
+            if self.is_finished():
+                return
+            self._update_buttons()
+            try:
+                await interaction.edit_original_response(view=self)
+            except discord.HTTPException:
+                pass
+
+    async def update(self, interaction: discord.Interaction) -> None:
+        # Rendering can take longer than Discord waits for a response, so the page already rendered is shown first.
+        await super().update(interaction)
+        if self._render_task is None or self._render_task.done():
+            self._render_task = asyncio.create_task(self._render_in_background(interaction))